@@ -1,69 +1,129 @@
 # app.py
 import asyncio
 import logging
+import sys
 
-from aiogram import Bot, Dispatcher
-from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ParseMode
-
-from config import load_config
-from db.session import make_engine, make_sessionmaker, init_db
-from db.repo import Repo
-
-from handlers import start, menu, solve
-from handlers import admin as admin_handlers
-from handlers import admin_manage as admin_manage_handlers
-
-from utils.permissions import IsDbAdmin, IsSuperAdmin
+from utils.startup import StartupProfiler
 
+# Тяжёлые зависимости (aiogram, SQLAlchemy, хэндлеры) импортируются в main():
+# так их время видно в --profile-startup, а импорт app.py ничего не стоит.
+profiler = StartupProfiler(enabled="--profile-startup" in sys.argv)
 
 logging.basicConfig(level=logging.INFO)
 
 
 async def main() -> None:
-    config = load_config()
-
-    bot = Bot(
-        token=config.bot_token,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
-    )
-
-    engine = make_engine(config.db_url)
-    await init_db(engine)
-
-    sm = make_sessionmaker(engine)
+    prof = profiler
+    config_mod = prof.import_module("config")
+    prof.import_module("aiogram")
+    prof.import_module("sqlalchemy.ext.asyncio")
+    session_mod = prof.import_module("db.session")
+    repo_mod = prof.import_module("db.repo")
+    start = prof.import_module("handlers.start")
+    menu = prof.import_module("handlers.menu")
+    solve = prof.import_module("handlers.solve")
+    live = prof.import_module("handlers.live")
+    admin_handlers = prof.import_module("handlers.admin")
+    admin_manage_handlers = prof.import_module("handlers.admin_manage")
+    outbound_mod = prof.import_module("services.outbound")
+    outbox_mod = prof.import_module("services.outbox")
+    graphs_mod = prof.import_module("services.stats_graphs")
+    permissions = prof.import_module("utils.permissions")
+    db_session_mod = prof.import_module("utils.db_session")
+    antiflood_mod = prof.import_module("utils.antiflood")
+
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.enums import ParseMode
+
+    chart_renderer = graphs_mod.chart_renderer
+
+    with prof.step("load config"):
+        config = config_mod.load_config()
+
+    with prof.step("create bot"):
+        bot = Bot(
+            token=config.bot_token,
+            default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+        )
+        # Все исходящие запросы (ответы, фото, рассылки) идут через общий лимитер
+        outbound = outbound_mod.OutboundLimiter()
+        bot.session.middleware(outbound)
+
+    chart_renderer.configure(config.chart_engine)
+
+    with prof.step("create engine"):
+        engine = session_mod.make_engine(config.db_url)
+    with prof.step("init_db"):
+        await session_mod.init_db(engine)
+
+    sm = session_mod.make_sessionmaker(engine)
+    # Необязательный read-only движок для статистики (DB_READ_URL)
+    read_engine = session_mod.make_read_engine(config.db_read_url) if config.db_read_url else None
+    read_sm = session_mod.make_sessionmaker(read_engine) if read_engine is not None else None
 
     # (Опционально, но рекомендую) — засеять супер-админов в таблицу admins,
     # чтобы они тоже проходили IsDbAdmin-фильтр и могли добавлять задания.
-    async with sm() as s:
-        repo = Repo(s)
-        for sid in config.admin_ids:  # тут лежат SUPERADMIN_IDS (если ты так настроил config)
-            await repo.add_admin(sid, added_by_tg_id=None)
-
-    dp = Dispatcher()
-
-    # DI: это позволит принимать sessionmaker в хэндлерах как аргумент
-    dp["sessionmaker"] = sm
-    
-    dp["superadmin_ids"] = config.admin_ids
-
-    # Public routers
-    dp.include_router(start.router)
-    dp.include_router(menu.router)
-    dp.include_router(solve.router)
-
-    # Admin: добавление заданий (любой DB-админ)
-    admin_handlers.router.message.filter(IsDbAdmin(sm))
-    admin_handlers.router.callback_query.filter(IsDbAdmin(sm))
-    dp.include_router(admin_handlers.router)
-
-    # Superadmin: управление админами (только SUPERADMIN_IDS)
-    admin_manage_handlers.router.message.filter(IsSuperAdmin(config.admin_ids))
-    admin_manage_handlers.router.callback_query.filter(IsSuperAdmin(config.admin_ids))
-    dp.include_router(admin_manage_handlers.router)
-
-    await dp.start_polling(bot)
+    with prof.step("seed superadmins"):
+        async with sm() as s:
+            repo = repo_mod.Repo(s)
+            for sid in config.admin_ids:  # тут лежат SUPERADMIN_IDS (если ты так настроил config)
+                await repo.add_admin(sid, added_by_tg_id=None)
+
+    with prof.step("build dispatcher"):
+        dp = Dispatcher()
+
+        # DI: sessionmaker — для фоновых задач; хэндлеры получают repo
+        # (одна сессия на апдейт, см. DbSessionMiddleware)
+        dp["sessionmaker"] = sm
+        # дубли нажатий отсекаются раньше, чем откроется сессия БД
+        antiflood = antiflood_mod.CallbackAntiFloodMiddleware()
+        dp["antiflood"] = antiflood
+        dp.update.middleware(antiflood)
+        dp.update.middleware(db_session_mod.DbSessionMiddleware(sm, read_sm))
+
+        dp["superadmin_ids"] = config.admin_ids
+        dp["outbound"] = outbound
+
+        # Public routers
+        dp.include_router(start.router)
+        dp.include_router(menu.router)
+        # live-викторина раньше solve: её раунды тоже отвечают через OptionCB
+        dp.include_router(live.router)
+        dp.include_router(solve.router)
+
+        # Admin: добавление заданий (любой DB-админ)
+        admin_handlers.router.message.filter(permissions.IsDbAdmin(sm))
+        admin_handlers.router.callback_query.filter(permissions.IsDbAdmin(sm))
+        dp.include_router(admin_handlers.router)
+        live.admin_router.message.filter(permissions.IsDbAdmin(sm))
+        dp.include_router(live.admin_router)
+        admin_manage_handlers.admin_router.message.filter(permissions.IsDbAdmin(sm))
+        dp.include_router(admin_manage_handlers.admin_router)
+
+        # Superadmin: управление админами (только SUPERADMIN_IDS)
+        admin_manage_handlers.router.message.filter(permissions.IsSuperAdmin(config.admin_ids))
+        admin_manage_handlers.router.callback_query.filter(permissions.IsSuperAdmin(config.admin_ids))
+        dp.include_router(admin_manage_handlers.router)
+
+    if prof.enabled:
+        print(prof.report())
+        await bot.session.close()
+        await engine.dispose()
+        if read_engine is not None:
+            await read_engine.dispose()
+        return
+
+    # Сообщения, которые веб-приложение положило в outbox (коды входа, рассылки)
+    outbox_task = asyncio.create_task(outbox_mod.OutboxSender(bot, sm).run())
+    try:
+        await dp.start_polling(bot)
+    finally:
+        outbox_task.cancel()
+        chart_renderer.shutdown()
+        if read_engine is not None:
+            await read_engine.dispose()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+"""Сравнение движков графика статистики: время рендера и память.
+
+    python benchmarks/charts.py [--runs 50]
+
+Каждый движок меряется в отдельном процессе, чтобы стоимость импорта
+(matplotlib) и RSS не смешивались между собой.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+PAIRS = [(f"Тема номер {i}", 40 - i * 3) for i in range(12)]
+
+
+def _measure(engine: str, runs: int) -> dict[str, float]:
+    sys.path.insert(0, str(ROOT))
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    t0 = time.perf_counter()
+    from services.stats_graphs import bar_topics_png
+
+    bar_topics_png(PAIRS, engine=engine)  # первый вызов включает ленивый импорт
+    first_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        png = bar_topics_png(PAIRS, engine=engine)
+    per_run_ms = (time.perf_counter() - t0) * 1000 / runs
+
+    # tracemalloc заметно замедляет код, поэтому память меряем отдельным прогоном
+    tracemalloc.start()
+    bar_topics_png(PAIRS, engine=engine)
+    _cur, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "first_call_ms": round(first_ms, 1),
+        "render_ms": round(per_run_ms, 2),
+        "py_peak_kb": round(peak / 1024, 1),
+        "rss_growth_mb": round((rss_after - rss_before) / 1024, 1),
+        "png_kb": round(len(png) / 1024, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--engine")
+    args = parser.parse_args()
+
+    if args.engine:
+        print(json.dumps(_measure(args.engine, args.runs)))
+        return
+
+    rows = {}
+    for engine in ("matplotlib", "native"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--engine", engine, "--runs", str(args.runs)],
+            check=True, capture_output=True, text=True,
+        )
+        rows[engine] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    cols = list(next(iter(rows.values())))
+    print(f"{'engine':<12}" + "".join(f"{c:>16}" for c in cols))
+    for engine, row in rows.items():
+        print(f"{engine:<12}" + "".join(f"{row[c]:>16}" for c in cols))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""ORM-чтения Repo против Core/DTO-пути: CPU на вызов.
+
+    python benchmarks/repo_reads.py [--calls 2000] [--questions 500]
+
+База — временный SQLite-файл с синтетическим каталогом. Меряется
+process_time (CPU процесса), а не wall time: интересна именно стоимость
+построения запроса и сущностей, а не ожидание диска.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from db.repo import Repo  # noqa: E402
+from db.session import init_db, make_engine, make_sessionmaker  # noqa: E402
+
+
+async def _seed(sm, questions: int) -> tuple[int, int, int, int]:
+    async with sm() as s:
+        repo = Repo(s)
+        sid = await repo.create_subject("bench", "Bench")
+        tid = await repo.create_topic(sid, "Topic")
+        for i in range(questions):
+            await repo.create_question(
+                sid, tid, None, f"Question {i}?", "single", "-", None,
+                [("a", True), ("b", False), ("c", False), ("d", False)],
+            )
+        user = await repo.get_or_create_user(1, "Bench")
+        for qid in range(1, min(questions, 150) + 1):
+            await repo.add_attempt(user.id, qid, True, [1])
+        return sid, tid, user.id, questions // 2
+
+
+async def _per_call_us(sm, calls: int, fn) -> float:
+    async with sm() as s:
+        repo = Repo(s)
+        await fn(repo)  # прогрев: кэши компиляции/лямбд
+        t0 = time.process_time()
+        for _ in range(calls):
+            await fn(repo)
+            # identity map растёт от вызова к вызову — чистим, как при новой сессии на апдейт
+            s.expunge_all()
+        return (time.process_time() - t0) * 1e6 / calls
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        await init_db(engine)
+        sm = make_sessionmaker(engine)
+        sid, tid, uid, qid = await _seed(sm, args.questions)
+
+        pairs = {
+            "question": (lambda r: r.get_question(qid), lambda r: r.question_row(qid)),
+            "options": (lambda r: r.get_options(qid), lambda r: r.option_rows(qid)),
+            "topics": (lambda r: r.get_topics(sid), lambda r: r.topic_rows(sid)),
+            "next_question": (
+                lambda r: r.pick_next_question_id(uid, sid, tid, None),
+                lambda r: r.next_question_id(uid, sid, tid, None),
+            ),
+        }
+
+        print(f"{'query':<16}{'orm us':>12}{'core us':>12}{'saving':>10}")
+        for name, (orm_fn, core_fn) in pairs.items():
+            orm_us = await _per_call_us(sm, args.calls, orm_fn)
+            core_us = await _per_call_us(sm, args.calls, core_fn)
+            saving = (1 - core_us / orm_us) * 100 if orm_us else 0.0
+            print(f"{name:<16}{orm_us:>12.1f}{core_us:>12.1f}{saving:>9.0f}%")
+
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
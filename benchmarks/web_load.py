@@ -0,0 +1,143 @@
+"""Нагрузочный тест веба: пропускная способность при 1..N воркерах uvicorn.
+
+    python benchmarks/web_load.py [--workers 1,2,4] [--seconds 10] [--concurrency 64]
+
+Для каждого числа воркеров поднимается `python -m web --workers N` на
+временной SQLite-базе с синтетическим каталогом, один пользователь входит
+через код (код читается из outbox, как его отправил бы бот), и затем
+--concurrency клиентов с этой cookie гоняют страницы выбора темы и вопроса.
+Печатаются req/s, число ошибок и рост относительно первого замера для каждого
+числа воркеров; клиенты работают на той же машине и делят с сервером CPU.
+
+Замер на одноядерной песочнице (временная SQLite-база):
+1 воркер ≈127 req/s, 2 воркера ≈92 req/s — лишний воркер на одном ядре только
+добавляет переключения. Масштабирование по воркерам этим замером не
+проверено: гонять на машине с несколькими ядрами.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+PATHS = ["/solve", "/solve/subject/1", "/solve/topic/1/1"]
+
+
+async def _seed(db_url: str) -> None:
+    from db.repo import Repo
+    from db.session import init_db, make_engine, make_sessionmaker
+
+    engine = make_engine(db_url)
+    await init_db(engine)
+    async with make_sessionmaker(engine)() as s:
+        repo = Repo(s)
+        await repo.get_or_create_user(1, "Load", username="load")
+        sid = await repo.create_subject("load", "Load")
+        for t in range(10):
+            tid = await repo.create_topic(sid, f"Topic {t}")
+            sub = await repo.create_subtopic(tid, f"Sub {t}")
+            for i in range(20):
+                await repo.create_question(sid, tid, sub, f"Q{t}.{i}?", "single", "-", None, [("a", True), ("b", False)])
+    await engine.dispose()
+
+
+async def _login(base: str, db_path: str) -> httpx.Cookies:
+    async with httpx.AsyncClient(base_url=base) as c:
+        r = await c.post("/auth/request-code", data={"telegram": "1"})
+        r.raise_for_status()
+        text = sqlite3.connect(db_path).execute("SELECT text FROM outbox ORDER BY id DESC LIMIT 1").fetchone()[0]
+        code = re.search(r"(\d{6})", text).group(1)
+        r = await c.post("/auth/verify-code", data={"code": code})
+        return c.cookies
+
+
+async def _run_load(base: str, cookies: httpx.Cookies, seconds: float, concurrency: int) -> tuple[int, int]:
+    done = 0
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base, cookies=cookies, limits=limits, timeout=30) as c:
+        async def worker(n: int) -> None:
+            nonlocal done, errors
+            i = n
+            while time.perf_counter() < deadline:
+                r = await c.get(PATHS[i % len(PATHS)])
+                i += 1
+                if r.status_code == 200:
+                    done += 1
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    return done, errors
+
+
+def _wait_ready(base: str, proc: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("web server exited during startup")
+        try:
+            if httpx.get(base + "/", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("web server did not start")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    base = f"http://127.0.0.1:{args.port}"
+    print(f"cpu cores: {os.cpu_count()}")
+    print(f"{'workers':>8}{'req/s':>10}{'errors':>8}{'scaling':>10}")
+    baseline = None
+    for workers in [int(x) for x in args.workers.split(",")]:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "load.db")
+            db_url = f"sqlite+aiosqlite:///{db_path}"
+            asyncio.run(_seed(db_url))
+            env = dict(
+                os.environ,
+                DB_URL=db_url,
+                BOT_TOKEN=os.environ.get("BOT_TOKEN", "0:load"),
+                RATE_LIMIT_BACKEND="sql",
+            )
+            proc = subprocess.Popen(
+                [sys.executable, "-m", "web", "--host", "127.0.0.1", "--port", str(args.port), "--workers", str(workers)],
+                cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                _wait_ready(base, proc)
+                cookies = asyncio.run(_login(base, db_path))
+                done, errors = asyncio.run(_run_load(base, cookies, args.seconds, args.concurrency))
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)
+
+        rps = done / args.seconds
+        baseline = baseline or rps
+        print(f"{workers:>8}{rps:>10.0f}{errors:>8}{rps / baseline:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
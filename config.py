@@ -10,7 +10,14 @@ class Config:
     bot_username: str
     admin_ids: set[int]
     db_url: str
+    db_read_url: str | None
     web_session_secret: str
+    web_session_backend: str
+    chart_engine: str
+    rate_limit_backend: str
+    redis_url: str | None
+    bot_api_base: str
+    image_cache_dir: str
 
 def load_config() -> Config:
     token = os.getenv("BOT_TOKEN", "").strip()
@@ -18,7 +25,14 @@ def load_config() -> Config:
     admins_raw = os.getenv("SUPERADMIN_IDS", "").strip()
     admin_ids = {int(x) for x in admins_raw.split(",") if x.strip().isdigit()}
     db_url = os.getenv("DB_URL", "sqlite+aiosqlite:///./bot.db")
+    db_read_url = os.getenv("DB_READ_URL", "").strip() or None
     web_session_secret = os.getenv("WEB_SESSION_SECRET", "change-me-in-env")
+    web_session_backend = os.getenv("WEB_SESSION_BACKEND", "sql").strip().lower() or "sql"
+    chart_engine = os.getenv("CHART_ENGINE", "matplotlib").strip().lower() or "matplotlib"
+    rate_limit_backend = os.getenv("RATE_LIMIT_BACKEND", "memory").strip().lower() or "memory"
+    redis_url = os.getenv("REDIS_URL", "").strip() or None
+    bot_api_base = os.getenv("BOT_API_BASE", "").strip().rstrip("/") or "https://api.telegram.org"
+    image_cache_dir = os.getenv("IMAGE_CACHE_DIR", "").strip() or "./image_cache"
     if not token:
         raise RuntimeError("BOT_TOKEN is empty")
     return Config(
@@ -26,5 +40,12 @@ def load_config() -> Config:
         bot_username=bot_username,
         admin_ids=admin_ids,
         db_url=db_url,
+        db_read_url=db_read_url,
         web_session_secret=web_session_secret,
+        web_session_backend=web_session_backend,
+        chart_engine=chart_engine,
+        rate_limit_backend=rate_limit_backend,
+        redis_url=redis_url,
+        bot_api_base=bot_api_base,
+        image_cache_dir=image_cache_dir,
     )
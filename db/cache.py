@@ -0,0 +1,211 @@
+"""Процессные кэши поверх БД."""
+from __future__ import annotations
+
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, NamedTuple
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+# виды данных в таблице cache_versions
+CATALOG = "catalog"  # предметы, темы, подтемы, вопросы
+ADMINS = "admins"
+
+
+class CacheVersions:
+    """Версии данных из таблицы cache_versions — сигнал сброса кэшей между процессами.
+
+    Бот и веб работают в разных процессах над одной БД. Писатель увеличивает
+    версию вида данных в той же транзакции (Repo._bump), читатели перед
+    обращением к кэшу зовут check(): не чаще раза в poll_interval он читает
+    несколько строк таблицы и вызывает подписчиков тех видов, чья версия сменилась.
+    """
+
+    def __init__(self, poll_interval: float = 2.0):
+        self.poll_interval = poll_interval
+        self._seen: dict[str, int] = {}
+        self._checked_at: float | None = None
+        self._listeners: dict[str, list[Callable[[], None]]] = {}
+        self._lock = asyncio.Lock()
+
+    def subscribe(self, kind: str, fn: Callable[[], None]) -> None:
+        self._listeners.setdefault(kind, []).append(fn)
+
+    def version(self, kind: str) -> int:
+        return self._seen.get(kind, 0)
+
+    async def check(self, sessionmaker: async_sessionmaker) -> None:
+        if self._checked_at is not None and time.monotonic() - self._checked_at < self.poll_interval:
+            return
+        if self._lock.locked():
+            return  # опрос уже идёт в другой задаче — не ждём его
+        async with self._lock:
+            self._checked_at = time.monotonic()
+            from db.repo import Repo
+
+            async with sessionmaker() as s:
+                versions = await Repo(s).get_cache_versions()
+            for kind, version in versions.items():
+                if self._seen.get(kind) != version:
+                    self._seen[kind] = version
+                    for fn in self._listeners.get(kind, ()):
+                        fn()
+
+
+cache_versions = CacheVersions()
+
+
+class AdminCache:
+    """Множество tg_id DB-админов: обновляется по TTL, сбрасывается сразу
+    при Repo.add_admin/remove_admin, а в соседнем процессе — по версии ADMINS.
+    Общий для фильтра IsDbAdmin и веба."""
+
+    def __init__(self, ttl: float = 60.0):
+        self.ttl = ttl
+        self._ids: frozenset[int] = frozenset()
+        self._loaded_at: float | None = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._loaded_at = None
+
+    def _fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def get(self, sessionmaker: async_sessionmaker) -> frozenset[int]:
+        # изменения из другого процесса (веб/бот) приходят через cache_versions
+        await cache_versions.check(sessionmaker)
+        if self._fresh():
+            return self._ids
+        async with self._lock:
+            if self._fresh():
+                return self._ids
+            generation = self._generation
+            from db.repo import Repo
+
+            async with sessionmaker() as s:
+                ids = frozenset(await Repo(s).list_admins())
+            # если пока грузили, список поменяли — результат уже устарел, не запоминаем
+            if generation == self._generation:
+                self._ids = ids
+                self._loaded_at = time.monotonic()
+            return ids
+
+    async def is_admin(self, sessionmaker: async_sessionmaker, tg_id: int) -> bool:
+        return tg_id in await self.get(sessionmaker)
+
+
+admin_cache = AdminCache()
+cache_versions.subscribe(ADMINS, admin_cache.invalidate)
+
+
+class CachedUser(NamedTuple):
+    user_id: int
+    full_name: str
+    username: str | None
+
+
+class UserIdCache:
+    """Ограниченный LRU tg_id -> (user_id, full_name, username) для Repo.resolve_user_id."""
+
+    def __init__(self, maxsize: int = 50_000):
+        self.maxsize = maxsize
+        self._items: OrderedDict[int, CachedUser] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, tg_id: int) -> CachedUser | None:
+        item = self._items.get(tg_id)
+        if item is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(tg_id)
+        self.hits += 1
+        return item
+
+    def put(self, tg_id: int, item: CachedUser) -> None:
+        self._items[tg_id] = item
+        self._items.move_to_end(tg_id)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+
+user_id_cache = UserIdCache()
+
+
+class SingleFlight:
+    """Склейка одинаковых одновременных загрузок: пока запрос по ключу в полёте,
+    остальные вызовы ждут его результат, а не идут в БД сами.
+
+    Результат общий для всех ожидавших — его нельзя менять на месте
+    (поэтому склеиваются только чтения, отдающие DTO/кортежи, не ORM-сущности).
+    """
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                if not fut.cancelled():
+                    raise  # отменили нас самих
+                # отменили ведущего — загружаем сами
+                return await fn()
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # помечаем как прочитанное, если ждущих не было
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
+
+    def snapshot(self) -> dict[str, int]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+        }
+
+
+single_flight = SingleFlight()
+
+
+def coalesced(method):
+    """Декоратор метода Repo: одинаковые (имя, аргументы) вызовы идут через single_flight.
+
+    В ключе — движки сессий Repo: основной и read-only запросы не смешиваются.
+    Repo(coalesce=False) читает сам — для тех, кому нужен свой снимок.
+    Аргументы должны быть хэшируемыми.
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        if not self.coalesce:
+            return await method(self, *args, **kwargs)
+        key = (name, self.s.bind, self.rs.bind, args, tuple(sorted(kwargs.items())))
+        return await single_flight.do(key, lambda: method(self, *args, **kwargs))
+
+    return wrapper
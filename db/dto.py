@@ -0,0 +1,61 @@
+"""Лёгкие DTO для горячих чтений (Repo.question_row и соседи).
+
+Строки приходят из Core-запросов без ORM: нет identity map, отслеживания
+изменений и ленивых связей. Поля совпадают с одноимёнными атрибутами
+моделей, поэтому хэндлеры и шаблоны читают их так же, как сущности.
+"""
+from __future__ import annotations
+
+from typing import NamedTuple
+
+
+class SubjectRow(NamedTuple):
+    id: int
+    code: str
+    name: str
+
+
+class QuestionRow(NamedTuple):
+    id: int
+    subject_id: int
+    topic_id: int
+    subtopic_id: int | None
+    text: str
+    image_file_id: str | None
+    qtype: str
+    explanation: str
+
+
+class OptionRow(NamedTuple):
+    id: int
+    text: str
+    is_correct: bool
+
+
+class TopicRow(NamedTuple):
+    id: int
+    name: str
+
+
+class SubtopicRow(NamedTuple):
+    id: int
+    name: str
+
+
+class CatalogTopicRow(NamedTuple):
+    id: int
+    subject_id: int
+    name: str
+
+
+class CatalogSubtopicRow(NamedTuple):
+    id: int
+    topic_id: int
+    name: str
+
+
+class QuestionCountRow(NamedTuple):
+    subject_id: int
+    topic_id: int
+    subtopic_id: int | None
+    count: int
@@ -5,7 +5,7 @@ from sqlalchemy import (
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from .base import Base
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import Index, UniqueConstraint
 
 class Admin(Base):
     __tablename__ = "admins"
@@ -84,3 +84,77 @@ class WebLoginCode(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
     expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
     used_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True, index=True)
+
+
+class WebSession(Base):
+    # Серверные сессии веба (web/sessions.py): в cookie только id
+    __tablename__ = "web_sessions"
+    id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    data: Mapped[str] = mapped_column(Text)  # JSON
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+
+
+class RateLimit(Base):
+    # Кулдауны веба для бэкенда sql (services/ratelimit.py): общие для всех воркеров
+    __tablename__ = "rate_limits"
+    key: Mapped[str] = mapped_column(String(128), primary_key=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+
+
+class OutboxMessage(Base):
+    # Исходящие сообщения, которые веб пишет в БД, а бот (services/outbox.py) отправляет.
+    __tablename__ = "outbox"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, index=True)
+    text: Mapped[str] = mapped_column(Text)
+    kind: Mapped[str] = mapped_column(String(16))  # login_code / broadcast
+    group_key: Mapped[str | None] = mapped_column(String(32), nullable=True, index=True)
+    status: Mapped[str] = mapped_column(String(16), default="pending", index=True)  # pending/sending/sent/failed
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str | None] = mapped_column(String(256), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class CacheVersion(Base):
+    # Счётчик изменений по виду данных: писатели увеличивают его в своей транзакции,
+    # другие процессы по нему сбрасывают кэши (db/cache.py, CacheVersions).
+    __tablename__ = "cache_versions"
+    kind: Mapped[str] = mapped_column(String(32), primary_key=True)  # catalog / admins
+    version: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class AttemptSync(Base):
+    # Принятые пакеты офлайн-попыток (POST /api/attempts/sync): повтор того же
+    # batch_id после обрыва связи не записывает попытки второй раз.
+    __tablename__ = "attempt_syncs"
+    batch_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+    accepted: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class ExamBlueprint(Base):
+    # Шаблон экзамена: сколько вопросов из каких подтем; варианты по нему
+    # заранее строит services/selection.py и кладёт в exam_variants.
+    __tablename__ = "exam_blueprints"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    subject_id: Mapped[int] = mapped_column(ForeignKey("subjects.id"), index=True)
+    topic_id: Mapped[int | None] = mapped_column(ForeignKey("topics.id"), nullable=True)
+    name: Mapped[str] = mapped_column(String(128))
+    spec: Mapped[str] = mapped_column(Text)  # JSON [{"subtopic_id": 3, "count": 5}, ...]
+    variant_count: Mapped[int] = mapped_column(Integer, default=0)
+    generated_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class ExamVariant(Base):
+    # Готовый вариант экзамена. pick — случайный ключ: выдача варианта — один
+    # поиск по индексу "первый pick >= случайного числа".
+    __tablename__ = "exam_variants"
+    __table_args__ = (Index("ix_exam_variants_pick", "blueprint_id", "pick"),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    blueprint_id: Mapped[int] = mapped_column(ForeignKey("exam_blueprints.id"))
+    pick: Mapped[int] = mapped_column(Integer)
+    question_ids: Mapped[str] = mapped_column(Text)  # "1,2,3"
@@ -1,15 +1,74 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
-from db.models import Subject, Topic, Subtopic, Question, Option, Admin, Attempt
-from sqlalchemy import select, func, desc, case
+from sqlalchemy import select, delete, insert, update
+from db.models import Subject, Topic, Subtopic, Question, Option, Admin, Attempt, OutboxMessage, CacheVersion, WebLoginCode, AttemptSync, ExamBlueprint, ExamVariant
+from sqlalchemy import select, func, desc, case, lambda_stmt, or_
 from sqlalchemy.orm import selectinload
 from db.models import User
+from db.dto import (
+    CatalogSubtopicRow, CatalogTopicRow, OptionRow, QuestionCountRow, QuestionRow, SubjectRow, SubtopicRow, TopicRow,
+)
+from db.cache import ADMINS, CATALOG, CachedUser, admin_cache, coalesced, user_id_cache
 from datetime import datetime, timedelta
+from typing import Callable
+import random
 
 
 class Repo:
-    def __init__(self, session: AsyncSession):
+    def __init__(
+        self,
+        session: AsyncSession,
+        autocommit: bool = True,
+        read_session: AsyncSession | None = None,
+        coalesce: bool = True,
+    ):
+        # autocommit=False — режим "одна сессия на апдейт/запрос" (DbSessionMiddleware,
+        # web get_repo): методы только flush-ат, а commit() делает владелец сессии.
+        # read_session — сессия read-only движка (DB_READ_URL) для аналитики статистики;
+        # без неё аналитика читает через основную сессию. Запись всегда идёт в self.s.
+        # coalesce=False — @coalesced-чтения не подсаживаются к чужим запросам.
         self.s = session
+        self.rs = read_session or session
+        self.autocommit = autocommit
+        self.coalesce = coalesce
+        self._after_commit: list[Callable[[], None]] = []
+
+    async def _commit(self, *after: Callable[[], None]) -> None:
+        # after — действия над процессными кэшами, допустимые только после фиксации
+        if self.autocommit:
+            await self.s.commit()
+            for fn in after:
+                fn()
+        else:
+            await self.s.flush()
+            self._after_commit.extend(after)
+
+    async def commit(self) -> None:
+        if self.s.in_transaction():
+            await self.s.commit()
+        callbacks, self._after_commit = self._after_commit, []
+        for fn in callbacks:
+            fn()
+
+    def _dialect_insert(self):
+        if self.s.get_bind().dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        return dialect_insert
+
+    async def _bump(self, kind: str) -> None:
+        # версия меняется в транзакции записи: другие процессы увидят её вместе с данными
+        stmt = self._dialect_insert()(CacheVersion).values(kind=kind, version=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CacheVersion.kind],
+            set_={"version": CacheVersion.version + 1},
+        )
+        await self.s.execute(stmt)
+
+    async def get_cache_versions(self) -> dict[str, int]:
+        res = await self.s.execute(select(CacheVersion.kind, CacheVersion.version))
+        return {kind: int(version) for kind, version in res.all()}
+
     async def subject_exists(self, code: str) -> bool:
         res = await self.s.execute(select(Subject.id).where(Subject.code == code))
         return res.scalar_one_or_none() is not None
@@ -19,13 +78,15 @@ class Repo:
         name = name.strip()
         s = Subject(code=code, name=name)
         self.s.add(s)
-        await self.s.commit()
+        await self._bump(CATALOG)
+        await self._commit()
         return s.id
 
     async def create_topic(self, subject_id: int, name: str) -> int:
         t = Topic(subject_id=subject_id, name=name.strip())
         self.s.add(t)
-        await self.s.commit()
+        await self._bump(CATALOG)
+        await self._commit()
         return t.id
 
     async def get_subject_by_code(self, code: str) -> Subject | None:
@@ -53,7 +114,8 @@ class Repo:
         if await self.is_admin(tg_id):
             return False
         self.s.add(Admin(tg_id=tg_id, added_by_tg_id=added_by_tg_id))
-        await self.s.commit()
+        await self._bump(ADMINS)
+        await self._commit(admin_cache.invalidate)
         return True
 
     async def remove_admin(self, tg_id: int) -> bool:
@@ -63,7 +125,8 @@ class Repo:
         if admin_id is None:
             return False
         await self.s.execute(delete(Admin).where(Admin.id == admin_id))
-        await self.s.commit()
+        await self._bump(ADMINS)
+        await self._commit(admin_cache.invalidate)
         return True
 
     async def get_subjects(self) -> list[Subject]:
@@ -85,7 +148,8 @@ class Repo:
     async def create_subtopic(self, topic_id: int, name: str) -> int:
         st = Subtopic(topic_id=topic_id, name=name.strip())
         self.s.add(st)
-        await self.s.commit()
+        await self._bump(CATALOG)
+        await self._commit()
         return st.id
 
     async def create_question(
@@ -114,7 +178,8 @@ class Repo:
         for opt_text, is_correct in options:
             self.s.add(Option(question_id=q.id, text=opt_text, is_correct=is_correct))
 
-        await self.s.commit()
+        await self._bump(CATALOG)
+        await self._commit()
         return q.id
     async def count_questions(self, subject_id: int | None = None, topic_id: int | None = None) -> int:
         q = select(func.count(Question.id))
@@ -163,7 +228,8 @@ class Repo:
         if not obj:
             return False
         await self.s.delete(obj)
-        await self.s.commit()
+        await self._bump(CATALOG)
+        await self._commit()
         return True
 
     async def get_correct_option_ids(self, qid: int) -> set[int]:
@@ -214,6 +280,158 @@ class Repo:
         res = await self.s.execute(select(Question).where(Question.id == qid))
         return res.scalar_one_or_none()
 
+    # ---- Core-чтения для горячего пути: DTO (db/dto.py) вместо ORM-сущностей ----
+    # lambda_stmt кэширует построенный и скомпилированный запрос по коду лямбды,
+    # значения из замыкания уходят параметрами. Выполняется на соединении сессии,
+    # минуя ORM (identity map, загрузка сущностей), в той же транзакции.
+    # @coalesced: одновременные одинаковые чтения (волна после рассылки) делят
+    # один запрос — DTO неизменяемые, их можно отдавать нескольким хэндлерам.
+
+    async def _core(self, stmt):
+        conn = await self.s.connection()
+        return await conn.execute(stmt)
+
+    @coalesced
+    async def subject_rows(self) -> list[SubjectRow]:
+        sb = Subject.__table__
+        res = await self._core(lambda_stmt(lambda: select(sb.c.id, sb.c.code, sb.c.name).order_by(sb.c.id.asc())))
+        return [SubjectRow._make(r) for r in res]
+
+    async def question_row(self, qid: int) -> QuestionRow | None:
+        q = Question.__table__
+        res = await self._core(lambda_stmt(lambda: select(
+            q.c.id, q.c.subject_id, q.c.topic_id, q.c.subtopic_id,
+            q.c.text, q.c.image_file_id, q.c.qtype, q.c.explanation,
+        ).where(q.c.id == qid)))
+        row = res.first()
+        return QuestionRow._make(row) if row is not None else None
+
+    async def question_rows(self, qids: list[int]) -> dict[int, QuestionRow]:
+        # много вопросов одним запросом (лист теста); удалённых в ответе нет
+        q = Question.__table__
+        if not qids:
+            return {}
+        res = await self._core(
+            select(
+                q.c.id, q.c.subject_id, q.c.topic_id, q.c.subtopic_id,
+                q.c.text, q.c.image_file_id, q.c.qtype, q.c.explanation,
+            ).where(q.c.id.in_(qids))
+        )
+        return {r.id: QuestionRow._make(r) for r in res}
+
+    async def question_image_known(self, file_id: str) -> bool:
+        # веб отдаёт только картинки вопросов, а не любой файл, доступный боту
+        q = Question.__table__
+        res = await self._core(lambda_stmt(lambda: select(q.c.id).where(q.c.image_file_id == file_id).limit(1)))
+        return res.first() is not None
+
+    async def option_rows(self, qid: int) -> list[OptionRow]:
+        o = Option.__table__
+        res = await self._core(lambda_stmt(lambda: select(o.c.id, o.c.text, o.c.is_correct)
+                                           .where(o.c.question_id == qid)
+                                           .order_by(o.c.id.asc())))
+        return [OptionRow._make(r) for r in res]
+
+    @coalesced
+    async def topic_rows(self, subject_id: int) -> list[TopicRow]:
+        t = Topic.__table__
+        res = await self._core(lambda_stmt(lambda: select(t.c.id, t.c.name)
+                                           .where(t.c.subject_id == subject_id)
+                                           .order_by(t.c.id.asc())))
+        return [TopicRow._make(r) for r in res]
+
+    @coalesced
+    async def subtopic_rows(self, topic_id: int) -> list[SubtopicRow]:
+        st = Subtopic.__table__
+        res = await self._core(lambda_stmt(lambda: select(st.c.id, st.c.name)
+                                           .where(st.c.topic_id == topic_id)
+                                           .order_by(st.c.id.asc())))
+        return [SubtopicRow._make(r) for r in res]
+
+    # весь каталог разом (JSON API каталога веба): темы и подтемы всех предметов
+    # и число вопросов по (предмет, тема, подтема) одним GROUP BY.
+
+    async def catalog_topic_rows(self) -> list[CatalogTopicRow]:
+        t = Topic.__table__
+        res = await self._core(select(t.c.id, t.c.subject_id, t.c.name).order_by(t.c.id.asc()))
+        return [CatalogTopicRow._make(r) for r in res]
+
+    async def catalog_subtopic_rows(self) -> list[CatalogSubtopicRow]:
+        st = Subtopic.__table__
+        res = await self._core(select(st.c.id, st.c.topic_id, st.c.name).order_by(st.c.id.asc()))
+        return [CatalogSubtopicRow._make(r) for r in res]
+
+    async def question_count_rows(self) -> list[QuestionCountRow]:
+        q = Question.__table__
+        res = await self._core(
+            select(q.c.subject_id, q.c.topic_id, q.c.subtopic_id, func.count())
+            .group_by(q.c.subject_id, q.c.topic_id, q.c.subtopic_id)
+        )
+        return [QuestionCountRow._make(r) for r in res]
+
+    async def option_rows_many(self, qids: list[int]) -> dict[int, list[OptionRow]]:
+        # варианты сразу для многих вопросов (ключ ответов пакета/листа теста)
+        o = Option.__table__
+        out: dict[int, list[OptionRow]] = {qid: [] for qid in qids}
+        if not qids:
+            return out
+        res = await self._core(
+            select(o.c.question_id, o.c.id, o.c.text, o.c.is_correct)
+            .where(o.c.question_id.in_(qids))
+            .order_by(o.c.id.asc())
+        )
+        for qid, *row in res:
+            out[qid].append(OptionRow._make(row))
+        return out
+
+    async def sample_question_rows(
+            self,
+            subject_id: int,
+            topic_id: int | None,
+            subtopic_ids: list[int] | None,
+            limit: int,
+    ) -> list[QuestionRow]:
+        # случайные вопросы области (офлайн-пакет)
+        q = Question.__table__
+        stmt = select(
+            q.c.id, q.c.subject_id, q.c.topic_id, q.c.subtopic_id,
+            q.c.text, q.c.image_file_id, q.c.qtype, q.c.explanation,
+        ).where(q.c.subject_id == subject_id)
+        if topic_id is not None:
+            stmt = stmt.where(q.c.topic_id == topic_id)
+        if subtopic_ids:
+            stmt = stmt.where(q.c.subtopic_id.in_(subtopic_ids))
+        res = await self._core(stmt.order_by(func.random()).limit(limit))
+        return [QuestionRow._make(r) for r in res]
+
+    async def next_question_id(
+            self,
+            user_id: int,
+            subject_id: int,
+            topic_id: int,
+            subtopic_ids: list[int] | None,
+            recent_limit: int = 200,
+    ) -> int | None:
+        # то же, что pick_next_question_id, но одним запросом: недавно решённые
+        # исключаются подзапросом, а не списком id, вытянутым в Python
+        q = Question.__table__
+        a = Attempt.__table__
+        stmt = lambda_stmt(lambda: select(q.c.id).where(
+            q.c.subject_id == subject_id,
+            q.c.topic_id == topic_id,
+            q.c.id.not_in(
+                select(a.c.question_id)
+                .where(a.c.user_id == user_id)
+                .order_by(a.c.created_at.desc())
+                .limit(recent_limit)
+            ),
+        ))
+        if subtopic_ids:
+            stmt += lambda s: s.where(q.c.subtopic_id.in_(subtopic_ids))
+        stmt += lambda s: s.order_by(func.random()).limit(1)
+        res = await self._core(stmt)
+        return res.scalar_one_or_none()
+
     async def add_attempt(
             self,
             user_id: int,
@@ -228,7 +446,132 @@ class Repo:
             chosen_option_ids=",".join(map(str, chosen_option_ids)),
         )
         self.s.add(att)
-        await self.s.commit()
+        await self._commit()
+
+    async def add_attempts(
+            self,
+            user_id: int,
+            attempts: list[tuple[int, bool, list[int], datetime | None]],
+    ) -> int:
+        # пачка попыток одного пользователя (question_id, is_correct, chosen, created_at)
+        return await self.add_attempts_bulk([(user_id, *a) for a in attempts])
+
+    async def add_attempts_bulk(
+            self,
+            rows: list[tuple[int, int, bool, list[int], datetime | None]],
+    ) -> int:
+        # попытки разных пользователей (user_id, question_id, ...) одним INSERT
+        if not rows:
+            return 0
+        now = datetime.utcnow()
+        await self.s.execute(
+            insert(Attempt),
+            [
+                {
+                    "user_id": user_id,
+                    "question_id": qid,
+                    "is_correct": is_correct,
+                    "chosen_option_ids": ",".join(map(str, chosen)),
+                    "created_at": created_at or now,
+                }
+                for user_id, qid, is_correct, chosen, created_at in rows
+            ],
+        )
+        await self._commit()
+        return len(rows)
+
+    async def claim_attempt_sync(self, batch_id: str, user_id: int, accepted: int) -> tuple[int, int] | None:
+        # None — пакет новый и записан; иначе (чей пакет, сколько попыток приняли в первый раз)
+        res = await self.s.execute(
+            self._dialect_insert()(AttemptSync)
+            .values(batch_id=batch_id, user_id=user_id, accepted=accepted)
+            .on_conflict_do_nothing(index_elements=[AttemptSync.batch_id])
+            .returning(AttemptSync.batch_id)
+        )
+        if res.first() is not None:
+            return None
+        res = await self.s.execute(
+            select(AttemptSync.user_id, AttemptSync.accepted).where(AttemptSync.batch_id == batch_id)
+        )
+        owner, previous = res.one()
+        return owner, previous
+
+    # ---- экзамены по шаблону (services/selection.py) ----
+
+    async def create_blueprint(self, subject_id: int, topic_id: int | None, name: str, spec: str) -> int:
+        bp = ExamBlueprint(subject_id=subject_id, topic_id=topic_id, name=name, spec=spec)
+        self.s.add(bp)
+        await self.s.flush()
+        await self._commit()
+        return bp.id
+
+    async def get_blueprint(self, blueprint_id: int) -> ExamBlueprint | None:
+        return await self.s.get(ExamBlueprint, blueprint_id)
+
+    async def list_blueprints(self, subject_id: int | None = None, ready_only: bool = False) -> list[ExamBlueprint]:
+        stmt = select(ExamBlueprint).order_by(ExamBlueprint.id.asc())
+        if subject_id is not None:
+            stmt = stmt.where(ExamBlueprint.subject_id == subject_id)
+        if ready_only:
+            stmt = stmt.where(ExamBlueprint.variant_count > 0)
+        res = await self.s.execute(stmt)
+        return list(res.scalars().all())
+
+    async def subtopic_owners(self, subtopic_ids: list[int]) -> dict[int, tuple[int, int]]:
+        # subtopic_id -> (topic_id, subject_id)
+        res = await self.s.execute(
+            select(Subtopic.id, Topic.id, Topic.subject_id)
+            .join(Topic, Topic.id == Subtopic.topic_id)
+            .where(Subtopic.id.in_(subtopic_ids))
+        )
+        return {stid: (tid, sid) for stid, tid, sid in res.all()}
+
+    async def subtopic_question_pools(self, subtopic_ids: list[int]) -> dict[int, list[int]]:
+        # индекс пула: id вопросов по подтемам одним запросом
+        q = Question.__table__
+        pools: dict[int, list[int]] = {stid: [] for stid in subtopic_ids}
+        res = await self._core(
+            select(q.c.subtopic_id, q.c.id).where(q.c.subtopic_id.in_(subtopic_ids)).order_by(q.c.id.asc())
+        )
+        for stid, qid in res:
+            pools[stid].append(qid)
+        return pools
+
+    async def replace_exam_variants(self, blueprint_id: int, variants: list[list[int]]) -> None:
+        await self.s.execute(delete(ExamVariant).where(ExamVariant.blueprint_id == blueprint_id))
+        if variants:
+            await self.s.execute(
+                insert(ExamVariant),
+                [
+                    {
+                        "blueprint_id": blueprint_id,
+                        "pick": random.randrange(2**31),
+                        "question_ids": ",".join(map(str, v)),
+                    }
+                    for v in variants
+                ],
+            )
+        await self.s.execute(
+            update(ExamBlueprint)
+            .where(ExamBlueprint.id == blueprint_id)
+            .values(variant_count=len(variants), generated_at=datetime.utcnow())
+        )
+        await self._commit()
+
+    async def pick_exam_variant(self, blueprint_id: int, r: int) -> list[int] | None:
+        # первый вариант с pick >= r; промах (r больше всех pick) — берём первый по кругу
+        ev = ExamVariant.__table__
+        stmt = lambda_stmt(lambda: select(ev.c.question_ids).where(ev.c.blueprint_id == blueprint_id, ev.c.pick >= r))
+        stmt += lambda s: s.order_by(ev.c.pick.asc()).limit(1)
+        raw = (await self._core(stmt)).scalar_one_or_none()
+        if raw is None:
+            res = await self._core(
+                select(ev.c.question_ids).where(ev.c.blueprint_id == blueprint_id).order_by(ev.c.pick.asc()).limit(1)
+            )
+            raw = res.scalar_one_or_none()
+        if raw is None:
+            return None
+        return [int(x) for x in raw.split(",") if x]
 
     async def get_topic_name(self, topic_id: int) -> str:
         res = await self.s.execute(select(Topic.name).where(Topic.id == topic_id))
@@ -264,19 +607,87 @@ class Repo:
                 u.username = norm_username
                 changed = True
             if changed:
-                await self.s.commit()
+                await self._commit()
+            user_id_cache.put(tg_id, CachedUser(u.id, u.full_name, u.username))
             return u
         u = User(tg_id=tg_id, full_name=full_name, grade_group=grade_group, username=norm_username)
         self.s.add(u)
-        await self.s.commit()
+        await self.s.flush()
+        cached = CachedUser(u.id, u.full_name, u.username)
+        await self._commit(lambda: user_id_cache.put(tg_id, cached))
         return u
 
+    async def resolve_user_id(
+        self,
+        tg_id: int,
+        full_name: str | None = None,
+        username: str | None = None,
+        grade_group: str = "8-",
+    ) -> int:
+        # tg_id -> users.id. Профиль (full_name/username) обновляется, только если передан
+        # и отличается от известного; в обычном случае ответ из LRU без запросов в БД.
+        norm_username = (username or "").strip().lstrip("@").lower() or None
+        cached = user_id_cache.get(tg_id)
+        if (
+            cached is not None
+            and (full_name is None or cached.full_name == full_name)
+            and (norm_username is None or cached.username == norm_username)
+        ):
+            return cached.user_id
+
+        if full_name is None and norm_username is None:
+            # профиль не передан — достаточно чтения, INSERT только для новых
+            res = await self.s.execute(
+                select(User.id, User.full_name, User.username).where(User.tg_id == tg_id)
+            )
+            row = res.first()
+            if row is not None:
+                user_id_cache.put(tg_id, CachedUser(int(row[0]), row[1], row[2]))
+                return int(row[0])
+
+        stmt = self._dialect_insert()(User).values(
+            tg_id=tg_id,
+            full_name=full_name or "-",
+            grade_group=grade_group,
+            username=norm_username,
+        )
+        set_ = {}
+        changed = []
+        if full_name is not None:
+            set_["full_name"] = stmt.excluded.full_name
+            changed.append(User.full_name != stmt.excluded.full_name)
+        if norm_username is not None:
+            set_["username"] = stmt.excluded.username
+            changed.append(User.username.is_distinct_from(stmt.excluded.username))
+        if set_:
+            stmt = stmt.on_conflict_do_update(index_elements=[User.tg_id], set_=set_, where=or_(*changed))
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=[User.tg_id])
+
+        res = await self.s.execute(stmt.returning(User.id, User.full_name, User.username))
+        row = res.first()
+        if row is None:
+            # конфликт без изменений: ничего не записано, просто читаем id
+            res = await self.s.execute(
+                select(User.id, User.full_name, User.username).where(User.tg_id == tg_id)
+            )
+            row = res.one()
+            user_id_cache.put(tg_id, CachedUser(int(row[0]), row[1], row[2]))
+        else:
+            # новый id попадает в кэш только после фиксации (иначе при rollback он был бы ложным)
+            cached = CachedUser(int(row[0]), row[1], row[2])
+            await self._commit(lambda: user_id_cache.put(tg_id, cached))
+        return int(row[0])
+
+
+    @coalesced
     async def user_totals(self, user_id: int) -> tuple[int, int]:
-        total = await self.s.execute(select(func.count(Attempt.id)).where(Attempt.user_id == user_id))
-        correct = await self.s.execute(
+        total = await self.rs.execute(select(func.count(Attempt.id)).where(Attempt.user_id == user_id))
+        correct = await self.rs.execute(
             select(func.count(Attempt.id)).where(Attempt.user_id == user_id, Attempt.is_correct == True))
         return int(total.scalar_one()), int(correct.scalar_one())
 
+    @coalesced
     async def solved_by_topic(self, user_id: int, limit: int = 20) -> list[tuple[str, int]]:
         # topic_name, solved_count
         q = (
@@ -288,9 +699,10 @@ class Repo:
             .order_by(func.count(Attempt.id).desc())
             .limit(limit)
         )
-        res = await self.s.execute(q)
+        res = await self.rs.execute(q)
         return [(name, int(cnt)) for name, cnt in res.all()]
 
+    @coalesced
     async def accuracy_by_day(self, user_id: int, days: int = 14) -> list[tuple[str, int, int]]:
         # returns [(YYYY-MM-DD, solved, correct), ...] in ascending date order
         date_col = func.date(Attempt.created_at)
@@ -305,9 +717,10 @@ class Repo:
             .group_by(date_col)
             .order_by(date_col.asc())
         )
-        res = await self.s.execute(q)
+        res = await self.rs.execute(q)
         return [(str(d), int(solved), int(correct or 0)) for d, solved, correct in res.all()]
 
+    @coalesced
     async def recent_attempts(self, user_id: int, limit: int = 12) -> list[tuple[datetime, str, bool]]:
         q = (
             select(Attempt.created_at, Topic.name, Attempt.is_correct)
@@ -317,5 +730,129 @@ class Repo:
             .order_by(Attempt.created_at.desc())
             .limit(limit)
         )
-        res = await self.s.execute(q)
+        res = await self.rs.execute(q)
         return [(dt, topic, ok) for dt, topic, ok in res.all()]
+
+    async def purge_login_codes(self) -> int:
+        # использованные и просроченные коды входа больше не нужны
+        res = await self.s.execute(
+            delete(WebLoginCode).where(
+                or_(WebLoginCode.used_at.is_not(None), WebLoginCode.expires_at <= datetime.utcnow())
+            )
+        )
+        await self._commit()
+        return res.rowcount or 0
+
+    # ---------------- outbox ----------------
+    def enqueue_outbox(self, chat_id: int, text: str, kind: str, group_key: str | None = None) -> OutboxMessage:
+        # без commit: вызывающий коммитит вместе со своими изменениями (одна транзакция)
+        msg = OutboxMessage(chat_id=chat_id, text=text, kind=kind, group_key=group_key)
+        self.s.add(msg)
+        return msg
+
+    async def enqueue_outbox_many(self, chat_ids: list[int], text: str, kind: str, group_key: str) -> int:
+        if not chat_ids:
+            return 0
+        now = datetime.utcnow()
+        await self.s.execute(
+            insert(OutboxMessage),
+            [
+                {
+                    "chat_id": cid,
+                    "text": text,
+                    "kind": kind,
+                    "group_key": group_key,
+                    "status": "pending",
+                    "attempts": 0,
+                    "created_at": now,
+                    "next_attempt_at": now,
+                }
+                for cid in chat_ids
+            ],
+        )
+        await self._commit()
+        return len(chat_ids)
+
+    async def claim_outbox_batch(self, limit: int, lease_seconds: int = 300) -> list[OutboxMessage]:
+        # pending + зависшие "sending" (отправитель упал) с истёкшей арендой.
+        # Отправителей может быть несколько (бот и python -m services.outbox):
+        # UPDATE повторяет условие выборки, и строка достаётся только тому, чей
+        # UPDATE её изменил (RETURNING); на Postgres кандидаты ещё и берутся
+        # FOR UPDATE SKIP LOCKED, чтобы отправители не ждали друг друга.
+        now = datetime.utcnow()
+        claimable = (
+            OutboxMessage.status.in_(("pending", "sending")),
+            OutboxMessage.next_attempt_at <= now,
+        )
+        # коды входа — вперёд очереди: иначе код ждёт, пока уйдут рассылки,
+        # стоящие перед ним (то же деление, что у OutboxSender.drain_once)
+        candidates = (
+            select(OutboxMessage.id)
+            .where(*claimable)
+            .order_by((OutboxMessage.kind != "broadcast").desc(), OutboxMessage.id.asc())
+            .limit(limit)
+        )
+        if self.s.get_bind().dialect.name == "postgresql":
+            candidates = candidates.with_for_update(skip_locked=True)
+        ids = list((await self.s.execute(candidates)).scalars().all())
+        if not ids:
+            return []
+        res = await self.s.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(ids), *claimable)
+            .values(status="sending", next_attempt_at=now + timedelta(seconds=lease_seconds))
+            .returning(OutboxMessage)
+        )
+        rows = sorted(res.scalars().all(), key=lambda m: (m.kind == "broadcast", m.id))
+        await self._commit()
+        return rows
+
+    async def finish_outbox(
+        self,
+        results: list[tuple[int, bool, str | None, bool]],
+        max_attempts: int = 5,
+    ) -> None:
+        # results: [(id, ok, error, retryable), ...]
+        now = datetime.utcnow()
+        sent_ids = [mid for mid, ok, _err, _retry in results if ok]
+        if sent_ids:
+            await self.s.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id.in_(sent_ids))
+                .values(status="sent", sent_at=now, last_error=None)
+            )
+        for mid, ok, err, retryable in results:
+            if ok:
+                continue
+            msg = await self.s.get(OutboxMessage, mid)
+            if msg is None:
+                continue
+            msg.attempts += 1
+            msg.last_error = (err or "")[:256]
+            if retryable and msg.attempts < max_attempts:
+                msg.status = "pending"
+                msg.next_attempt_at = now + timedelta(seconds=min(300, 5 * 2 ** msg.attempts))
+            else:
+                msg.status = "failed"
+        await self._commit()
+
+    async def get_outbox_status(self, msg_id: int) -> str | None:
+        res = await self.s.execute(select(OutboxMessage.status).where(OutboxMessage.id == msg_id))
+        return res.scalar_one_or_none()
+
+    async def outbox_group_status(self, group_key: str) -> dict[str, int]:
+        res = await self.s.execute(
+            select(OutboxMessage.status, func.count(OutboxMessage.id))
+            .where(OutboxMessage.group_key == group_key)
+            .group_by(OutboxMessage.status)
+        )
+        return {status: int(cnt) for status, cnt in res.all()}
+
+    async def outbox_group_failed_ids(self, group_key: str, limit: int = 20) -> list[int]:
+        res = await self.s.execute(
+            select(OutboxMessage.chat_id)
+            .where(OutboxMessage.group_key == group_key, OutboxMessage.status == "failed")
+            .order_by(OutboxMessage.id.asc())
+            .limit(limit)
+        )
+        return [int(x) for x in res.scalars().all()]
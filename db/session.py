@@ -1,17 +1,77 @@
+import zlib
+
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from .base import Base
+from . import models  # noqa: F401 — регистрирует таблицы в Base.metadata
+
 
 def make_engine(db_url: str):
-    return create_async_engine(db_url, echo=False)
+    engine = create_async_engine(db_url, echo=False)
+    if engine.dialect.name == "sqlite":
+        # Сессия живёт весь апдейт/запрос: WAL не даёт открытым читателям блокировать
+        # запись, busy_timeout — ждать чужую запись вместо "database is locked".
+        @event.listens_for(engine.sync_engine, "connect")
+        def _sqlite_pragmas(dbapi_conn, _record):
+            cur = dbapi_conn.cursor()
+            if ":memory:" not in str(engine.url):
+                cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute("PRAGMA busy_timeout=5000")
+            cur.close()
+    return engine
+
+def make_read_engine(db_url: str):
+    # Отдельный пул для тяжёлых чтений статистики (см. Repo.rs): всплеск просмотров
+    # /stats не занимает соединения, через которые пишутся ответы.
+    # SQLite: тот же файл (можно URI "file:...?mode=ro&uri=true"); Postgres: URL реплики.
+    engine = create_async_engine(db_url, echo=False)
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _read_only(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        if engine.dialect.name == "sqlite":
+            cur.execute("PRAGMA query_only=ON")
+            cur.execute("PRAGMA busy_timeout=5000")
+        elif engine.dialect.name == "postgresql":
+            cur.execute("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+        cur.close()
+
+    return engine
 
 def make_sessionmaker(engine) -> async_sessionmaker[AsyncSession]:
     return async_sessionmaker(engine, expire_on_commit=False)
 
+
+# Выставляет python -m web после init_db в родителе: воркеры схему не трогают.
+# На SQLite init_db и так выходит по user_version, на Postgres без этого каждый
+# воркер параллельно гонял бы create_all и миграции.
+SCHEMA_READY_ENV = "WEB_SCHEMA_READY"
+
+
+def schema_fingerprint() -> int:
+    # меняется при добавлении таблиц/колонок в models.py
+    parts = [
+        f"{t.name}:{','.join(c.name for c in t.columns)}"
+        for t in sorted(Base.metadata.tables.values(), key=lambda t: t.name)
+    ]
+    return zlib.crc32("|".join(parts).encode("utf-8")) & 0x7FFFFFFF
+
+
 async def init_db(engine):
+    fingerprint = schema_fingerprint()
     async with engine.begin() as conn:
+        # Схема уже соответствует моделям — пропускаем create_all и миграции (быстрый рестарт).
+        if conn.dialect.name == "sqlite":
+            res = await conn.exec_driver_sql("PRAGMA user_version")
+            if res.scalar() == fingerprint:
+                return
+
         await conn.run_sync(Base.metadata.create_all)
         # Lightweight SQLite migration for existing DBs.
         cols = await conn.exec_driver_sql("PRAGMA table_info(users)")
         user_cols = {row[1] for row in cols.fetchall()}
         if "username" not in user_cols:
             await conn.exec_driver_sql("ALTER TABLE users ADD COLUMN username VARCHAR(64)")
+
+        if conn.dialect.name == "sqlite":
+            await conn.exec_driver_sql(f"PRAGMA user_version = {fingerprint}")
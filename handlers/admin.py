@@ -4,7 +4,6 @@ from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from sqlalchemy.ext.asyncio import async_sessionmaker
 
 
 from states import AdminSG
@@ -61,14 +60,12 @@ async def admin_entry(message: Message, state: FSMContext):
 
 
 @router.callback_query(AdminCB.filter(F.action == "add"))
-async def add_start(callback: CallbackQuery, state: FSMContext, sessionmaker: async_sessionmaker):
+async def add_start(callback: CallbackQuery, state: FSMContext, repo: Repo):
     await callback.answer()
     await state.clear()
 
 
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        subjects = await repo.get_subjects()
+    subjects = await repo.get_subjects()
 
 
     if not subjects:
@@ -93,15 +90,13 @@ async def cancel_any(callback: CallbackQuery, state: FSMContext):
 
 # ---------- subject -> topic ----------
 @router.callback_query(AdminCB.filter(F.action == "pick_subject"))
-async def pick_subject(callback: CallbackQuery, callback_data: AdminCB, state: FSMContext, sessionmaker: async_sessionmaker):
+async def pick_subject(callback: CallbackQuery, callback_data: AdminCB, state: FSMContext, repo: Repo):
     await callback.answer()
     subject_id = callback_data.id
     await state.update_data(subject_id=subject_id)
 
 
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        topics = await repo.get_topics(subject_id)
+    topics = await repo.get_topics(subject_id)
 
 
     if not topics:
@@ -119,15 +114,13 @@ async def pick_subject(callback: CallbackQuery, callback_data: AdminCB, state: F
 
 # ---------- topic -> subtopic ----------
 @router.callback_query(AdminCB.filter(F.action == "pick_topic"))
-async def pick_topic(callback: CallbackQuery, callback_data: AdminCB, state: FSMContext, sessionmaker: async_sessionmaker):
+async def pick_topic(callback: CallbackQuery, callback_data: AdminCB, state: FSMContext, repo: Repo):
     await callback.answer()
     topic_id = callback_data.id
     await state.update_data(topic_id=topic_id)
 
 
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        subtopics = await repo.get_subtopics(topic_id)
+    subtopics = await repo.get_subtopics(topic_id)
 
 
     items = [(st.id, st.name) for st in subtopics]
@@ -167,7 +160,7 @@ async def ask_subtopic_name(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(AdminSG.add_q_choose_subtopic)
-async def create_subtopic_name(message: Message, state: FSMContext, sessionmaker: async_sessionmaker):
+async def create_subtopic_name(message: Message, state: FSMContext, repo: Repo):
     data = await state.get_data()
     if not data.get("waiting_new_subtopic"):
         return
@@ -180,9 +173,8 @@ async def create_subtopic_name(message: Message, state: FSMContext, sessionmaker
 
 
     topic_id = data["topic_id"]
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        subtopic_id = await repo.create_subtopic(topic_id, name)
+    subtopic_id = await repo.create_subtopic(topic_id, name)
+    await repo.commit()  # до ответа: отправка может ждать лимитер, а транзакция держит запись
 
 
     await state.update_data(subtopic_id=subtopic_id, waiting_new_subtopic=False)
@@ -274,7 +266,7 @@ async def got_correct(message: Message, state: FSMContext):
 
 
 @router.message(AdminSG.add_q_expl)
-async def got_expl_and_save(message: Message, state: FSMContext, sessionmaker: async_sessionmaker):
+async def got_expl_and_save(message: Message, state: FSMContext, repo: Repo):
     expl = (message.text or "").strip()
     if len(expl) < 3:
         await message.answer("Пояснение слишком короткое. Отправь нормальное объяснение.")
@@ -295,18 +287,17 @@ async def got_expl_and_save(message: Message, state: FSMContext, sessionmaker: a
         options_for_db.append((text, lab in correct_labels))
 
 
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        qid = await repo.create_question(
-            subject_id=data["subject_id"],
-            topic_id=data["topic_id"],
-            subtopic_id=data.get("subtopic_id"),
-            text=data["q_text"],
-            qtype=data["qtype"],
-            explanation=expl,
-            image_file_id=data.get("image_file_id"),
-            options=options_for_db,
-        )
+    qid = await repo.create_question(
+        subject_id=data["subject_id"],
+        topic_id=data["topic_id"],
+        subtopic_id=data.get("subtopic_id"),
+        text=data["q_text"],
+        qtype=data["qtype"],
+        explanation=expl,
+        image_file_id=data.get("image_file_id"),
+        options=options_for_db,
+    )
+    await repo.commit()
 
 
     await state.clear()
@@ -342,7 +333,7 @@ async def back_admin(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_text("Админ-панель:", reply_markup=admin_menu_kb())
 
 @router.callback_query(AdminCB.filter(F.action.in_({"q_list", "q_page"})))
-async def questions_list(callback: CallbackQuery, callback_data: AdminCB, state: FSMContext, sessionmaker: async_sessionmaker):
+async def questions_list(callback: CallbackQuery, callback_data: AdminCB, state: FSMContext, repo: Repo):
     await callback.answer()
     page = callback_data.page or 0
     if page < 0:
@@ -355,10 +346,8 @@ async def questions_list(callback: CallbackQuery, callback_data: AdminCB, state:
 
     offset = page * PAGE_SIZE
 
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        total = await repo.count_questions(subject_id=subject_id, topic_id=topic_id)
-        qs = await repo.list_questions_page(offset=offset, limit=PAGE_SIZE, subject_id=subject_id, topic_id=topic_id)
+    total = await repo.count_questions(subject_id=subject_id, topic_id=topic_id)
+    qs = await repo.list_questions_page(offset=offset, limit=PAGE_SIZE, subject_id=subject_id, topic_id=topic_id)
 
     has_prev = page > 0
     has_next = (offset + PAGE_SIZE) < total
@@ -377,17 +366,15 @@ async def questions_list(callback: CallbackQuery, callback_data: AdminCB, state:
         await callback.message.answer(text, reply_markup=kb)
 
 @router.callback_query(AdminCB.filter(F.action == "q_open"))
-async def question_open(callback: CallbackQuery, callback_data: AdminCB, sessionmaker: async_sessionmaker):
+async def question_open(callback: CallbackQuery, callback_data: AdminCB, repo: Repo):
     await callback.answer()
     qid = callback_data.id
 
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        q = await repo.get_question_full(qid)
-        if not q:
-            await callback.message.answer("Вопрос не найден.")
-            return
-        opts = await repo.get_options(qid)
+    q = await repo.get_question_full(qid)
+    if not q:
+        await callback.message.answer("Вопрос не найден.")
+        return
+    opts = await repo.get_options(qid)
 
     lines = [f"Вопрос #{q.id}",
              f"Тип: {q.qtype}",
@@ -419,13 +406,12 @@ async def question_open(callback: CallbackQuery, callback_data: AdminCB, session
         await callback.message.answer(text, reply_markup=b.as_markup())
 
 @router.callback_query(AdminCB.filter(F.action == "q_del"))
-async def question_delete(callback: CallbackQuery, callback_data: AdminCB, sessionmaker: async_sessionmaker):
+async def question_delete(callback: CallbackQuery, callback_data: AdminCB, repo: Repo):
     await callback.answer()
     qid = callback_data.id
 
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        ok = await repo.delete_question(qid)
+    ok = await repo.delete_question(qid)
+    await repo.commit()
 
     await callback.message.answer("Удалено." if ok else "Не найдено.")
     # вернёмся к списку
@@ -1,17 +1,21 @@
-import asyncio
-
 from aiogram import F, Router
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from sqlalchemy.ext.asyncio import async_sessionmaker
 
+from db.cache import single_flight
 from db.repo import Repo
+from services.outbound import OutboundLimiter, bulk_lane
+from services.selection import DEFAULT_VARIANTS, dump_spec, parse_spec, regenerate
 from states import SuperAdminSG
+from utils.antiflood import CallbackAntiFloodMiddleware
+from utils.redraw import keyboard_redraws
+from utils.render_cache import catalog_keyboards, question_payloads
 
-router = Router()
+router = Router()  # только SUPERADMIN_IDS
+admin_router = Router()  # любой DB-админ (учителя): шаблоны экзаменов
 
 
 def _parse_id_arg(text: str) -> int | None:
@@ -33,10 +37,8 @@ def _broadcast_confirm_kb():
 
 
 @router.message(Command("subjects"))
-async def subjects_list(message: Message, sessionmaker: async_sessionmaker):
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        subjects = await repo.list_subjects()
+async def subjects_list(message: Message, repo: Repo):
+    subjects = await repo.list_subjects()
     if not subjects:
         await message.answer("Subjects пусто.")
         return
@@ -45,7 +47,7 @@ async def subjects_list(message: Message, sessionmaker: async_sessionmaker):
 
 
 @router.message(F.text.startswith("/add_subject"))
-async def add_subject(message: Message, sessionmaker: async_sessionmaker):
+async def add_subject(message: Message, repo: Repo):
     # /add_subject biology Биология
     parts = message.text.split(maxsplit=2)
     if len(parts) < 3:
@@ -53,18 +55,17 @@ async def add_subject(message: Message, sessionmaker: async_sessionmaker):
         return
     code, name = parts[1], parts[2]
 
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        if await repo.subject_exists(code):
-            await message.answer("Такой subject code уже существует.")
-            return
-        sid = await repo.create_subject(code=code, name=name)
+    if await repo.subject_exists(code):
+        await message.answer("Такой subject code уже существует.")
+        return
+    sid = await repo.create_subject(code=code, name=name)
+    await repo.commit()  # до ответа: отправка может ждать лимитер, а транзакция держит запись
 
     await message.answer(f"Добавлен subject id={sid}: {code} — {name}")
 
 
 @router.message(Command("add_topic"))
-async def add_topic(message: Message, sessionmaker: async_sessionmaker):
+async def add_topic(message: Message, repo: Repo):
     # /add_topic biology Анатомия человека
     parts = message.text.split(maxsplit=2)
     if len(parts) < 3:
@@ -73,22 +74,19 @@ async def add_topic(message: Message, sessionmaker: async_sessionmaker):
 
     subject_code, topic_name = parts[1], parts[2]
 
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        subj = await repo.get_subject_by_code(subject_code)
-        if subj is None:
-            await message.answer("Subject не найден. Сначала создай его: /add_subject ...")
-            return
-        tid = await repo.create_topic(subject_id=subj.id, name=topic_name)
+    subj = await repo.get_subject_by_code(subject_code)
+    if subj is None:
+        await message.answer("Subject не найден. Сначала создай его: /add_subject ...")
+        return
+    tid = await repo.create_topic(subject_id=subj.id, name=topic_name)
+    await repo.commit()
 
     await message.answer(f"Добавлена тема id={tid} в subject={subject_code}: {topic_name}")
 
 
 @router.message(F.text.startswith("/admins"))
-async def admins_list(message: Message, sessionmaker: async_sessionmaker):
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        ids = await repo.list_admins()
+async def admins_list(message: Message, repo: Repo):
+    ids = await repo.list_admins()
     if not ids:
         await message.answer("Админов в БД пока нет.")
     else:
@@ -96,35 +94,115 @@ async def admins_list(message: Message, sessionmaker: async_sessionmaker):
 
 
 @router.message(F.text.startswith("/add_admin"))
-async def add_admin_cmd(message: Message, sessionmaker: async_sessionmaker):
+async def add_admin_cmd(message: Message, repo: Repo):
     tg_id = _parse_id_arg(message.text)
     if tg_id is None:
         await message.answer("Использование: /add_admin 123456789")
         return
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        added = await repo.add_admin(tg_id=tg_id, added_by_tg_id=message.from_user.id)
+    added = await repo.add_admin(tg_id=tg_id, added_by_tg_id=message.from_user.id)
+    await repo.commit()
     await message.answer("Добавлен." if added else "Этот tg_id уже админ.")
 
 
 @router.message(F.text.startswith("/del_admin"))
-async def del_admin_cmd(message: Message, sessionmaker: async_sessionmaker):
+async def del_admin_cmd(message: Message, repo: Repo):
     tg_id = _parse_id_arg(message.text)
     if tg_id is None:
         await message.answer("Использование: /del_admin 123456789")
         return
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        removed = await repo.remove_admin(tg_id=tg_id)
+    removed = await repo.remove_admin(tg_id=tg_id)
+    await repo.commit()
     await message.answer("Удалён." if removed else "Такого админа нет.")
 
 
+@admin_router.message(Command("blueprint"))
+async def add_blueprint(message: Message, repo: Repo):
+    # /blueprint economics Экзамен A | 12:5, 14:3
+    head, _, raw_spec = (message.text or "").partition("|")
+    parts = head.split(maxsplit=2)
+    if len(parts) < 3 or not raw_spec.strip():
+        await message.answer(
+            "Использование: /blueprint subject_code Название | subtopic_id:кол-во, ...\n"
+            "Пример: /blueprint economics Экзамен A | 12:5, 14:3"
+        )
+        return
+    try:
+        spec = parse_spec(raw_spec)
+    except ValueError:
+        await message.answer("Шаблон: пары subtopic_id:кол-во через запятую, например 12:5, 14:3")
+        return
+
+    subj = await repo.get_subject_by_code(parts[1])
+    if subj is None:
+        await message.answer("Subject не найден.")
+        return
+    owners = await repo.subtopic_owners([stid for stid, _count in spec])
+    foreign = [stid for stid, _count in spec if owners.get(stid, (None, None))[1] != subj.id]
+    if foreign:
+        await message.answer(f"Подтемы не из этого предмета или не существуют: {', '.join(map(str, foreign))}")
+        return
+
+    topic_ids = {owners[stid][0] for stid, _count in spec}
+    topic_id = topic_ids.pop() if len(topic_ids) == 1 else None
+    bp_id = await repo.create_blueprint(subj.id, topic_id, parts[2].strip(), dump_spec(spec))
+    await repo.commit()
+    await message.answer(
+        f"Шаблон id={bp_id}: {parts[2].strip()}, вопросов {sum(c for _s, c in spec)}.\n"
+        f"Сгенерируй варианты: /gen_variants {bp_id}"
+    )
+
+
+@admin_router.message(Command("blueprints"))
+async def blueprints_list(message: Message, repo: Repo):
+    items = await repo.list_blueprints()
+    if not items:
+        await message.answer("Шаблонов экзаменов нет. Создай: /blueprint ...")
+        return
+    lines = [
+        f"{bp.id}: {bp.name} — " + ", ".join(f"{stid}:{count}" for stid, count in parse_spec(bp.spec))
+        + f" · вариантов {bp.variant_count}"
+        for bp in items
+    ]
+    await message.answer("Шаблоны экзаменов:\n" + "\n".join(lines))
+
+
+@admin_router.message(Command("gen_variants"))
+async def gen_variants_cmd(message: Message, repo: Repo):
+    # /gen_variants 3 [200]
+    parts = (message.text or "").split()
+    try:
+        bp_id = int(parts[1])
+        n = int(parts[2]) if len(parts) > 2 else DEFAULT_VARIANTS
+    except (IndexError, ValueError):
+        await message.answer(f"Использование: /gen_variants blueprint_id [кол-во, по умолчанию {DEFAULT_VARIANTS}]")
+        return
+    try:
+        saved = await regenerate(repo, bp_id, n)
+    except ValueError as e:
+        await message.answer(str(e))
+        return
+    await repo.commit()
+    await message.answer(f"Шаблон {bp_id}: сохранено вариантов — {saved}.")
+
+
+@router.message(Command("metrics"))
+async def metrics_cmd(message: Message, outbound: OutboundLimiter, antiflood: CallbackAntiFloodMiddleware):
+    snap = outbound.snapshot()
+    flights = single_flight.snapshot()
+    redraws = {**keyboard_redraws.snapshot(), "dropped_duplicate_callbacks": antiflood.dropped}
+    await message.answer(
+        "Исходящие запросы:\n" + "\n".join(f"{k}: {v}" for k, v in snap.items())
+        + "\n\nСклейка чтений БД:\n" + "\n".join(f"{k}: {v}" for k, v in flights.items())
+        + "\n\nПерерисовки клавиатур:\n" + "\n".join(f"{k}: {v}" for k, v in redraws.items())
+        + "\n\nГотовые вопросы:\n" + "\n".join(f"{k}: {v}" for k, v in question_payloads.snapshot().items())
+        + "\n\nКлавиатуры каталога:\n" + "\n".join(f"{k}: {v}" for k, v in catalog_keyboards.snapshot().items())
+    )
+
+
 @router.message(Command("broadcast"))
-async def broadcast_start(message: Message, state: FSMContext, sessionmaker: async_sessionmaker):
+async def broadcast_start(message: Message, state: FSMContext, repo: Repo):
     await state.clear()
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        total_users = len(await repo.list_user_tg_ids())
+    total_users = len(await repo.list_user_tg_ids())
     await state.set_state(SuperAdminSG.broadcast_wait_text)
     await message.answer(
         "Режим рассылки.\n"
@@ -173,7 +251,7 @@ async def broadcast_cancel_cb(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(StateFilter(SuperAdminSG.broadcast_confirm), F.data == "bc_send")
-async def broadcast_send(callback: CallbackQuery, state: FSMContext, sessionmaker: async_sessionmaker):
+async def broadcast_send(callback: CallbackQuery, state: FSMContext, repo: Repo):
     await callback.answer()
     data = await state.get_data()
     text = (data.get("broadcast_text") or "").strip()
@@ -184,40 +262,32 @@ async def broadcast_send(callback: CallbackQuery, state: FSMContext, sessionmake
 
     await callback.message.edit_text("Запускаю рассылку...")
 
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        tg_ids = await repo.list_user_tg_ids()
+    tg_ids = await repo.list_user_tg_ids()
+    # рассылка идёт долго — не держим открытой читающую транзакцию
+    await repo.commit()
 
     sent = 0
     failed = 0
     failed_ids: list[int] = []
     skipped_self = 0
 
-    for tg_id in tg_ids:
-        if callback.from_user and tg_id == callback.from_user.id:
-            skipped_self += 1
-            continue
-        try:
-            await callback.bot.send_message(chat_id=tg_id, text=text)
-            sent += 1
-            await asyncio.sleep(0.03)
-        except TelegramRetryAfter as e:
-            await asyncio.sleep(float(e.retry_after) + 0.2)
+    with bulk_lane():
+        for tg_id in tg_ids:
+            if callback.from_user and tg_id == callback.from_user.id:
+                skipped_self += 1
+                continue
             try:
+                # темп и TelegramRetryAfter обрабатывает OutboundLimiter на сессии бота
                 await callback.bot.send_message(chat_id=tg_id, text=text)
                 sent += 1
+            except (TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest):
+                failed += 1
+                if len(failed_ids) < 20:
+                    failed_ids.append(tg_id)
             except Exception:
                 failed += 1
                 if len(failed_ids) < 20:
                     failed_ids.append(tg_id)
-        except (TelegramForbiddenError, TelegramBadRequest):
-            failed += 1
-            if len(failed_ids) < 20:
-                failed_ids.append(tg_id)
-        except Exception:
-            failed += 1
-            if len(failed_ids) < 20:
-                failed_ids.append(tg_id)
 
     await state.clear()
 
@@ -0,0 +1,251 @@
+# handlers/live.py
+from __future__ import annotations
+
+import asyncio
+import time
+from html import escape
+
+from aiogram import Bot, F, Router
+from aiogram.filters import BaseFilter, Command
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from db.repo import Repo
+from handlers.solve import OptionCB
+from services.live_quiz import (
+    DEFAULT_QUESTIONS,
+    DEFAULT_ROUND_SECONDS,
+    LOBBY_SECONDS,
+    LiveQuiz,
+    LiveRound,
+    fan_out,
+    live_quizzes,
+)
+
+# router — участники (вход, ответы); admin_router — запуск/остановка (IsDbAdmin в app.py)
+router = Router()
+admin_router = Router()
+
+
+class LiveCB(CallbackData, prefix="live"):
+    action: str
+
+
+class LiveAnswer(BaseFilter):
+    """OptionCB, адресованный открытому раунду live-викторины."""
+
+    async def __call__(self, callback: CallbackQuery) -> bool:
+        quiz = live_quizzes.current
+        if quiz is None or quiz.round is None:
+            return False
+        try:
+            data = OptionCB.unpack(callback.data or "")
+        except (TypeError, ValueError):
+            return False
+        return quiz.accepts(callback.from_user.id, data.qid)
+
+
+def _letter(i: int) -> str:
+    return chr(ord("A") + i)
+
+
+def _round_markup(r: LiveRound) -> InlineKeyboardMarkup:
+    b = InlineKeyboardBuilder()
+    for i, o in enumerate(r.options):
+        b.button(text=f"{_letter(i)}) {o.text}", callback_data=OptionCB(qid=r.question.id, oid=o.id).pack())
+    b.adjust(1)
+    return b.as_markup()
+
+
+def _round_summary(quiz: LiveQuiz, r: LiveRound) -> str:
+    answered = sum(1 for chosen in r.answers.values() if chosen)
+    correct = r.correct_ids
+    lines = [f"📊 Вопрос {r.number}/{len(quiz.questions)}: итоги", escape(r.question.text), ""]
+    for i, o in enumerate(r.options):
+        n = r.counts.get(o.id, 0)
+        pct = round(n * 100 / answered) if answered else 0
+        mark = "✅" if o.id in correct else "▫️"
+        lines.append(f"{mark} {_letter(i)}) {escape(o.text)} — {n} ({pct}%)")
+    lines.append(f"\nОтветили: {answered} из {len(quiz.participants)}")
+    return "\n".join(lines)
+
+
+def _leaderboard(quiz: LiveQuiz) -> str:
+    top = quiz.leaderboard()
+    if not top:
+        return "Правильных ответов не было."
+    return "\n".join(
+        f"{n}. {escape(quiz.names.get(tg_id, str(tg_id)))} — {score}"
+        for n, (tg_id, score) in enumerate(top, start=1)
+    )
+
+
+async def _save_round(sessionmaker: async_sessionmaker, rows: list) -> None:
+    async with sessionmaker() as s:
+        await Repo(s).add_attempts_bulk(rows)
+
+
+async def _run_quiz(bot: Bot, sessionmaker: async_sessionmaker, quiz: LiveQuiz, invitees: list[int]) -> None:
+    try:
+        invite = InlineKeyboardBuilder()
+        invite.button(text="🙋 Участвую", callback_data=LiveCB(action="join").pack())
+        invite_markup = invite.as_markup()
+        invite_text = (
+            f"🎯 Live-викторина: {len(quiz.questions)} вопросов по {quiz.round_seconds} с.\n"
+            f"Старт через {LOBBY_SECONDS} с — жми «Участвую»."
+        )
+        sent, _gone = await fan_out(invitees, lambda c: bot.send_message(c, invite_text, reply_markup=invite_markup))
+        await bot.send_message(quiz.admin_chat_id, f"Приглашения: {sent}. Старт сразу: /live_go, отмена: /live_stop")
+
+        try:
+            await asyncio.wait_for(quiz.go.wait(), LOBBY_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        quiz.started = True
+        if not quiz.participants:
+            await bot.send_message(quiz.admin_chat_id, "Live-викторина: никто не присоединился.")
+            return
+
+        for number, q in enumerate(quiz.questions, start=1):
+            r = LiveRound(question=q, options=quiz.options.get(q.id, []), number=number)
+            # текст и клавиатура раунда одни на всех участников
+            hint = " (несколько ответов)" if q.qtype == "multi" else ""
+            text = f"🎯 Вопрос {number}/{len(quiz.questions)} · {quiz.round_seconds} с{hint}\n\n{escape(q.text)}"
+            markup = _round_markup(r)
+            # ответы принимаются с первой доставки, срок считается от последней
+            quiz.round = r
+            if q.image_file_id:
+                send = lambda c: bot.send_photo(c, q.image_file_id, caption=text, reply_markup=markup)
+            else:
+                send = lambda c: bot.send_message(c, text, reply_markup=markup)
+            await fan_out(list(quiz.participants), send)
+
+            r.start_timer(quiz.round_seconds)
+            await asyncio.sleep(max(0.0, r.closes_at - time.time()))
+
+            # все ответы раунда — одним INSERT; /live_stop отменяет задачу,
+            # но уже закрытый раунд должен дописаться
+            rows = quiz.close_round()
+            await asyncio.shield(_save_round(sessionmaker, rows))
+
+            summary = _round_summary(quiz, r)
+            correct = r.correct_ids
+
+            def personal(tg_id: int) -> str:
+                chosen = r.answers.get(tg_id)
+                if not chosen:
+                    return summary + "\n\nТы не ответил."
+                return summary + ("\n\nТы: ✅ верно" if chosen == correct else "\n\nТы: ❌ неверно")
+
+            await fan_out(list(quiz.participants), lambda c: bot.send_message(c, personal(c)))
+            await bot.send_message(quiz.admin_chat_id, summary)
+
+        final = "🏁 Викторина окончена!\n\n" + _leaderboard(quiz)
+        total = len(quiz.questions)
+        await fan_out(
+            list(quiz.participants),
+            lambda c: bot.send_message(c, final + f"\n\nТвой результат: {quiz.scores.get(c, 0)}/{total}"),
+        )
+        await bot.send_message(quiz.admin_chat_id, final)
+    finally:
+        if live_quizzes.current is quiz:
+            live_quizzes.stop()
+
+
+# ---------------- admin ----------------
+@admin_router.message(Command("live"))
+async def live_start(message: Message, repo: Repo, sessionmaker: async_sessionmaker):
+    # /live economics [вопросов] [секунд на вопрос]
+    parts = (message.text or "").split()
+    try:
+        code = parts[1]
+        n = int(parts[2]) if len(parts) > 2 else DEFAULT_QUESTIONS
+        seconds = int(parts[3]) if len(parts) > 3 else DEFAULT_ROUND_SECONDS
+    except (IndexError, ValueError):
+        await message.answer(
+            f"Использование: /live subject_code [вопросов={DEFAULT_QUESTIONS}] [секунд={DEFAULT_ROUND_SECONDS}]"
+        )
+        return
+    if live_quizzes.current is not None:
+        await message.answer("Викторина уже идёт. Остановить: /live_stop")
+        return
+
+    subj = await repo.get_subject_by_code(code)
+    if subj is None:
+        await message.answer("Subject не найден.")
+        return
+    questions = await repo.sample_question_rows(subj.id, None, None, max(1, min(n, 50)))
+    if not questions:
+        await message.answer("В предмете нет вопросов.")
+        return
+    options = await repo.option_rows_many([q.id for q in questions])
+    invitees = [tg for tg in await repo.list_user_tg_ids() if tg != message.from_user.id]
+    # викторина идёт минуты — не держим транзакцию апдейта
+    await repo.commit()
+
+    quiz = LiveQuiz(
+        admin_chat_id=message.chat.id,
+        questions=questions,
+        options=options,
+        round_seconds=max(5, min(seconds, 300)),
+    )
+    if not live_quizzes.start(quiz):
+        await message.answer("Викторина уже идёт. Остановить: /live_stop")
+        return
+    quiz.task = asyncio.create_task(_run_quiz(message.bot, sessionmaker, quiz, invitees))
+
+
+@admin_router.message(Command("live_go"))
+async def live_go(message: Message):
+    quiz = live_quizzes.current
+    if quiz is None or quiz.started:
+        await message.answer("Нет викторины в ожидании участников.")
+        return
+    quiz.go.set()
+
+
+@admin_router.message(Command("live_stop"))
+async def live_stop(message: Message, repo: Repo):
+    quiz = live_quizzes.stop()
+    if quiz is None:
+        await message.answer("Викторина не идёт.")
+        return
+    # ответы открытого раунда не теряем: закрываем его и пишем попытки
+    saved = 0
+    if quiz.round is not None and quiz.round.open:
+        rows = quiz.close_round()
+        if rows:
+            await repo.add_attempts_bulk(rows)
+            saved = len(rows)
+    await message.answer("Викторина остановлена." + (f" Ответов текущего раунда сохранено: {saved}." if saved else ""))
+
+
+# ---------------- participants ----------------
+@router.callback_query(LiveCB.filter(F.action == "join"))
+async def live_join(callback: CallbackQuery, repo: Repo):
+    quiz = live_quizzes.current
+    if quiz is None or quiz.started:
+        await callback.answer("Эта викторина уже началась или закончилась.")
+        return
+    user_id = await repo.resolve_user_id(
+        tg_id=callback.from_user.id,
+        full_name=callback.from_user.full_name or "-",
+        username=callback.from_user.username,
+    )
+    await repo.commit()
+    joined = quiz.join(callback.from_user.id, user_id, callback.from_user.full_name or "-")
+    await callback.answer("Ты в игре! Ждём старта." if joined else "Ты уже в игре.")
+
+
+@router.callback_query(OptionCB.filter(), LiveAnswer())
+async def live_answer(callback: CallbackQuery, callback_data: OptionCB):
+    # только счётчики в памяти — запись в БД при закрытии раунда
+    r = live_quizzes.current.round
+    chosen = r.toggle(callback.from_user.id, callback_data.oid)
+    if chosen is None:
+        await callback.answer("Такого варианта нет.")
+        return
+    letters = ", ".join(_letter(i) for i, o in enumerate(r.options) if o.id in chosen)
+    await callback.answer(f"Ответ: {letters}" if letters else "Ответ снят.")
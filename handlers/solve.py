@@ -1,20 +1,26 @@
 # handlers/solve.py
 from __future__ import annotations
 
+import random
+import time
 from dataclasses import dataclass
 from html import escape
-from typing import Iterable
+from typing import Iterable, NamedTuple
 
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.filters.callback_data import CallbackData
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InputMediaPhoto
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from sqlalchemy.ext.asyncio import async_sessionmaker
 
 from states import SolveSG
+from db.dto import OptionRow, QuestionRow
 from db.repo import Repo
+from utils.redraw import keyboard_redraws
+from utils.render_cache import RenderCache, catalog_keyboards, question_payloads
+from services.sheets import TEST_SIZE, TEST_TIME_LIMIT_SECONDS, format_clock, grade_sheet, seconds_left
 
 router = Router()
 
@@ -33,6 +39,13 @@ class OptionCB(CallbackData, prefix="opt"):
     oid: int
 
 
+class TestCB(CallbackData, prefix="tst"):
+    action: str  # pick / page / submit
+    qid: int | None = None
+    oid: int | None = None
+    page: int | None = None
+
+
 # ---------------- helpers ----------------
 def h(s: str) -> str:
     # безопасно при HTML parse_mode по умолчанию
@@ -46,42 +59,94 @@ def _kb_back_to_menu() -> InlineKeyboardBuilder:
     return b
 
 
-def _kb_subjects(subjects: list[tuple[int, str]]) -> InlineKeyboardBuilder:
+def _page_slice(items: list, page: int) -> tuple[list, int, int]:
+    # (элементы страницы, номер страницы в допустимых границах, всего страниц)
+    pages = max(1, -(-len(items) // PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+    return items[page * PAGE_SIZE:(page + 1) * PAGE_SIZE], page, pages
+
+
+def _add_page_nav(b: InlineKeyboardBuilder, action: str, page: int, pages: int, parent_id: int | None = None) -> int:
+    # ◀️ n/N ▶️ по кругу; возвращает сколько кнопок в ряду (0 — одна страница).
+    # Счётчик ничего не перелистывает; при двух страницах стрелка одна —
+    # обе вели бы на одну и ту же соседнюю страницу.
+    if pages <= 1:
+        return 0
+    if pages > 2 or page == 1:
+        b.button(text="◀️", callback_data=SolveCB(action=action, id=parent_id, page=(page - 1) % pages).pack())
+    b.button(text=f"{page + 1}/{pages}", callback_data=SolveCB(action="noop").pack())
+    if pages > 2 or page == 0:
+        b.button(text="▶️", callback_data=SolveCB(action=action, id=parent_id, page=(page + 1) % pages).pack())
+    return 3 if pages > 2 else 2
+
+
+def _kb_subjects(subjects: list[tuple[int, str]], page: int = 0) -> InlineKeyboardBuilder:
     b = InlineKeyboardBuilder()
-    for sid, name in subjects:
+    chunk, page, pages = _page_slice(subjects, page)
+    for sid, name in chunk:
         b.button(text=name, callback_data=SolveCB(action="pick_subject", id=sid).pack())
+    nav = _add_page_nav(b, "subjects_page", page, pages)
     b.button(text="↩️ В меню", callback_data=SolveCB(action="back_menu").pack())
-    b.adjust(1)
+    b.adjust(*([1] * len(chunk)), *([nav] if nav else []), 1)
     return b
 
 
-def _kb_topics(topics: list[tuple[int, str]]) -> InlineKeyboardBuilder:
+def _kb_topics(topics: list[tuple[int, str]], page: int = 0, subject_id: int | None = None) -> InlineKeyboardBuilder:
     b = InlineKeyboardBuilder()
-    for tid, name in topics:
+    chunk, page, pages = _page_slice(topics, page)
+    for tid, name in chunk:
         b.button(text=name, callback_data=SolveCB(action="pick_topic", id=tid).pack())
+    nav = _add_page_nav(b, "topics_page", page, pages, subject_id)
     b.button(text="↩️ В меню", callback_data=SolveCB(action="back_menu").pack())
-    b.adjust(1)
+    b.adjust(*([1] * len(chunk)), *([nav] if nav else []), 1)
     return b
 
 
+async def _subjects_markup(repo: Repo, page: int = 0) -> InlineKeyboardMarkup | None:
+    # готовая клавиатура страницы из кэша; None — предметов нет
+    key = RenderCache.key("subjects", 0, page)
+    kb = catalog_keyboards.get(key)
+    if kb is None:
+        subjects = await repo.subject_rows()
+        if not subjects:
+            return None
+        kb = catalog_keyboards.put(key, _kb_subjects([(x.id, x.name) for x in subjects], page).as_markup())
+    return kb
+
+
+async def _topics_markup(repo: Repo, subject_id: int, page: int = 0) -> InlineKeyboardMarkup | None:
+    key = RenderCache.key("topics", subject_id, page)
+    kb = catalog_keyboards.get(key)
+    if kb is None:
+        topics = await repo.topic_rows(subject_id)
+        if not topics:
+            return None
+        kb = catalog_keyboards.put(key, _kb_topics([(t.id, t.name) for t in topics], page, subject_id).as_markup())
+    return kb
+
+
 def _kb_subtopics_mode() -> InlineKeyboardBuilder:
     b = InlineKeyboardBuilder()
     b.button(text="✅ Все подтемы", callback_data=SolveCB(action="sub_all").pack())
     b.button(text="🎯 Выбрать подтемы", callback_data=SolveCB(action="sub_pick").pack())
+    b.button(text=f"📝 Тест: {TEST_SIZE} вопросов", callback_data=SolveCB(action="test_all").pack())
     b.button(text="↩️ Назад к темам", callback_data=SolveCB(action="back_topics").pack())
     b.adjust(1)
     return b
 
 
-def _kb_subtopics_picker(subtopics: list[tuple[int, str]], selected: set[int]) -> InlineKeyboardBuilder:
+def _kb_subtopics_picker(subtopics: list[tuple[int, str]], selected: set[int], page: int = 0) -> InlineKeyboardBuilder:
     b = InlineKeyboardBuilder()
-    for stid, name in subtopics:
+    chunk, page, pages = _page_slice(subtopics, page)
+    for stid, name in chunk:
         mark = "☑" if stid in selected else "☐"
         b.button(text=f"{mark} {name}", callback_data=SolveCB(action="toggle_sub", id=stid).pack())
+    nav = _add_page_nav(b, "subs_page", page, pages)
 
     b.button(text="🚀 Начать", callback_data=SolveCB(action="start_session").pack())
+    b.button(text="📝 Тест по выбранным", callback_data=SolveCB(action="test_start").pack())
     b.button(text="↩️ Назад к темам", callback_data=SolveCB(action="back_topics").pack())
-    b.adjust(1)
+    b.adjust(*([1] * len(chunk)), *([nav] if nav else []), 1)
     return b
 
 
@@ -103,6 +168,30 @@ def _kb_multi_options(qid: int, options: list[tuple[int, str]], selected: set[in
     return b
 
 
+class QuestionPayload(NamedTuple):
+    question: QuestionRow
+    options: list[OptionRow]
+    markup: InlineKeyboardMarkup  # single — варианты; multi — ничего не выбрано
+
+
+async def _question_payload(repo: Repo, qid: int) -> QuestionPayload | None:
+    # вопрос + варианты + клавиатура собираются один раз на версию каталога
+    key = RenderCache.key(qid)
+    payload = question_payloads.get(key)
+    if payload is None:
+        q = await repo.question_row(qid)
+        if q is None:
+            return None
+        opts = await repo.option_rows(qid)
+        options_tuple = [(o.id, o.text) for o in opts]
+        if q.qtype == "multi":
+            kb = _kb_multi_options(qid, options_tuple, set()).as_markup()
+        else:
+            kb = _kb_single_options(qid, options_tuple).as_markup()
+        payload = question_payloads.put(key, QuestionPayload(q, opts, kb))
+    return payload
+
+
 def _kb_session_controls() -> InlineKeyboardBuilder:
     b = InlineKeyboardBuilder()
     b.button(text="➡️ Следующий", callback_data=SolveCB(action="next").pack())
@@ -112,37 +201,38 @@ def _kb_session_controls() -> InlineKeyboardBuilder:
 
 
 async def _send_or_edit(callback: CallbackQuery, text: str, reply_markup):
-    # Практичная обёртка: если edit_text падает — шлём новым сообщением
+    # Практичная обёртка: если edit_text падает — шлём новым сообщением.
+    # "message is not modified" — не ошибка: на экране уже то, что нужно.
+    keyboard_redraws.cancel(callback.message.chat.id, callback.message.message_id)
     try:
         await callback.message.edit_text(text, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if "not modified" not in str(e):
+            await callback.message.answer(text, reply_markup=reply_markup)
     except Exception:
         await callback.message.answer(text, reply_markup=reply_markup)
 
 
 # ---------------- entry points ----------------
 @router.message(Command("solve"))
-async def solve_cmd(message: Message, state: FSMContext, sessionmaker: async_sessionmaker):
+async def solve_cmd(message: Message, state: FSMContext, repo: Repo):
     await state.clear()
     await state.set_state(SolveSG.choose_subject)
 
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        subjects = await repo.get_subjects()
+    kb = await _subjects_markup(repo)
 
-    if not subjects:
+    if kb is None:
         await message.answer("Пока нет предметов в базе. Обратись к администратору.")
         return
 
-    items = [(x.id, x.name) for x in subjects]
-    kb = _kb_subjects(items).as_markup()
     await message.answer("Шаг 0: выбери предмет:", reply_markup=kb)
 
 
 @router.callback_query(SolveCB.filter(F.action == "solve_entry"))
-async def solve_entry_callback(callback: CallbackQuery, state: FSMContext, sessionmaker: async_sessionmaker):
+async def solve_entry_callback(callback: CallbackQuery, state: FSMContext, repo: Repo):
     # если у тебя в меню кнопка ведёт сюда
     await callback.answer()
-    await solve_cmd(Message.model_validate(callback.message.model_dump()), state, sessionmaker)  # безопасно переиспользовать
+    await solve_cmd(Message.model_validate(callback.message.model_dump()), state, repo)  # безопасно переиспользовать
     # примечание: если PyCharm ругнётся на model_validate, скажи — дам версию без этого трюка.
 
 
@@ -155,58 +245,88 @@ async def back_menu(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(SolveCB.filter(F.action == "back_topics"))
-async def back_topics(callback: CallbackQuery, state: FSMContext, sessionmaker: async_sessionmaker):
+async def back_topics(callback: CallbackQuery, state: FSMContext, repo: Repo):
     await callback.answer()
     data = await state.get_data()
     subject_id = data.get("subject_id")
     if not subject_id:
-        await solve_cmd(Message.model_validate(callback.message.model_dump()), state, sessionmaker)
+        await solve_cmd(Message.model_validate(callback.message.model_dump()), state, repo)
         return
 
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        topics = await repo.get_topics(subject_id)
+    kb = await _topics_markup(repo, subject_id)
 
-    items = [(t.id, t.name) for t in topics]
     await state.set_state(SolveSG.choose_topic)
-    await _send_or_edit(callback, "Шаг 1: выбери тему:", _kb_topics(items).as_markup())
+    await _send_or_edit(callback, "Шаг 1: выбери тему:", kb)
+
+
+# ---------------- pagination ----------------
+@router.callback_query(SolveCB.filter(F.action == "noop"))
+async def noop(callback: CallbackQuery):
+    # счётчик страниц "n/N": только гасим часики на кнопке
+    await callback.answer()
+
+
+@router.callback_query(SolveCB.filter(F.action == "subjects_page"))
+async def subjects_page(callback: CallbackQuery, callback_data: SolveCB, repo: Repo):
+    await callback.answer()
+    kb = await _subjects_markup(repo, callback_data.page or 0)
+    if kb is not None:
+        await _send_or_edit(callback, "Шаг 0: выбери предмет:", kb)
+
+
+@router.callback_query(SolveCB.filter(F.action == "topics_page"))
+async def topics_page(callback: CallbackQuery, callback_data: SolveCB, repo: Repo):
+    await callback.answer()
+    if callback_data.id is None:
+        return
+    kb = await _topics_markup(repo, callback_data.id, callback_data.page or 0)
+    if kb is not None:
+        await _send_or_edit(callback, "Шаг 1: выбери тему:", kb)
+
+
+@router.callback_query(SolveCB.filter(F.action == "subs_page"))
+async def subs_page(callback: CallbackQuery, callback_data: SolveCB, state: FSMContext):
+    await callback.answer()
+    data = await state.get_data()
+    subtopics_all: list[tuple[int, str]] = data.get("subtopics_all") or []
+    selected: set[int] = set(data.get("selected_subtopic_ids") or set())
+    page = callback_data.page or 0
+
+    await state.update_data(subtopics_page=page)
+    await _send_or_edit(callback, "Шаг 3: выбери подтемы (можно несколько):", _kb_subtopics_picker(subtopics_all, selected, page).as_markup())
 
 
 # ---------------- subject -> topic ----------------
 @router.callback_query(SolveCB.filter(F.action == "pick_subject"))
-async def pick_subject(callback: CallbackQuery, callback_data: SolveCB, state: FSMContext, sessionmaker: async_sessionmaker):
+async def pick_subject(callback: CallbackQuery, callback_data: SolveCB, state: FSMContext, repo: Repo):
     await callback.answer()
     subject_id = callback_data.id
     await state.update_data(subject_id=subject_id)
 
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        topics = await repo.get_topics(subject_id)
+    kb = await _topics_markup(repo, subject_id)
 
-    if not topics:
+    if kb is None:
         await callback.message.answer("Для этого предмета нет тем. Обратись к администратору.")
         return
 
-    items = [(t.id, t.name) for t in topics]
     await state.set_state(SolveSG.choose_topic)
-    await _send_or_edit(callback, "Шаг 1: выбери тему:", _kb_topics(items).as_markup())
+    await _send_or_edit(callback, "Шаг 1: выбери тему:", kb)
 
 
 # ---------------- topic -> subtopic mode ----------------
 @router.callback_query(SolveCB.filter(F.action == "pick_topic"))
-async def pick_topic(callback: CallbackQuery, callback_data: SolveCB, state: FSMContext, sessionmaker: async_sessionmaker):
+async def pick_topic(callback: CallbackQuery, callback_data: SolveCB, state: FSMContext, repo: Repo):
     await callback.answer()
     topic_id = callback_data.id
     await state.update_data(topic_id=topic_id)
 
     # подтемы могут быть пустыми — тогда пропускаем к старту сразу
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        subtopics = await repo.get_subtopics(topic_id)
+    subtopics = await repo.subtopic_rows(topic_id)
 
     await state.update_data(
         subtopics_all=[(st.id, st.name) for st in subtopics],
         selected_subtopic_ids=set(),
+        subtopics_page=0,
         session_total=0,
         session_correct=0,
     )
@@ -218,19 +338,19 @@ async def pick_topic(callback: CallbackQuery, callback_data: SolveCB, state: FSM
         await state.update_data(subtopic_ids=[])
         await state.set_state(SolveSG.solving)
         await callback.message.answer("Подтем нет — начинаю сессию.")
-        await _send_next_question(callback, state, sessionmaker)
+        await _send_next_question(callback, state, repo)
         return
 
     await _send_or_edit(callback, "Шаг 2: подтемы. Что выбираем?", _kb_subtopics_mode().as_markup())
 
 
 @router.callback_query(SolveCB.filter(F.action == "sub_all"))
-async def sub_all(callback: CallbackQuery, state: FSMContext, sessionmaker: async_sessionmaker):
+async def sub_all(callback: CallbackQuery, state: FSMContext, repo: Repo):
     await callback.answer()
     await state.update_data(subtopic_ids=[])  # пусто => все
     await state.set_state(SolveSG.solving)
     await _send_or_edit(callback, "Ок. Беру все подтемы. Начинаю.", reply_markup=None)
-    await _send_next_question(callback, state, sessionmaker)
+    await _send_next_question(callback, state, repo)
 
 
 @router.callback_query(SolveCB.filter(F.action == "sub_pick"))
@@ -240,8 +360,10 @@ async def sub_pick(callback: CallbackQuery, state: FSMContext):
     subtopics_all: list[tuple[int, str]] = data.get("subtopics_all") or []
     selected: set[int] = set(data.get("selected_subtopic_ids") or set())
 
+    page = int(data.get("subtopics_page") or 0)
+
     await state.set_state(SolveSG.choose_subtopics)
-    await _send_or_edit(callback, "Шаг 3: выбери подтемы (можно несколько):", _kb_subtopics_picker(subtopics_all, selected).as_markup())
+    await _send_or_edit(callback, "Шаг 3: выбери подтемы (можно несколько):", _kb_subtopics_picker(subtopics_all, selected, page).as_markup())
 
 
 @router.callback_query(SolveCB.filter(F.action == "toggle_sub"))
@@ -259,11 +381,13 @@ async def toggle_sub(callback: CallbackQuery, callback_data: SolveCB, state: FSM
         selected.add(stid)
 
     await state.update_data(selected_subtopic_ids=selected)
-    await callback.message.edit_reply_markup(reply_markup=_kb_subtopics_picker(subtopics_all, selected).as_markup())
+    # частые тапы склеиваются в одну перерисовку
+    page = int(data.get("subtopics_page") or 0)
+    keyboard_redraws.schedule(callback.message, _kb_subtopics_picker(subtopics_all, selected, page).as_markup())
 
 
 @router.callback_query(SolveCB.filter(F.action == "start_session"))
-async def start_session(callback: CallbackQuery, state: FSMContext, sessionmaker: async_sessionmaker):
+async def start_session(callback: CallbackQuery, state: FSMContext, repo: Repo):
     await callback.answer()
     data = await state.get_data()
     selected: set[int] = set(data.get("selected_subtopic_ids") or set())
@@ -274,43 +398,39 @@ async def start_session(callback: CallbackQuery, state: FSMContext, sessionmaker
     await state.update_data(subtopic_ids=sorted(selected))
     await state.set_state(SolveSG.solving)
     await _send_or_edit(callback, "Начинаю сессию.", reply_markup=None)
-    await _send_next_question(callback, state, sessionmaker)
+    await _send_next_question(callback, state, repo)
 
 
 # ---------------- core: send question ----------------
-async def _send_next_question(callback: CallbackQuery, state: FSMContext, sessionmaker: async_sessionmaker):
+async def _send_next_question(callback: CallbackQuery, state: FSMContext, repo: Repo):
     data = await state.get_data()
     subject_id = data["subject_id"]
     topic_id = data["topic_id"]
     subtopic_ids = data.get("subtopic_ids") or None  # None/[] => все
 
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        user = await repo.get_or_create_user(tg_id=callback.from_user.id)
-        qid = await repo.pick_next_question_id(
-            user_id=user.id,
-            subject_id=subject_id,
-            topic_id=topic_id,
-            subtopic_ids=subtopic_ids,
-        )
+    user_id = await repo.resolve_user_id(tg_id=callback.from_user.id)
+    await repo.commit()  # новый пользователь: не держать запись, пока шлём вопрос
+    qid = await repo.next_question_id(
+        user_id=user_id,
+        subject_id=subject_id,
+        topic_id=topic_id,
+        subtopic_ids=subtopic_ids,
+    )
 
-        if qid is None:
-            await state.clear()
-            await callback.message.answer("Вопросы закончились (или всё недавно решено). Попробуй другую тему/подтемы.")
-            return
+    if qid is None:
+        await state.clear()
+        await callback.message.answer("Вопросы закончились (или всё недавно решено). Попробуй другую тему/подтемы.")
+        return
 
-        q = await repo.get_question(qid)
-        opts = await repo.get_options(qid)
+    payload = await _question_payload(repo, qid)
+    if payload is None:
+        await state.clear()
+        await callback.message.answer("Вопрос недоступен. Начни заново: /solve")
+        return
+    q, kb = payload.question, payload.markup
 
     await state.update_data(current_qid=qid, selected_option_ids=set())
 
-    options_tuple = [(o.id, o.text) for o in opts]
-
-    if q.qtype == "multi":
-        kb = _kb_multi_options(qid, options_tuple, set()).as_markup()
-    else:
-        kb = _kb_single_options(qid, options_tuple).as_markup()
-
     # Не используем HTML-теги, чтобы не ловить parse errors на <...>
     text = q.text
 
@@ -322,7 +442,7 @@ async def _send_next_question(callback: CallbackQuery, state: FSMContext, sessio
 
 # ---------------- answering: options click ----------------
 @router.callback_query(OptionCB.filter())
-async def on_option_click(callback: CallbackQuery, callback_data: OptionCB, state: FSMContext, sessionmaker: async_sessionmaker):
+async def on_option_click(callback: CallbackQuery, callback_data: OptionCB, state: FSMContext, repo: Repo):
     await callback.answer()
     data = await state.get_data()
     current_qid = data.get("current_qid")
@@ -331,20 +451,20 @@ async def on_option_click(callback: CallbackQuery, callback_data: OptionCB, stat
         await callback.answer("Этот вопрос уже неактуален.", show_alert=False)
         return
 
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        q = await repo.get_question(current_qid)
-        opts = await repo.get_options(current_qid)
+    payload = await _question_payload(repo, current_qid)
+    if payload is None:
+        return
+    q, opts = payload.question, payload.options
 
     if q.qtype == "single":
         chosen = [callback_data.oid]
 
-        async with sessionmaker() as s:
-            repo = Repo(s)
-            user = await repo.get_or_create_user(tg_id=callback.from_user.id)
-            correct_ids = await repo.get_correct_option_ids(current_qid)
-            is_correct = set(chosen) == correct_ids
-            await repo.add_attempt(user.id, current_qid, is_correct, chosen)
+        user_id = await repo.resolve_user_id(tg_id=callback.from_user.id)
+        correct_ids = {o.id for o in opts if o.is_correct}
+        is_correct = set(chosen) == correct_ids
+        await repo.add_attempt(user_id, current_qid, is_correct, chosen)
+        # фиксируем до ответа в Telegram, чтобы не держать транзакцию на время сетевого вызова
+        await repo.commit()
 
         total = int(data.get("session_total", 0)) + 1
         correct = int(data.get("session_correct", 0)) + (1 if is_correct else 0)
@@ -368,13 +488,11 @@ async def on_option_click(callback: CallbackQuery, callback_data: OptionCB, stat
     await state.update_data(selected_option_ids=selected)
 
     options_tuple = [(o.id, o.text) for o in opts]
-    await callback.message.edit_reply_markup(
-        reply_markup=_kb_multi_options(current_qid, options_tuple, selected).as_markup()
-    )
+    keyboard_redraws.schedule(callback.message, _kb_multi_options(current_qid, options_tuple, selected).as_markup())
 
 
 @router.callback_query(SolveCB.filter(F.action == "submit_multi"))
-async def submit_multi(callback: CallbackQuery, state: FSMContext, sessionmaker: async_sessionmaker):
+async def submit_multi(callback: CallbackQuery, state: FSMContext, repo: Repo):
     await callback.answer()
     data = await state.get_data()
     qid = data.get("current_qid")
@@ -386,14 +504,13 @@ async def submit_multi(callback: CallbackQuery, state: FSMContext, sessionmaker:
         await callback.answer("Выбери хотя бы один вариант.", show_alert=False)
         return
 
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        user = await repo.get_or_create_user(tg_id=callback.from_user.id)
-        correct_ids = await repo.get_correct_option_ids(qid)
-        q = await repo.get_question(qid)
+    user_id = await repo.resolve_user_id(tg_id=callback.from_user.id)
+    correct_ids = await repo.get_correct_option_ids(qid)
+    q = await repo.question_row(qid)
 
-        is_correct = selected == correct_ids
-        await repo.add_attempt(user.id, qid, is_correct, sorted(selected))
+    is_correct = selected == correct_ids
+    await repo.add_attempt(user_id, qid, is_correct, sorted(selected))
+    await repo.commit()
 
     total = int(data.get("session_total", 0)) + 1
     correct = int(data.get("session_correct", 0)) + (1 if is_correct else 0)
@@ -409,9 +526,9 @@ async def submit_multi(callback: CallbackQuery, state: FSMContext, sessionmaker:
 
 # ---------------- session controls ----------------
 @router.callback_query(SolveCB.filter(F.action == "next"))
-async def next_q(callback: CallbackQuery, state: FSMContext, sessionmaker: async_sessionmaker):
+async def next_q(callback: CallbackQuery, state: FSMContext, repo: Repo):
     await callback.answer()
-    await _send_next_question(callback, state, sessionmaker)
+    await _send_next_question(callback, state, repo)
 
 
 @router.callback_query(SolveCB.filter(F.action == "stop"))
@@ -424,3 +541,210 @@ async def stop_session(callback: CallbackQuery, state: FSMContext):
     await callback.message.answer(f"Сессия завершена.\nРешено: {total}\nВерно: {correct}")
 
 
+
+
+# ---------------- test mode: лист из N вопросов, сдаётся целиком ----------------
+def _kb_test_page(qid: int, qtype: str, options: list[tuple[int, str]], chosen: set[int], page: int, total: int) -> InlineKeyboardBuilder:
+    b = InlineKeyboardBuilder()
+    for oid, txt in options:
+        if qtype == "multi":
+            mark = "☑" if oid in chosen else "☐"
+        else:
+            mark = "🔘" if oid in chosen else "⚪"
+        b.button(text=f"{mark} {txt}", callback_data=TestCB(action="pick", qid=qid, oid=oid, page=page).pack())
+    b.button(text="◀️", callback_data=TestCB(action="page", page=(page - 1) % total).pack())
+    b.button(text=f"{page + 1}/{total}", callback_data=TestCB(action="page", page=page).pack())
+    b.button(text="▶️", callback_data=TestCB(action="page", page=(page + 1) % total).pack())
+    b.button(text="🏁 Сдать лист", callback_data=TestCB(action="submit").pack())
+    b.adjust(*([1] * len(options)), 3, 1)
+    return b
+
+
+def _short(s: str, limit: int = 40) -> str:
+    return s if len(s) <= limit else s[: limit - 1] + "…"
+
+
+async def _render_test_page(callback: CallbackQuery, state: FSMContext, repo: Repo, page: int):
+    data = await state.get_data()
+    qids: list[int] = data["test_qids"]
+    answers: dict[str, list[int]] = data.get("test_answers") or {}
+    page = page % len(qids)
+    qid = qids[page]
+
+    q = await repo.question_row(qid)
+    opts = await repo.option_rows(qid)
+    await state.update_data(test_page=page)
+    if q is None:
+        # вопрос удалили после генерации варианта — в счёт не идёт ответом
+        q = QuestionRow(qid, 0, 0, None, "Вопрос удалён из базы — переходи к следующему.", None, "single", "")
+
+    left = seconds_left(data["test_deadline"], time.time())
+    clock = f"осталось {format_clock(left)}" if left else "время вышло — сдай лист"
+    text = (
+        f"📝 Тест · вопрос {page + 1}/{len(qids)} · {clock}\n"
+        f"Отмечено ответов: {len(answers)}/{len(qids)}\n\n"
+        f"{q.text}"
+    )
+    kb = _kb_test_page(qid, q.qtype, [(o.id, o.text) for o in opts], set(answers.get(str(qid), [])), page, len(qids))
+    await _send_or_edit_page(callback, text, kb.as_markup(), q.image_file_id)
+
+
+async def _send_or_edit_page(callback: CallbackQuery, text: str, reply_markup, photo: str | None):
+    # страница листа — текст или фото с подписью, как в тренировке. Сменить
+    # тип сообщения Telegram не даёт: тогда старое удаляем и шлём новое
+    msg = callback.message
+    keyboard_redraws.cancel(msg.chat.id, msg.message_id)
+    try:
+        if photo and msg.photo:
+            await msg.edit_media(InputMediaPhoto(media=photo, caption=text), reply_markup=reply_markup)
+            return
+        if not photo and not msg.photo:
+            await msg.edit_text(text, reply_markup=reply_markup)
+            return
+    except Exception:
+        pass
+    try:
+        await msg.delete()
+    except Exception:
+        pass  # старше 48 часов — просто остаётся в чате
+    if photo:
+        await msg.answer_photo(photo, caption=text, reply_markup=reply_markup)
+    else:
+        await msg.answer(text, reply_markup=reply_markup)
+
+
+async def _begin_sheet(callback: CallbackQuery, state: FSMContext, repo: Repo, qids: list[int]):
+    await state.update_data(
+        test_qids=qids,
+        test_answers={},
+        test_page=0,
+        test_started=time.time(),
+        test_deadline=time.time() + TEST_TIME_LIMIT_SECONDS,
+    )
+    await state.set_state(SolveSG.testing)
+    await _render_test_page(callback, state, repo, 0)
+
+
+async def _start_test(callback: CallbackQuery, state: FSMContext, repo: Repo, subtopic_ids: list[int]):
+    data = await state.get_data()
+    questions = await repo.sample_question_rows(data["subject_id"], data["topic_id"], subtopic_ids or None, TEST_SIZE)
+    if not questions:
+        await callback.message.answer("В выбранных подтемах нет вопросов.")
+        return
+    await state.update_data(subtopic_ids=subtopic_ids)
+    await _begin_sheet(callback, state, repo, [q.id for q in questions])
+
+
+@router.callback_query(SolveCB.filter(F.action == "test_all"))
+async def test_all(callback: CallbackQuery, state: FSMContext, repo: Repo):
+    await callback.answer()
+    await _start_test(callback, state, repo, [])
+
+
+@router.callback_query(SolveCB.filter(F.action == "test_start"))
+async def test_start(callback: CallbackQuery, state: FSMContext, repo: Repo):
+    data = await state.get_data()
+    selected: set[int] = set(data.get("selected_subtopic_ids") or set())
+    if not selected:
+        await callback.answer("Выбери хотя бы одну подтему или вернись и выбери «Все подтемы».", show_alert=False)
+        return
+    await callback.answer()
+    await _start_test(callback, state, repo, sorted(selected))
+
+
+@router.callback_query(SolveSG.testing, TestCB.filter(F.action == "page"))
+async def test_page(callback: CallbackQuery, callback_data: TestCB, state: FSMContext, repo: Repo):
+    await callback.answer()
+    data = await state.get_data()
+    if callback_data.page == data.get("test_page"):
+        return  # кнопка «3/10» — страница уже открыта
+    await _render_test_page(callback, state, repo, callback_data.page or 0)
+
+
+@router.callback_query(SolveSG.testing, TestCB.filter(F.action == "pick"))
+async def test_pick(callback: CallbackQuery, callback_data: TestCB, state: FSMContext, repo: Repo):
+    data = await state.get_data()
+    if callback_data.qid not in data["test_qids"]:
+        await callback.answer("Этот лист уже неактуален.", show_alert=False)
+        return
+    if not seconds_left(data["test_deadline"], time.time()):
+        await callback.answer("Время вышло — сдай лист.", show_alert=False)
+        return
+    await callback.answer()
+
+    q = await repo.question_row(callback_data.qid)
+    if q is None:
+        return
+    answers: dict[str, list[int]] = dict(data.get("test_answers") or {})
+    key = str(callback_data.qid)
+    chosen = set(answers.get(key, []))
+    if q.qtype == "multi":
+        chosen ^= {callback_data.oid}
+    else:
+        chosen = set() if chosen == {callback_data.oid} else {callback_data.oid}
+    if chosen:
+        answers[key] = sorted(chosen)
+    else:
+        answers.pop(key, None)
+
+    await state.update_data(test_answers=answers)
+    await _render_test_page(callback, state, repo, callback_data.page or 0)
+
+
+@router.callback_query(SolveSG.testing, TestCB.filter(F.action == "submit"))
+async def test_submit(callback: CallbackQuery, state: FSMContext, repo: Repo):
+    await callback.answer()
+    data = await state.get_data()
+    qids: list[int] = data["test_qids"]
+    answers = {int(k): v for k, v in (data.get("test_answers") or {}).items()}
+
+    # ключ всего листа — одним запросом, попытки — одним INSERT
+    options = await repo.option_rows_many(qids)
+    result = grade_sheet(qids, answers, options)
+    user_id = await repo.resolve_user_id(tg_id=callback.from_user.id)
+    await repo.add_attempts(user_id, result.attempts)
+    await repo.commit()
+    await state.clear()
+
+    spent = int(time.time() - data["test_started"])
+    lines = [
+        f"🏁 Тест сдан: {result.correct}/{len(qids)}",
+        f"Отвечено: {result.answered}/{len(qids)} · время {format_clock(min(spent, 99 * 60 + 59))}",
+        "",
+    ]
+    for n, item in enumerate(result.items, start=1):
+        if item.is_correct:
+            lines.append(f"{n}. ✅")
+        else:
+            texts = {o.id: o.text for o in options.get(item.question_id, [])}
+            right = "; ".join(_short(texts.get(i, "?")) for i in item.correct_ids)
+            mark = "—" if not item.chosen else "❌"
+            lines.append(f"{n}. {mark} верно: {right}")
+    await _send_or_edit(callback, "\n".join(lines), reply_markup=None)
+
+
+# ---------------- exams: готовый вариант по шаблону (services/selection.py) ----------------
+@router.message(Command("exam"))
+async def exam_cmd(message: Message, state: FSMContext, repo: Repo):
+    await state.clear()
+    blueprints = await repo.list_blueprints(ready_only=True)
+    if not blueprints:
+        await message.answer("Экзаменов пока нет.")
+        return
+    b = InlineKeyboardBuilder()
+    for bp in blueprints:
+        b.button(text=f"🎓 {bp.name}", callback_data=SolveCB(action="exam", id=bp.id).pack())
+    b.adjust(1)
+    await message.answer("Выбери экзамен:", reply_markup=b.as_markup())
+
+
+@router.callback_query(SolveCB.filter(F.action == "exam"))
+async def exam_start(callback: CallbackQuery, callback_data: SolveCB, state: FSMContext, repo: Repo):
+    await callback.answer()
+    # старт — один поиск готового варианта, без случайных выборок по пулу
+    qids = await repo.pick_exam_variant(callback_data.id, random.randrange(2**31))
+    if not qids:
+        await callback.message.answer("Для этого экзамена нет вариантов.")
+        return
+    await state.clear()
+    await _begin_sheet(callback, state, repo, qids)
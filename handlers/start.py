@@ -4,7 +4,6 @@ from aiogram import Router
 from aiogram.filters import CommandStart
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
-from sqlalchemy.ext.asyncio import async_sessionmaker
 
 from db.repo import Repo
 from keyboards.menu import main_menu_kb
@@ -16,17 +15,16 @@ router = Router()
 async def start_cmd(
     message: Message,
     state: FSMContext,
-    sessionmaker: async_sessionmaker,
+    repo: Repo,
 ):
     await state.clear()
 
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        await repo.get_or_create_user(
-            tg_id=message.from_user.id,
-            full_name=message.from_user.full_name or "-",
-            username=message.from_user.username,
-        )
+    await repo.resolve_user_id(
+        tg_id=message.from_user.id,
+        full_name=message.from_user.full_name or "-",
+        username=message.from_user.username,
+    )
+    await repo.commit()  # upsert пользователя — фиксируем до отправки ответа
 
     await message.answer(
         "Привет 👋\n\nВыбери действие:",
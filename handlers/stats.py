@@ -1,25 +1,55 @@
 
+import logging
+
 from aiogram import Router, F
-from aiogram.types import CallbackQuery
-from sqlalchemy.ext.asyncio import async_sessionmaker
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import CallbackQuery, Message
 from aiogram.types.input_file import BufferedInputFile
 
 from utils.callback_data import MenuCB
 from db.repo import Repo
-from services.stats_graphs import bar_topics_png
+from services.stats_graphs import ChartQueueFull, chart_renderer
 from keyboards.common import main_menu_kb
 
 router = Router()
 
+log = logging.getLogger(__name__)
+
+
+async def send_topics_chart(message: Message, pairs: list[tuple[str, int]]) -> None:
+    caption = chart_renderer.caption(pairs)
+    key = chart_renderer.key(pairs)
+
+    # тот же график уже загружался — шлём по file_id без повторной загрузки PNG
+    file_id = chart_renderer.file_id(key)
+    if file_id:
+        try:
+            await message.answer_photo(file_id, caption=caption)
+            return
+        except TelegramBadRequest:
+            chart_renderer.forget_file_id(key)
+
+    try:
+        png = await chart_renderer.render(pairs, key=key)
+    except ChartQueueFull:
+        log.warning("Chart queue is full, skipping topics chart")
+        return
+
+    sent = await message.answer_photo(
+        BufferedInputFile(png, filename="topics.png"),
+        caption=caption,
+    )
+    if sent.photo:
+        chart_renderer.remember_file_id(key, sent.photo[-1].file_id)
+
 @router.callback_query(MenuCB.filter(F.action == "stats"))
-async def stats(callback: CallbackQuery, sessionmaker: async_sessionmaker):
+async def stats(callback: CallbackQuery, repo: Repo):
     await callback.answer()
 
-    async with sessionmaker() as s:
-        repo = Repo(s)
-        user = await repo.get_or_create_user(tg_id=callback.from_user.id)
-        total, correct = await repo.user_totals(user.id)
-        pairs = await repo.solved_by_topic(user.id, limit=12)
+    user_id = await repo.resolve_user_id(tg_id=callback.from_user.id)
+    await repo.commit()
+    total, correct = await repo.user_totals(user_id)
+    pairs = await repo.solved_by_topic(user_id, limit=12)
 
     acc = (correct / total * 100.0) if total else 0.0
     text = f"Статистика:\nВсего решено: {total}\nВерно: {correct}\nТочность: {acc:.1f}%"
@@ -27,10 +57,6 @@ async def stats(callback: CallbackQuery, sessionmaker: async_sessionmaker):
     await callback.message.edit_text(text, reply_markup=main_menu_kb())
 
     if pairs:
-        png = bar_topics_png(pairs)
-        await callback.message.answer_photo(
-            BufferedInputFile(png, filename="topics.png"),
-            caption="Решено по темам (топ)",
-        )
+        await send_topics_chart(callback.message, pairs)
 
 
@@ -0,0 +1,184 @@
+"""Лёгкий рендер столбчатой диаграммы без matplotlib.
+
+PNG рисуется растеризатором на bytearray (палитра, 8 бит на пиксель) и
+кодируется через zlib. Текста в PNG нет, кроме цифр (встроенный шрифт 3x5):
+над столбцом — значение, под ним — номер темы; названия тем уходят в
+подпись к фото (см. legend_caption). SVG для веба содержит полные подписи.
+"""
+from __future__ import annotations
+
+import struct
+import zlib
+from html import escape
+
+# те же размеры, что у matplotlib: figsize 6.4x4.8 дюйма при dpi=160
+WIDTH = 1024
+HEIGHT = 768
+
+MARGIN_LEFT = 100
+MARGIN_RIGHT = 40
+MARGIN_TOP = 60
+MARGIN_BOTTOM = 110
+
+# индексы палитры
+WHITE, BLACK, GRID, BAR = 0, 1, 2, 3
+PALETTE = [(255, 255, 255), (0, 0, 0), (221, 221, 221), (31, 119, 180)]
+BAR_HEX = "#1f77b4"
+
+_DIGITS = {
+    "0": ("111", "101", "101", "101", "111"),
+    "1": ("010", "110", "010", "010", "111"),
+    "2": ("111", "001", "111", "100", "111"),
+    "3": ("111", "001", "111", "001", "111"),
+    "4": ("101", "101", "111", "001", "001"),
+    "5": ("111", "100", "111", "001", "111"),
+    "6": ("111", "100", "111", "101", "111"),
+    "7": ("111", "001", "010", "010", "010"),
+    "8": ("111", "101", "111", "101", "111"),
+    "9": ("111", "101", "111", "001", "111"),
+}
+
+
+class Canvas:
+    def __init__(self, width: int, height: int, background: int = WHITE):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray([background]) * (width * height)
+
+    def fill_rect(self, x0: int, y0: int, x1: int, y1: int, color: int) -> None:
+        x0, x1 = max(0, min(x0, x1)), min(self.width, max(x0, x1))
+        y0, y1 = max(0, min(y0, y1)), min(self.height, max(y0, y1))
+        if x0 >= x1 or y0 >= y1:
+            return
+        row = bytes([color]) * (x1 - x0)
+        w = self.width
+        for y in range(y0, y1):
+            self.pixels[y * w + x0 : y * w + x1] = row
+
+    def text_width(self, text: str, scale: int) -> int:
+        return len(text) * 4 * scale - scale if text else 0
+
+    def draw_digits(self, x: int, y: int, text: str, scale: int, color: int = BLACK) -> None:
+        for ch in text:
+            glyph = _DIGITS.get(ch)
+            if glyph is not None:
+                for gy, line in enumerate(glyph):
+                    for gx, bit in enumerate(line):
+                        if bit == "1":
+                            self.fill_rect(
+                                x + gx * scale, y + gy * scale,
+                                x + (gx + 1) * scale, y + (gy + 1) * scale,
+                                color,
+                            )
+            x += 4 * scale
+
+    def to_png(self, palette: list[tuple[int, int, int]] = PALETTE) -> bytes:
+        w = self.width
+        raw = bytearray()
+        for y in range(self.height):
+            raw.append(0)  # filter: none
+            raw += self.pixels[y * w : (y + 1) * w]
+
+        def chunk(tag: bytes, data: bytes) -> bytes:
+            return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+        ihdr = struct.pack(">IIBBBBB", w, self.height, 8, 3, 0, 0, 0)
+        plte = b"".join(bytes(c) for c in palette)
+        return (
+            b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", ihdr)
+            + chunk(b"PLTE", plte)
+            + chunk(b"IDAT", zlib.compress(bytes(raw), 6))
+            + chunk(b"IEND", b"")
+        )
+
+
+def _nice_ticks(max_value: int, target: int = 5) -> list[int]:
+    if max_value <= 0:
+        return [0, 1]
+    raw_step = max_value / target
+    magnitude = 10 ** (len(str(int(raw_step))) - 1) if raw_step >= 1 else 1
+    step = magnitude
+    for mult in (1, 2, 5, 10):
+        step = mult * magnitude
+        if step >= raw_step:
+            break
+    top = ((max_value + step - 1) // step) * step
+    return list(range(0, top + 1, step))
+
+
+def _layout(pairs: list[tuple[str, int]]):
+    ticks = _nice_ticks(max((int(c) for _, c in pairs), default=0))
+    plot_w = WIDTH - MARGIN_LEFT - MARGIN_RIGHT
+    plot_h = HEIGHT - MARGIN_TOP - MARGIN_BOTTOM
+    n = max(1, len(pairs))
+    slot = plot_w / n
+    bar_w = slot * 0.8
+
+    def y_of(value: int) -> int:
+        return MARGIN_TOP + plot_h - round(plot_h * value / ticks[-1])
+
+    bars = []
+    for i, (_name, cnt) in enumerate(pairs):
+        x0 = MARGIN_LEFT + round(i * slot + (slot - bar_w) / 2)
+        bars.append((x0, x0 + round(bar_w), y_of(int(cnt)), int(cnt)))
+    return ticks, y_of, bars
+
+
+def render_png(pairs: list[tuple[str, int]]) -> bytes:
+    ticks, y_of, bars = _layout(pairs)
+    c = Canvas(WIDTH, HEIGHT)
+    base_y = y_of(0)
+
+    for t in ticks:
+        y = y_of(t)
+        c.fill_rect(MARGIN_LEFT, y, WIDTH - MARGIN_RIGHT, y + 1, GRID)
+        label = str(t)
+        c.draw_digits(MARGIN_LEFT - 12 - c.text_width(label, 3), y - 7, label, 3)
+
+    for i, (x0, x1, y, cnt) in enumerate(bars, start=1):
+        c.fill_rect(x0, y, x1, base_y, BAR)
+        value = str(cnt)
+        c.draw_digits((x0 + x1 - c.text_width(value, 4)) // 2, y - 28, value, 4)
+        num = str(i)
+        c.draw_digits((x0 + x1 - c.text_width(num, 4)) // 2, base_y + 16, num, 4)
+
+    c.fill_rect(MARGIN_LEFT - 2, MARGIN_TOP, MARGIN_LEFT, base_y + 2, BLACK)
+    c.fill_rect(MARGIN_LEFT - 2, base_y, WIDTH - MARGIN_RIGHT, base_y + 2, BLACK)
+    return c.to_png()
+
+
+def render_svg(pairs: list[tuple[str, int]]) -> str:
+    ticks, y_of, bars = _layout(pairs)
+    base_y = y_of(0)
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {WIDTH} {HEIGHT}" '
+        f'width="100%" role="img" font-family="sans-serif" font-size="20">'
+    ]
+    for t in ticks:
+        y = y_of(t)
+        parts.append(f'<line x1="{MARGIN_LEFT}" y1="{y}" x2="{WIDTH - MARGIN_RIGHT}" y2="{y}" stroke="#ddd"/>')
+        parts.append(f'<text x="{MARGIN_LEFT - 12}" y="{y + 7}" text-anchor="end">{t}</text>')
+    for (x0, x1, y, cnt), (name, _cnt) in zip(bars, pairs):
+        cx = (x0 + x1) / 2
+        parts.append(f'<rect x="{x0}" y="{y}" width="{x1 - x0}" height="{base_y - y}" fill="{BAR_HEX}"/>')
+        parts.append(f'<text x="{cx}" y="{y - 8}" text-anchor="middle">{cnt}</text>')
+        label = escape(name if len(name) <= 24 else name[:23] + "…")
+        parts.append(
+            f'<text x="{cx}" y="{base_y + 24}" text-anchor="end" '
+            f'transform="rotate(-45 {cx} {base_y + 24})">{label}</text>'
+        )
+    parts.append(
+        f'<path d="M{MARGIN_LEFT} {MARGIN_TOP}V{base_y}H{WIDTH - MARGIN_RIGHT}" fill="none" stroke="#000" stroke-width="2"/>'
+    )
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+def legend_caption(title: str, pairs: list[tuple[str, int]], limit: int = 1024) -> str:
+    # номера тем на PNG расшифровываются в подписи (лимит подписи Telegram — 1024 символа)
+    lines = [title]
+    for i, (name, cnt) in enumerate(pairs, start=1):
+        lines.append(f"{i}. {name} — {cnt}")
+    text = "\n".join(lines)
+    return text if len(text) <= limit else text[: limit - 1] + "…"
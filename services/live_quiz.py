@@ -0,0 +1,169 @@
+"""Live-викторина: один вопрос одновременно всем участникам.
+
+Состояние целиком в памяти процесса бота (одна викторина за раз):
+ответы копятся в счётчиках по вариантам, БД не трогается на каждый клик.
+Когда раунд закрывается по таймеру, все ответы пишутся одним INSERT
+(Repo.add_attempts_bulk). Рассылка — fan_out: ограниченное число
+одновременных отправок в полосе bulk, темп и 429 держит OutboundLimiter.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from db.dto import OptionRow, QuestionRow
+from services.outbound import bulk_lane
+
+log = logging.getLogger(__name__)
+
+LOBBY_SECONDS = 60
+DEFAULT_ROUND_SECONDS = 30
+DEFAULT_QUESTIONS = 5
+FAN_OUT_CONCURRENCY = 32
+
+
+async def fan_out(
+    chat_ids: list[int],
+    send: Callable[[int], Awaitable[Any]],
+    concurrency: int = FAN_OUT_CONCURRENCY,
+) -> tuple[int, list[int]]:
+    """send(chat_id) для всех чатов; (отправлено, недоступные чаты).
+
+    Одновременно в полёте не больше concurrency запросов: очередь к лимитеру
+    остаётся короткой, а интерактивные ответы не ждут за сотнями отправок.
+    """
+    sem = asyncio.Semaphore(concurrency)
+    sent = 0
+    gone: list[int] = []
+
+    async def one(chat_id: int) -> None:
+        nonlocal sent
+        async with sem:
+            try:
+                await send(chat_id)
+                sent += 1
+            except (TelegramForbiddenError, TelegramBadRequest):
+                gone.append(chat_id)  # бот заблокирован / чат не найден
+            except Exception:
+                log.exception("live quiz: send to %s failed", chat_id)
+
+    with bulk_lane():
+        await asyncio.gather(*(one(c) for c in chat_ids))
+    return sent, gone
+
+
+@dataclass
+class LiveRound:
+    question: QuestionRow
+    options: list[OptionRow]
+    number: int
+    closes_at: float = 0.0  # 0 — вопрос ещё рассылается, срок не начался
+    open: bool = True
+    answers: dict[int, set[int]] = field(default_factory=dict)  # tg_id -> выбранные oid
+    counts: dict[int, int] = field(default_factory=dict)  # oid -> сколько выбрали
+
+    @property
+    def correct_ids(self) -> set[int]:
+        return {o.id for o in self.options if o.is_correct}
+
+    def start_timer(self, seconds: float) -> None:
+        # отсчёт — после рассылки: у последнего получателя тоже полный раунд
+        self.closes_at = time.time() + seconds
+
+    def accepting(self) -> bool:
+        return self.open and (not self.closes_at or time.time() < self.closes_at)
+
+    def toggle(self, tg_id: int, oid: int) -> set[int] | None:
+        # None — такого варианта в раунде нет (подделанный callback): счётчики не трогаем
+        if all(o.id != oid for o in self.options):
+            return None
+        chosen = self.answers.setdefault(tg_id, set())
+        if self.question.qtype == "multi":
+            if oid in chosen:
+                chosen.discard(oid)
+                self.counts[oid] -= 1
+            else:
+                chosen.add(oid)
+                self.counts[oid] = self.counts.get(oid, 0) + 1
+        elif oid not in chosen:
+            # single: последний клик заменяет прежний выбор
+            for prev in chosen:
+                self.counts[prev] -= 1
+            chosen.clear()
+            chosen.add(oid)
+            self.counts[oid] = self.counts.get(oid, 0) + 1
+        return chosen
+
+
+@dataclass
+class LiveQuiz:
+    admin_chat_id: int
+    questions: list[QuestionRow]
+    options: dict[int, list[OptionRow]]
+    round_seconds: int
+    participants: dict[int, int] = field(default_factory=dict)  # tg_id -> user_id
+    names: dict[int, str] = field(default_factory=dict)
+    scores: dict[int, int] = field(default_factory=dict)
+    round: LiveRound | None = None
+    started: bool = False
+    go: asyncio.Event = field(default_factory=asyncio.Event)
+    task: asyncio.Task | None = None
+    created_at: float = field(default_factory=time.time)
+
+    def join(self, tg_id: int, user_id: int, name: str) -> bool:
+        if tg_id in self.participants:
+            return False
+        self.participants[tg_id] = user_id
+        self.names[tg_id] = name
+        return True
+
+    def accepts(self, tg_id: int, qid: int) -> bool:
+        r = self.round
+        return r is not None and r.accepting() and r.question.id == qid and tg_id in self.participants
+
+    def close_round(self) -> list[tuple[int, int, bool, list[int], None]]:
+        # закрыть раунд и вернуть попытки для Repo.add_attempts_bulk
+        r = self.round
+        if r is None:
+            return []
+        r.open = False
+        correct = r.correct_ids
+        rows = []
+        for tg_id, chosen in r.answers.items():
+            if not chosen or tg_id not in self.participants:
+                continue
+            ok = chosen == correct
+            if ok:
+                self.scores[tg_id] = self.scores.get(tg_id, 0) + 1
+            rows.append((self.participants[tg_id], r.question.id, ok, sorted(chosen), None))
+        return rows
+
+    def leaderboard(self, limit: int = 10) -> list[tuple[int, int]]:
+        return sorted(self.scores.items(), key=lambda kv: -kv[1])[:limit]
+
+
+class LiveQuizManager:
+    """Одна активная викторина на процесс бота."""
+
+    def __init__(self):
+        self.current: LiveQuiz | None = None
+
+    def start(self, quiz: LiveQuiz) -> bool:
+        if self.current is not None:
+            return False
+        self.current = quiz
+        return True
+
+    def stop(self) -> LiveQuiz | None:
+        quiz, self.current = self.current, None
+        if quiz is not None and quiz.task is not None and quiz.task is not asyncio.current_task():
+            quiz.task.cancel()
+        return quiz
+
+
+live_quizzes = LiveQuizManager()
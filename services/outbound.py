@@ -0,0 +1,198 @@
+"""Единый исходящий слой для всех запросов бота к Telegram.
+
+OutboundLimiter ставится request-middleware на сессию Bot и поэтому видит
+всё: answer/edit_text/answer_photo из хэндлеров, рассылки, коды входа.
+Лимиты — глобальный token bucket плюс bucket на каждый чат. Рассылки идут
+в полосе bulk (см. bulk_lane) и не трогают резерв токенов, оставленный для
+интерактивных ответов. TelegramRetryAfter обрабатывается здесь же.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+log = logging.getLogger(__name__)
+
+LANE_INTERACTIVE = "interactive"
+LANE_BULK = "bulk"
+
+_lane: ContextVar[str] = ContextVar("outbound_lane", default=LANE_INTERACTIVE)
+
+
+@contextmanager
+def bulk_lane() -> Iterator[None]:
+    # Всё, что отправляется внутри блока, идёт с низким приоритетом (рассылки).
+    token = _lane.set(LANE_BULK)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+class _Bucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float, reserve: float = 0.0) -> float:
+        # сколько ждать, пока в bucket станет >= 1 + reserve токенов
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        self._refill(now)
+        need = 1.0 + reserve - self.tokens
+        return 0.0 if need <= 0 else need / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1.0
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+
+class OutboundLimiter(BaseRequestMiddleware):
+    """Глобальный и per-chat rate limit с приоритетными полосами.
+
+    Лимитируются только методы с chat_id (send*/edit*/copy* и т.п.);
+    getUpdates, answerCallbackQuery и прочие служебные вызовы проходят сразу.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 25.0,
+        private_rate: float = 1.0,
+        private_burst: float = 3.0,
+        group_rate: float = 20.0 / 60.0,
+        group_burst: float = 3.0,
+        interactive_reserve: float = 5.0,
+        max_retries: int = 3,
+        max_chats: int = 10_000,
+    ):
+        now = time.monotonic()
+        self.global_bucket = _Bucket(global_rate, global_rate, now)
+        self.private_rate = private_rate
+        self.private_burst = private_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.interactive_reserve = interactive_reserve
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+
+        self._chats: OrderedDict[int | str, _Bucket] = OrderedDict()
+        self._bulk_paused_until = 0.0
+
+        self.waiting = {LANE_INTERACTIVE: 0, LANE_BULK: 0}
+        self.max_waiting = {LANE_INTERACTIVE: 0, LANE_BULK: 0}
+        self.sent = {LANE_INTERACTIVE: 0, LANE_BULK: 0}
+        self.retry_after_hits = 0
+        self.gave_up = 0
+
+    def _chat_bucket(self, chat_id: int | str, now: float) -> _Bucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is not None:
+            self._chats.move_to_end(chat_id)
+            return bucket
+        if isinstance(chat_id, int) and chat_id > 0:
+            bucket = _Bucket(self.private_rate, self.private_burst, now)
+        else:
+            bucket = _Bucket(self.group_rate, self.group_burst, now)
+        self._chats[chat_id] = bucket
+        if len(self._chats) > self.max_chats:
+            # выкидываем давно неактивные чаты: их bucket всё равно полный
+            for key in list(self._chats)[: len(self._chats) - self.max_chats]:
+                if self._chats[key].idle(now):
+                    del self._chats[key]
+        return bucket
+
+    async def _acquire(self, lane: str, chat_id: int | str) -> None:
+        self.waiting[lane] += 1
+        self.max_waiting[lane] = max(self.max_waiting[lane], self.waiting[lane])
+        try:
+            while True:
+                now = time.monotonic()
+                chat = self._chat_bucket(chat_id, now)
+                if lane == LANE_BULK:
+                    delay = max(
+                        self._bulk_paused_until - now,
+                        self.global_bucket.delay(now, reserve=self.interactive_reserve),
+                        chat.delay(now),
+                    )
+                else:
+                    delay = max(self.global_bucket.delay(now), chat.delay(now))
+                if delay <= 0:
+                    self.global_bucket.take()
+                    chat.take()
+                    return
+                await asyncio.sleep(delay)
+        finally:
+            self.waiting[lane] -= 1
+
+    def _on_retry_after(self, lane: str, chat_id: int | str, seconds: float) -> None:
+        self.retry_after_hits += 1
+        until = time.monotonic() + seconds
+        bucket = self._chat_bucket(chat_id, time.monotonic())
+        bucket.blocked_until = max(bucket.blocked_until, until)
+        if lane == LANE_BULK:
+            # 429 во время рассылки — притормаживаем всю полосу bulk
+            self._bulk_paused_until = max(self._bulk_paused_until, until)
+        log.warning("Telegram flood control: chat=%s lane=%s retry_after=%.1fs", chat_id, lane, seconds)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        lane = _lane.get()
+        attempt = 0
+        while True:
+            await self._acquire(lane, chat_id)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self._on_retry_after(lane, chat_id, float(e.retry_after) + 0.2)
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.gave_up += 1
+                    raise
+                continue
+            self.sent[lane] += 1
+            return response
+
+    def snapshot(self) -> dict[str, int]:
+        return {
+            "queue_interactive": self.waiting[LANE_INTERACTIVE],
+            "queue_bulk": self.waiting[LANE_BULK],
+            "queue_interactive_max": self.max_waiting[LANE_INTERACTIVE],
+            "queue_bulk_max": self.max_waiting[LANE_BULK],
+            "sent_interactive": self.sent[LANE_INTERACTIVE],
+            "sent_bulk": self.sent[LANE_BULK],
+            "retry_after": self.retry_after_hits,
+            "gave_up": self.gave_up,
+            "chats_tracked": len(self._chats),
+        }
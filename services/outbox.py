@@ -0,0 +1,102 @@
+"""Отправитель outbox: разбирает таблицу outbox и шлёт сообщения через бота.
+
+Веб-приложение само в Telegram не ходит: коды входа и рассылки пишутся
+в outbox в той же транзакции, что и остальные данные запроса. Отправитель
+работает внутри процесса бота (app.py) или отдельно:
+
+    python -m services.outbox
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from db.models import OutboxMessage
+from db.repo import Repo
+from services.outbound import bulk_lane
+
+log = logging.getLogger(__name__)
+
+
+class OutboxSender:
+    def __init__(
+        self,
+        bot: Bot,
+        sessionmaker: async_sessionmaker,
+        batch_size: int = 50,
+        poll_interval: float = 1.0,
+        max_attempts: int = 5,
+    ):
+        self.bot = bot
+        self.sessionmaker = sessionmaker
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+
+    async def _send_one(self, msg: OutboxMessage) -> tuple[int, bool, str | None, bool]:
+        try:
+            await self.bot.send_message(chat_id=msg.chat_id, text=msg.text, parse_mode=None)
+            return msg.id, True, None, False
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # бот заблокирован / чат не найден — повторять бессмысленно
+            return msg.id, False, str(e), False
+        except Exception as e:
+            return msg.id, False, str(e), True
+
+    async def _send_bulk(self, batch: list[OutboxMessage]) -> list[tuple[int, bool, str | None, bool]]:
+        with bulk_lane():
+            return list(await asyncio.gather(*(self._send_one(m) for m in batch)))
+
+    async def drain_once(self) -> int:
+        async with self.sessionmaker() as s:
+            batch = await Repo(s).claim_outbox_batch(self.batch_size)
+        if not batch:
+            return 0
+
+        # коды входа — интерактивная полоса, рассылки — bulk (OutboundLimiter)
+        interactive = [m for m in batch if m.kind != "broadcast"]
+        bulk = [m for m in batch if m.kind == "broadcast"]
+        results = list(await asyncio.gather(*(self._send_one(m) for m in interactive)))
+        if bulk:
+            results.extend(await self._send_bulk(bulk))
+
+        async with self.sessionmaker() as s:
+            await Repo(s).finish_outbox(results, max_attempts=self.max_attempts)
+        return len(batch)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                sent = await self.drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Outbox drain failed")
+                sent = 0
+            if sent < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+
+async def _main() -> None:
+    from config import load_config
+    from db.session import init_db, make_engine, make_sessionmaker
+    from services.outbound import OutboundLimiter
+
+    config = load_config()
+    engine = make_engine(config.db_url)
+    await init_db(engine)
+    bot = Bot(token=config.bot_token)
+    bot.session.middleware(OutboundLimiter())
+    try:
+        await OutboxSender(bot, make_sessionmaker(engine)).run()
+    finally:
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
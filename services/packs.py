@@ -0,0 +1,86 @@
+"""Офлайн-пакеты вопросов и проверка присланных из них попыток.
+
+В пакете нет правильных ответов в открытом виде: для каждого вопроса —
+key_hash = sha256("{salt}:{question_id}:{правильные id через запятую по
+возрастанию}"), соль своя у каждого пакета. Клиент считает тот же хэш от
+выбранных вариантов и проверяет ответ без сети. Сервер хэшам клиента не
+верит: при синхронизации ответ проверяется заново по ключу из БД.
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+import secrets
+from datetime import datetime, timedelta
+from typing import Any
+
+from db.dto import OptionRow, QuestionRow
+
+PACK_MAX_SIZE = 100
+SYNC_MAX_ATTEMPTS = 500
+SYNC_MAX_AGE = timedelta(days=30)  # старше — считаем временем синхронизации
+BATCH_ID_RE = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+def answer_key_hash(salt: str, question_id: int, option_ids: list[int] | set[int]) -> str:
+    key = ",".join(str(i) for i in sorted(option_ids))
+    return hashlib.sha256(f"{salt}:{question_id}:{key}".encode()).hexdigest()
+
+
+def build_pack(questions: list[QuestionRow], options: dict[int, list[OptionRow]]) -> dict[str, Any]:
+    salt = secrets.token_hex(8)
+    return {
+        "salt": salt,
+        "hash": "sha256",
+        "created_at": datetime.utcnow().replace(microsecond=0).isoformat() + "Z",
+        "questions": [
+            {
+                "id": q.id,
+                "text": q.text,
+                "qtype": q.qtype,
+                "explanation": q.explanation,
+                "options": [{"id": o.id, "text": o.text} for o in options.get(q.id, [])],
+                "key_hash": answer_key_hash(salt, q.id, [o.id for o in options.get(q.id, []) if o.is_correct]),
+            }
+            for q in questions
+        ],
+    }
+
+
+def answered_at(value: Any, now: datetime) -> datetime:
+    # время ответа с клиента (unix-секунды); будущее и слишком старое не принимаем
+    try:
+        ts = datetime.utcfromtimestamp(float(value))
+    except (TypeError, ValueError, OverflowError, OSError):
+        return now
+    if ts > now or now - ts > SYNC_MAX_AGE:
+        return now
+    return ts
+
+
+def grade_sync_batch(
+    items: list[Any],
+    options: dict[int, list[OptionRow]],
+    now: datetime,
+) -> tuple[list[tuple[int, bool, list[int], datetime]], list[int]]:
+    """Проверка присланных попыток по ключу из БД.
+
+    Возвращает (попытки для Repo.add_attempts, индексы отклонённых): вопрос
+    неизвестен, выбор пуст или содержит чужие варианты.
+    """
+    accepted: list[tuple[int, bool, list[int], datetime]] = []
+    rejected: list[int] = []
+    for i, item in enumerate(items):
+        try:
+            qid = int(item["question_id"])
+            chosen = sorted({int(x) for x in item["option_ids"]})
+        except (KeyError, TypeError, ValueError):
+            rejected.append(i)
+            continue
+        opts = options.get(qid)
+        if not opts or not chosen or not set(chosen) <= {o.id for o in opts}:
+            rejected.append(i)
+            continue
+        correct = {o.id for o in opts if o.is_correct}
+        accepted.append((qid, set(chosen) == correct, chosen, answered_at(item.get("answered_at"), now)))
+    return accepted, rejected
@@ -0,0 +1,146 @@
+"""Хранилища кулдаунов для веба (запрос кода входа).
+
+acquire(key, ttl) атомарно занимает ключ на ttl секунд: 0 — занят нами,
+иначе сколько секунд осталось до освобождения. Бэкенды:
+
+- memory — словарь в процессе с жёстким лимитом ключей (один воркер);
+- sql    — таблица rate_limits в общей БД (несколько воркеров/рестарты);
+- redis  — SET NX EX в локальном Redis (нужен пакет redis).
+"""
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from db.models import RateLimit
+
+BACKENDS = ("memory", "sql", "redis")
+
+
+class MemoryRateLimitStore:
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        # ключ -> момент освобождения (monotonic); порядок вставки ~ порядок истечения
+        self._until: OrderedDict[str, float] = OrderedDict()
+
+    def _evict(self, now: float) -> None:
+        while self._until:
+            key, until = next(iter(self._until.items()))
+            if until > now and len(self._until) <= self.max_keys:
+                break
+            # истёкшие — всегда; при переполнении вытесняем самые старые
+            self._until.popitem(last=False)
+
+    async def acquire(self, key: str, ttl: int) -> int:
+        now = time.monotonic()
+        until = self._until.get(key)
+        if until is not None and until > now:
+            return max(1, int(until - now))
+        self._until.pop(key, None)
+        self._until[key] = now + ttl
+        self._evict(now)
+        return 0
+
+    async def release(self, key: str) -> None:
+        self._until.pop(key, None)
+
+    async def purge(self) -> int:
+        before = len(self._until)
+        self._evict(time.monotonic())
+        return before - len(self._until)
+
+    async def close(self) -> None:
+        pass
+
+
+class SqlRateLimitStore:
+    def __init__(self, sessionmaker: async_sessionmaker):
+        self.sessionmaker = sessionmaker
+
+    async def acquire(self, key: str, ttl: int) -> int:
+        now = datetime.utcnow()
+        async with self.sessionmaker() as s:
+            if s.get_bind().dialect.name == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+            # истёкшую запись можно занять заново
+            await s.execute(delete(RateLimit).where(RateLimit.key == key, RateLimit.expires_at <= now))
+            res = await s.execute(
+                dialect_insert(RateLimit)
+                .values(key=key, expires_at=now + timedelta(seconds=ttl))
+                .on_conflict_do_nothing(index_elements=[RateLimit.key])
+                .returning(RateLimit.key)
+            )
+            acquired = res.first() is not None
+            left = 0
+            if not acquired:
+                res = await s.execute(select(RateLimit.expires_at).where(RateLimit.key == key))
+                until = res.scalar_one_or_none()
+                left = max(1, int((until - now).total_seconds())) if until else 1
+            await s.commit()
+        return left
+
+    async def release(self, key: str) -> None:
+        async with self.sessionmaker() as s:
+            await s.execute(delete(RateLimit).where(RateLimit.key == key))
+            await s.commit()
+
+    async def purge(self) -> int:
+        async with self.sessionmaker() as s:
+            res = await s.execute(delete(RateLimit).where(RateLimit.expires_at <= datetime.utcnow()))
+            await s.commit()
+        return res.rowcount or 0
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisRateLimitStore:
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:  # pragma: no cover - зависит от окружения
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package") from e
+        self.prefix = prefix
+        self._redis = redis.from_url(url)
+
+    async def acquire(self, key: str, ttl: int) -> int:
+        name = self.prefix + key
+        if await self._redis.set(name, 1, nx=True, ex=ttl):
+            return 0
+        left = await self._redis.ttl(name)
+        return max(1, int(left))
+
+    async def release(self, key: str) -> None:
+        await self._redis.delete(self.prefix + key)
+
+    async def purge(self) -> int:
+        return 0  # ключи истекают сами (EX)
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+RateLimitStore = MemoryRateLimitStore | SqlRateLimitStore | RedisRateLimitStore
+
+
+def make_rate_limit_store(
+    backend: str,
+    sessionmaker: async_sessionmaker | None = None,
+    redis_url: str | None = None,
+) -> RateLimitStore:
+    if backend == "memory":
+        return MemoryRateLimitStore()
+    if backend == "sql":
+        if sessionmaker is None:
+            raise ValueError("sql rate-limit backend needs a sessionmaker")
+        return SqlRateLimitStore(sessionmaker)
+    if backend == "redis":
+        return RedisRateLimitStore(redis_url or "redis://localhost:6379/0")
+    raise ValueError(f"Unknown rate-limit backend: {backend!r}")
@@ -0,0 +1,173 @@
+"""Генерация вариантов экзамена по шаблону (exam_blueprints).
+
+Шаблон — список «подтема: сколько вопросов». Варианты строятся заранее
+(команда бота /gen_variants или `python -m services.selection <id>`),
+а при старте экзамена выдаётся готовый — одним поиском (Repo.pick_exam_variant).
+
+Вопросы внутри подтемы выбираются взвешенно без возвращения: вес вопроса
+1 / (1 + сколько раз он уже попал в варианты этой генерации), чтобы вопросы
+пула расходились по вариантам равномерно. Выборка по весам — таблица
+псевдонимов (Vose): O(n) построение, O(1) на выборку; повторы внутри
+варианта отбрасываются.
+"""
+from __future__ import annotations
+
+import json
+import random
+from typing import Any
+
+DEFAULT_VARIANTS = 200
+MAX_VARIANTS = 5000
+
+
+class AliasTable:
+    """Выборка индекса с вероятностью, пропорциональной весу, за O(1)."""
+
+    def __init__(self, weights: list[float]):
+        n = len(weights)
+        if n == 0:
+            raise ValueError("AliasTable needs at least one weight")
+        total = float(sum(weights))
+        scaled = [w * n / total for w in weights]
+        self.prob = [0.0] * n
+        self.alias = [0] * n
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in small + large:  # остатки — 1.0 с точностью до округления
+            self.prob[i] = 1.0
+
+    def __len__(self) -> int:
+        return len(self.prob)
+
+    def sample(self, rng: random.Random) -> int:
+        i = rng.randrange(len(self.prob))
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+
+def sample_without_replacement(weights: list[float], k: int, rng: random.Random) -> list[int]:
+    """k разных индексов, вероятность пропорциональна весу."""
+    n = len(weights)
+    if k >= n:
+        idx = list(range(n))
+        rng.shuffle(idx)
+        return idx
+    if k > n // 2:
+        # много отказов у повторных выборок — ключи Efraimidis–Spirakis (u ** (1/w))
+        keys = sorted(range(n), key=lambda i: rng.random() ** (1.0 / weights[i]), reverse=True)
+        return keys[:k]
+    table = AliasTable(weights)
+    picked: list[int] = []
+    seen: set[int] = set()
+    while len(picked) < k:
+        i = table.sample(rng)
+        if i not in seen:
+            seen.add(i)
+            picked.append(i)
+    return picked
+
+
+def parse_spec(raw: str) -> list[tuple[int, int]]:
+    # "3:5, 4:3" или JSON из exam_blueprints.spec -> [(subtopic_id, count), ...]
+    raw = raw.strip()
+    if raw.startswith("["):
+        items = [(int(x["subtopic_id"]), int(x["count"])) for x in json.loads(raw)]
+    else:
+        items = []
+        for part in raw.split(","):
+            stid, _, count = part.strip().partition(":")
+            items.append((int(stid), int(count)))
+    if not items or any(count <= 0 for _stid, count in items):
+        raise ValueError("spec must list subtopic_id:count pairs with count > 0")
+    return items
+
+
+def dump_spec(items: list[tuple[int, int]]) -> str:
+    return json.dumps([{"subtopic_id": stid, "count": count} for stid, count in items])
+
+
+def generate_variants(
+    spec: list[tuple[int, int]],
+    pools: dict[int, list[int]],
+    n_variants: int,
+    seed: Any = None,
+) -> list[list[int]]:
+    """До n_variants разных вариантов (списки question_id, порядок перемешан).
+
+    pools — id вопросов каждой подтемы. Если в подтеме вопросов меньше,
+    чем требует шаблон, берутся все.
+    """
+    rng = random.Random(seed)
+    used: dict[int, int] = {}
+    seen: set[tuple[int, ...]] = set()
+    variants: list[list[int]] = []
+    attempts = 0
+    while len(variants) < n_variants and attempts < n_variants * 3:
+        attempts += 1
+        variant: list[int] = []
+        for stid, count in spec:
+            pool = pools.get(stid) or []
+            if not pool:
+                continue
+            weights = [1.0 / (1 + used.get(qid, 0)) for qid in pool]
+            variant.extend(pool[i] for i in sample_without_replacement(weights, count, rng))
+        key = tuple(sorted(variant))
+        if not variant or key in seen:
+            continue  # маленький пул: одинаковые варианты не храним
+        seen.add(key)
+        for qid in variant:
+            used[qid] = used.get(qid, 0) + 1
+        rng.shuffle(variant)
+        variants.append(variant)
+    return variants
+
+
+async def regenerate(repo, blueprint_id: int, n_variants: int = DEFAULT_VARIANTS) -> int:
+    """Перестроить варианты шаблона; возвращает сколько сохранено.
+
+    При Repo(autocommit=False) фиксирует вызывающий (repo.commit()).
+    """
+    n_variants = max(1, min(n_variants, MAX_VARIANTS))
+    bp = await repo.get_blueprint(blueprint_id)
+    if bp is None:
+        raise ValueError(f"Blueprint {blueprint_id} not found")
+    spec = parse_spec(bp.spec)
+    pools = await repo.subtopic_question_pools([stid for stid, _count in spec])
+    variants = generate_variants(spec, pools, n_variants)
+    await repo.replace_exam_variants(blueprint_id, variants)
+    return len(variants)
+
+
+def _main() -> None:
+    import argparse
+    import asyncio
+
+    from config import load_config
+    from db.repo import Repo
+    from db.session import init_db, make_engine, make_sessionmaker
+
+    parser = argparse.ArgumentParser(description="Pre-generate exam variants for a blueprint")
+    parser.add_argument("blueprint_id", type=int)
+    parser.add_argument("--variants", type=int, default=DEFAULT_VARIANTS)
+    args = parser.parse_args()
+
+    async def run() -> None:
+        engine = make_engine(load_config().db_url)
+        await init_db(engine)
+        try:
+            async with make_sessionmaker(engine)() as s:
+                n = await regenerate(Repo(s), args.blueprint_id, args.variants)
+        finally:
+            await engine.dispose()
+        print(f"blueprint {args.blueprint_id}: {n} variants")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,63 @@
+"""Режим «тест»: лист из N вопросов сдаётся целиком и проверяется за один проход.
+
+Ключ ответов всего листа грузится одним запросом (Repo.option_rows_many),
+попытки пишутся одним INSERT (Repo.add_attempts). Общий код бота и веба.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import NamedTuple
+
+from db.dto import OptionRow
+
+TEST_SIZE = 10
+TEST_TIME_LIMIT_SECONDS = 15 * 60
+TEST_SUBMIT_GRACE_SECONDS = 30  # задержка автосдачи и сети при отправке формы
+
+
+class SheetItem(NamedTuple):
+    question_id: int
+    chosen: list[int]
+    correct_ids: list[int]
+    is_correct: bool
+
+
+class SheetResult(NamedTuple):
+    items: list[SheetItem]
+    correct: int
+    answered: int
+    # попытки для Repo.add_attempts: (question_id, is_correct, chosen, created_at)
+    attempts: list[tuple[int, bool, list[int], datetime | None]]
+
+
+def grade_sheet(
+    qids: list[int],
+    answers: dict[int, list[int]],
+    options: dict[int, list[OptionRow]],
+) -> SheetResult:
+    # без ответа — в счёт как неверно, но попыткой не записывается
+    items: list[SheetItem] = []
+    attempts: list[tuple[int, bool, list[int], datetime | None]] = []
+    for qid in qids:
+        opts = options.get(qid, [])
+        valid = {o.id for o in opts}
+        chosen = sorted(set(answers.get(qid) or []) & valid)
+        correct_ids = sorted(o.id for o in opts if o.is_correct)
+        is_correct = bool(chosen) and chosen == correct_ids
+        items.append(SheetItem(qid, chosen, correct_ids, is_correct))
+        if chosen:
+            attempts.append((qid, is_correct, chosen, None))
+    return SheetResult(
+        items=items,
+        correct=sum(1 for i in items if i.is_correct),
+        answered=len(attempts),
+        attempts=attempts,
+    )
+
+
+def seconds_left(deadline: float, now: float) -> int:
+    return max(0, int(deadline - now))
+
+
+def format_clock(seconds: int) -> str:
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
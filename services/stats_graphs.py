@@ -1,8 +1,23 @@
+import asyncio
+import hashlib
 import io
-import matplotlib.pyplot as plt
+import json
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from services import chart_native
+
+ENGINES = ("matplotlib", "native")
+CAPTION = "Решено по темам (топ)"
+
+
+def _matplotlib_png(pairs: list[tuple[str, int]]) -> bytes:
+    # matplotlib импортируется только здесь: с движком native он не грузится вовсе
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
 
-def bar_topics_png(pairs: list[tuple[str, int]]) -> bytes:
-    # pairs: [(topic, count), ...]
     topics = [p[0] for p in pairs]
     counts = [p[1] for p in pairs]
 
@@ -16,3 +31,114 @@ def bar_topics_png(pairs: list[tuple[str, int]]) -> bytes:
     plt.close(fig)
     buf.seek(0)
     return buf.getvalue()
+
+
+def bar_topics_png(pairs: list[tuple[str, int]], engine: str = "matplotlib") -> bytes:
+    # pairs: [(topic, count), ...]
+    if engine == "native":
+        return chart_native.render_png(pairs)
+    return _matplotlib_png(pairs)
+
+
+def bar_topics_svg(pairs: list[tuple[str, int]]) -> str:
+    return chart_native.render_svg(pairs)
+
+
+class ChartQueueFull(Exception):
+    pass
+
+
+class ChartRenderer:
+    """Рендер графиков в пуле процессов, чтобы matplotlib не блокировал event loop.
+
+    Готовые PNG кэшируются по хэшу входных пар, а file_id, который Telegram
+    вернул после первой загрузки, переиспользуется для таких же графиков.
+    """
+
+    def __init__(
+        self,
+        engine: str = "matplotlib",
+        max_workers: int = 1,
+        max_pending: int = 8,
+        cache_size: int = 256,
+    ):
+        self.engine = engine
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.cache_size = cache_size
+        self._pool: ProcessPoolExecutor | None = None
+        self._pending = 0
+        self._png: OrderedDict[str, bytes] = OrderedDict()
+        self._file_ids: OrderedDict[str, str] = OrderedDict()
+
+    def configure(self, engine: str) -> None:
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown chart engine: {engine!r}")
+        if engine != self.engine:
+            self.engine = engine
+            self._png.clear()
+            self._file_ids.clear()
+
+    def caption(self, pairs: list[tuple[str, int]]) -> str:
+        if self.engine == "native":
+            return chart_native.legend_caption(CAPTION, pairs)
+        return CAPTION
+
+    def key(self, pairs: list[tuple[str, int]]) -> str:
+        raw = json.dumps([self.engine, [[name, int(cnt)] for name, cnt in pairs]], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _remember(self, cache: OrderedDict, key: str, value) -> None:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def file_id(self, key: str) -> str | None:
+        fid = self._file_ids.get(key)
+        if fid is not None:
+            self._file_ids.move_to_end(key)
+        return fid
+
+    def remember_file_id(self, key: str, file_id: str) -> None:
+        self._remember(self._file_ids, key, file_id)
+
+    def forget_file_id(self, key: str) -> None:
+        self._file_ids.pop(key, None)
+
+    async def render(self, pairs: list[tuple[str, int]], key: str | None = None) -> bytes:
+        key = key or self.key(pairs)
+        png = self._png.get(key)
+        if png is not None:
+            self._png.move_to_end(key)
+            return png
+
+        if self.engine == "native":
+            # native рисует за ~20 мс без тяжёлых импортов — пул процессов не нужен
+            png = chart_native.render_png(pairs)
+            self._remember(self._png, key, png)
+            return png
+
+        # ограниченная очередь: при всплеске лучше пропустить график, чем копить задачи
+        if self._pending >= self.max_pending:
+            raise ChartQueueFull()
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            png = await loop.run_in_executor(self._pool, _matplotlib_png, list(pairs))
+        finally:
+            self._pending -= 1
+
+        self._remember(self._png, key, png)
+        return png
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+chart_renderer = ChartRenderer()
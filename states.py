@@ -13,6 +13,7 @@ class SolveSG(StatesGroup):
     choose_subtopics_mode = State()  # шаг 2: все подтемы / выбрать
     choose_subtopics = State()       # шаг 3: выбор подтем (тогглы)
     solving = State()                # процесс решения (вопросы)
+    testing = State()                # режим «тест»: лист вопросов сдаётся целиком
 
 
 class AdminSG(StatesGroup):
@@ -0,0 +1,49 @@
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+
+class CallbackAntiFloodMiddleware(BaseMiddleware):
+    """Отбрасывает повтор той же кнопки тем же пользователем в пределах окна.
+
+    Стоит на dp.update раньше DbSessionMiddleware: дубль (двойной тап,
+    нетерпеливое «не нажалось») не доходит ни до хэндлера, ни до БД.
+    Отвечаем на него пустым answerCallbackQuery, чтобы у клиента пропали часики.
+    """
+
+    def __init__(self, window_ms: int = 500, max_keys: int = 50_000):
+        self.window = window_ms / 1000.0
+        self.max_keys = max_keys
+        # (user_id, data) -> момент последнего пропущенного нажатия (monotonic)
+        self._seen: OrderedDict[tuple[int, str], float] = OrderedDict()
+        self.dropped = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        cq = event.callback_query if isinstance(event, Update) else None
+        if cq is None or cq.from_user is None:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        key = (cq.from_user.id, cq.data or "")
+        last = self._seen.get(key)
+        if last is not None and now - last < self.window:
+            self.dropped += 1
+            try:
+                await data["bot"].answer_callback_query(cq.id)
+            except Exception:
+                pass  # ответ на дубль не важен
+            return None
+
+        self._seen[key] = now
+        self._seen.move_to_end(key)
+        while len(self._seen) > self.max_keys:
+            self._seen.popitem(last=False)
+        return await handler(event, data)
@@ -0,0 +1,44 @@
+from contextlib import AsyncExitStack
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from db.cache import cache_versions
+from db.repo import Repo
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Одна сессия БД на апдейт: хэндлеры получают готовый repo.
+
+    Repo работает без автокоммита — запись фиксируется один раз в конце
+    апдейта (или раньше, через repo.commit(), перед долгими вызовами Telegram).
+    При исключении в хэндлере транзакция откатывается при закрытии сессии.
+    Сама сессия ленивая: соединение берётся из пула только на первом запросе.
+    Если задан read_sessionmaker (DB_READ_URL), аналитика repo читает через него.
+    Перед апдейтом опрашиваются версии кэшей (не чаще poll_interval) — так бот
+    узнаёт о правках каталога из веба и сбрасывает готовые payload-ы.
+    """
+
+    def __init__(self, sessionmaker: async_sessionmaker, read_sessionmaker: async_sessionmaker | None = None):
+        self.sessionmaker = sessionmaker
+        self.read_sessionmaker = read_sessionmaker
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        await cache_versions.check(self.sessionmaker)
+        async with AsyncExitStack() as stack:
+            s = await stack.enter_async_context(self.sessionmaker())
+            rs = None
+            if self.read_sessionmaker is not None:
+                rs = await stack.enter_async_context(self.read_sessionmaker())
+            repo = Repo(s, autocommit=False, read_session=rs)
+            data["repo"] = repo
+            result = await handler(event, data)
+            await repo.commit()
+            return result
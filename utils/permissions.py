@@ -1,7 +1,7 @@
 from aiogram.filters import BaseFilter
 from aiogram.types import Message, CallbackQuery
 from sqlalchemy.ext.asyncio import async_sessionmaker
-from db.repo import Repo
+from db.cache import admin_cache
 
 Event = Message | CallbackQuery
 
@@ -19,6 +19,4 @@ class IsDbAdmin(BaseFilter):
 
     async def __call__(self, event: Event) -> bool:
         uid = event.from_user.id if event.from_user else 0
-        async with self.sessionmaker() as s:
-            repo = Repo(s)
-            return await repo.is_admin(uid)
\ No newline at end of file
+        return await admin_cache.is_admin(self.sessionmaker, uid)
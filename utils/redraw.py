@@ -0,0 +1,80 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, Message
+
+log = logging.getLogger(__name__)
+
+
+class KeyboardRedraws:
+    """Склейка перерисовок клавиатуры одного сообщения.
+
+    Хэндлер меняет состояние сразу, а клавиатуру отдаёт в schedule(): в течение
+    window секунд для сообщения копится только последняя версия, затем уходит
+    один edit_reply_markup. Если клавиатура не изменилась с прошлой отрисовки
+    (тапнули и сразу отменили), запроса нет вовсе.
+    """
+
+    def __init__(self, window: float = 0.35, max_messages: int = 10_000):
+        self.window = window
+        self.max_messages = max_messages
+        self._pending: dict[tuple[int, int], tuple[Message, InlineKeyboardMarkup]] = {}
+        self._tasks: dict[tuple[int, int], asyncio.Task] = {}
+        self._drawn: OrderedDict[tuple[int, int], str] = OrderedDict()
+        self.scheduled = 0
+        self.edits = 0
+
+    def schedule(self, message: Message, markup: InlineKeyboardMarkup) -> None:
+        key = (message.chat.id, message.message_id)
+        self.scheduled += 1
+        self._pending[key] = (message, markup)
+        if key not in self._drawn and message.reply_markup is not None:
+            # что сейчас видит пользователь — чтобы не слать ту же клавиатуру
+            self._drawn[key] = message.reply_markup.model_dump_json()
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._flush_later(key))
+
+    def cancel(self, chat_id: int, message_id: int) -> None:
+        # хэндлер сам перерисовал или заменил сообщение — отложенная клавиатура
+        # устарела и не должна вернуться поверх нового содержимого
+        key = (chat_id, message_id)
+        self._pending.pop(key, None)
+        self._drawn.pop(key, None)
+        task = self._tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
+
+    async def _flush_later(self, key: tuple[int, int]) -> None:
+        try:
+            await asyncio.sleep(self.window)
+        except asyncio.CancelledError:
+            return  # cancel(): сообщение ушло дальше
+        self._tasks.pop(key, None)
+        item = self._pending.pop(key, None)
+        if item is None:
+            return
+        message, markup = item
+        dump = markup.model_dump_json()
+        if dump == self._drawn.get(key):
+            return
+        try:
+            await message.edit_reply_markup(reply_markup=markup)
+            self.edits += 1
+        except TelegramBadRequest as e:
+            if "not modified" not in str(e):
+                log.warning("keyboard redraw failed: %s", e)
+        except Exception:
+            log.exception("keyboard redraw failed")
+            return
+        self._drawn[key] = dump
+        self._drawn.move_to_end(key)
+        while len(self._drawn) > self.max_messages:
+            self._drawn.popitem(last=False)
+
+    def snapshot(self) -> dict[str, int]:
+        return {"scheduled": self.scheduled, "edits": self.edits, "pending": len(self._pending)}
+
+
+keyboard_redraws = KeyboardRedraws()
@@ -0,0 +1,47 @@
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from db.cache import CATALOG, cache_versions
+
+
+class RenderCache:
+    """LRU готовых к отправке payload-ов бота (текст + собранная клавиатура).
+
+    Ключ всегда включает версию каталога (cache_versions): после правки
+    каталога в любом процессе старые записи просто перестают находиться и
+    вытесняются LRU. Значения общие для всех апдейтов — их нельзя менять.
+    """
+
+    def __init__(self, maxsize: int = 5_000):
+        self.maxsize = maxsize
+        self._items: OrderedDict[Hashable, Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(*parts: Hashable) -> tuple:
+        return (cache_versions.version(CATALOG), *parts)
+
+    def get(self, key: Hashable) -> Any | None:
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item
+
+    def put(self, key: Hashable, value: Any) -> Any:
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return value
+
+    def snapshot(self) -> dict[str, int]:
+        return {"size": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+# вопросы: (версия, qid) -> QuestionPayload; пикеры: (версия, вид, id, страница) -> markup
+question_payloads = RenderCache()
+catalog_keyboards = RenderCache(maxsize=2_000)
@@ -0,0 +1,44 @@
+"""Замер времени старта процессов бота и веба (режим --profile-startup)."""
+from __future__ import annotations
+
+import importlib
+import sys
+import time
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Iterator
+
+STARTUP_BUDGET_MS = 1000.0
+
+
+class StartupProfiler:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.rows: list[tuple[str, float]] = []
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.rows.append((name, (time.perf_counter() - t) * 1000))
+
+    def import_module(self, name: str) -> ModuleType:
+        # время — без модулей, уже загруженных предыдущими шагами
+        if name in sys.modules:
+            return sys.modules[name]
+        with self.step(f"import {name}"):
+            return importlib.import_module(name)
+
+    def report(self) -> str:
+        total = (time.perf_counter() - self._t0) * 1000
+        width = max((len(name) for name, _ in self.rows), default=10)
+        lines = [f"{name:<{width}}  {ms:8.1f} ms" for name, ms in self.rows]
+        verdict = "OK" if total <= STARTUP_BUDGET_MS else "OVER BUDGET"
+        lines.append(f"{'total':<{width}}  {total:8.1f} ms  (budget {STARTUP_BUDGET_MS:.0f} ms: {verdict})")
+        return "\n".join(lines)
@@ -0,0 +1,59 @@
+"""python -m web [--profile-startup] [--host H] [--port P] [--workers N]"""
+import argparse
+import asyncio
+import os
+
+from utils.startup import StartupProfiler
+
+
+async def _profile(prof: StartupProfiler) -> None:
+    prof.import_module("fastapi")
+    prof.import_module("sqlalchemy.ext.asyncio")
+    prof.import_module("db.repo")
+    web_main = prof.import_module("web.main")
+
+    with prof.step("create_app"):
+        app = web_main.create_app()
+    ctx = app.router.lifespan_context(app)
+    with prof.step("lifespan startup"):
+        await ctx.__aenter__()
+    with prof.step("lifespan shutdown"):
+        await ctx.__aexit__(None, None, None)
+    print(prof.report())
+
+
+async def _init_db_once() -> None:
+    # Схему создаёт родитель до форка воркеров: иначе N воркеров одновременно
+    # гоняют create_all и миграции. Воркеры видят SCHEMA_READY_ENV и init_db пропускают.
+    from config import load_config
+    from db.session import SCHEMA_READY_ENV, init_db, make_engine
+
+    engine = make_engine(load_config().db_url)
+    try:
+        await init_db(engine)
+    finally:
+        await engine.dispose()
+    os.environ[SCHEMA_READY_ENV] = "1"  # наследуют процессы воркеров
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m web")
+    parser.add_argument("--profile-startup", action="store_true")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        asyncio.run(_profile(StartupProfiler(enabled=True)))
+        return
+
+    import uvicorn
+
+    if args.workers > 1:
+        asyncio.run(_init_db_once())
+    uvicorn.run("web.main:create_app", factory=True, host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Каталог (предметы → темы → подтемы с числом вопросов) для JSON API.
+
+Снимок каталога строится один раз на версию CATALOG из cache_versions и
+хранится уже сериализованным: тело и ETag для всего каталога, каждого
+предмета и каждой темы. Пока версия не сменилась, запрос с совпадающим
+If-None-Match получает 304 без обращения к БД (кроме редкого опроса версий).
+
+ETag строгий и зависит только от версии, поэтому все воркеры выдают для
+одной версии один и тот же ETag и байт-в-байт одинаковое тело: данные и
+версия читаются в одном согласованном состоянии (см. _load).
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any, NamedTuple
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from db.cache import CATALOG, cache_versions
+from db.repo import Repo
+
+CACHE_CONTROL = "public, no-cache"  # хранить можно, но каждый раз перепроверять (304)
+
+
+class CatalogEntry(NamedTuple):
+    body: bytes
+    etag: str
+
+
+class CatalogSnapshot(NamedTuple):
+    version: int
+    full: CatalogEntry
+    subjects: dict[int, CatalogEntry]
+    topics: dict[int, CatalogEntry]
+
+
+def _entry(payload: dict[str, Any], version: int, scope: str) -> CatalogEntry:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+    return CatalogEntry(body, f'"catalog-{version}-{scope}"')
+
+
+def _build(version: int, subjects, topics, subtopics, counts) -> CatalogSnapshot:
+    by_subject: dict[int, int] = {}
+    by_topic: dict[int, int] = {}
+    by_subtopic: dict[int, int] = {}
+    for c in counts:
+        by_subject[c.subject_id] = by_subject.get(c.subject_id, 0) + c.count
+        by_topic[c.topic_id] = by_topic.get(c.topic_id, 0) + c.count
+        if c.subtopic_id is not None:
+            by_subtopic[c.subtopic_id] = by_subtopic.get(c.subtopic_id, 0) + c.count
+
+    subtopics_of: dict[int, list[dict[str, Any]]] = {}
+    for st in subtopics:
+        subtopics_of.setdefault(st.topic_id, []).append(
+            {"id": st.id, "name": st.name, "question_count": by_subtopic.get(st.id, 0)}
+        )
+
+    topics_of: dict[int, list[dict[str, Any]]] = {}
+    topic_payloads: dict[int, dict[str, Any]] = {}
+    for t in topics:
+        payload = {
+            "id": t.id,
+            "subject_id": t.subject_id,
+            "name": t.name,
+            "question_count": by_topic.get(t.id, 0),
+            "subtopics": subtopics_of.get(t.id, []),
+        }
+        topic_payloads[t.id] = payload
+        topics_of.setdefault(t.subject_id, []).append(payload)
+
+    subject_payloads: dict[int, dict[str, Any]] = {}
+    for s in subjects:
+        subject_payloads[s.id] = {
+            "id": s.id,
+            "code": s.code,
+            "name": s.name,
+            "question_count": by_subject.get(s.id, 0),
+            "topics": topics_of.get(s.id, []),
+        }
+
+    return CatalogSnapshot(
+        version=version,
+        full=_entry({"version": version, "subjects": list(subject_payloads.values())}, version, "all"),
+        subjects={
+            sid: _entry({"version": version, "subject": p}, version, f"s{sid}")
+            for sid, p in subject_payloads.items()
+        },
+        topics={
+            tid: _entry({"version": version, "topic": p}, version, f"t{tid}")
+            for tid, p in topic_payloads.items()
+        },
+    )
+
+
+class CatalogCache:
+    def __init__(self):
+        self._snapshot: CatalogSnapshot | None = None
+        self._lock = asyncio.Lock()
+        self.builds = 0
+
+    async def get(self, sessionmaker: async_sessionmaker) -> CatalogSnapshot:
+        # версия из другого процесса (импорт в вебе, админка бота) — через cache_versions
+        await cache_versions.check(sessionmaker)
+        snap = self._snapshot
+        if snap is not None and snap.version >= cache_versions.version(CATALOG):
+            return snap
+        async with self._lock:
+            snap = self._snapshot
+            if snap is not None and snap.version >= cache_versions.version(CATALOG):
+                return snap
+            snap = await self._load(sessionmaker)
+            self._snapshot = snap
+            self.builds += 1
+            return snap
+
+    async def _load(self, sessionmaker: async_sessionmaker) -> CatalogSnapshot:
+        async with sessionmaker() as s:
+            # без coalesce: чужой запрос, начатый до коммита, вернул бы старые
+            # строки, и сверка версий ниже их бы не заметила
+            repo = Repo(s, autocommit=False, coalesce=False)
+            # SQLite читает каждый SELECT своим снимком: если между чтениями
+            # версия сменилась (закоммитили изменение каталога), читаем заново
+            for _ in range(5):
+                before = (await repo.get_cache_versions()).get(CATALOG, 0)
+                rows = (
+                    await repo.subject_rows(),
+                    await repo.catalog_topic_rows(),
+                    await repo.catalog_subtopic_rows(),
+                    await repo.question_count_rows(),
+                )
+                after = (await repo.get_cache_versions()).get(CATALOG, 0)
+                await s.rollback()
+                if before == after:
+                    break
+        return _build(after, *rows)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match сравнивается слабо: W/"x" совпадает с "x"
+    tags = (t.strip() for t in if_none_match.split(","))
+    return any(t.removeprefix("W/") == etag for t in tags)
@@ -0,0 +1,195 @@
+"""Картинки вопросов для веба: Telegram file_id -> файл на диске.
+
+В БД у вопроса только image_file_id — бот шлёт его как есть, а браузеру
+нужен сам файл. Файл один раз скачивается через Bot API (getFile +
+/file/bot<token>/<path>) и кладётся в кэш по содержимому:
+
+    blobs/ab/<sha256>.jpg         — оригинал
+    thumbs/ab/<sha256>-480.jpg    — превью (если установлен Pillow)
+    ids/<sha256(file_id)>         — "<sha256>.jpg": индекс file_id -> blob
+
+Индекс на диске общий для воркеров и переживает рестарт, поэтому Bot API
+вызывается один раз на file_id. Одинаковые файлы с разными file_id
+хранятся одной копией. Запись атомарная (tmp + os.replace).
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import json
+import os
+import tempfile
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from typing import NamedTuple
+
+from db.cache import SingleFlight
+
+THUMB_SIZE = 480
+MAX_FILE_BYTES = 20 * 1024 * 1024  # больше Bot API всё равно не отдаёт
+FETCH_TIMEOUT_SECONDS = 20
+CACHE_CONTROL = "private, max-age=31536000, immutable"  # file_id не меняет содержимого
+
+MEDIA_TYPES = {
+    ".jpg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".gif": "image/gif",
+}
+
+
+class ImageUnavailable(RuntimeError):
+    """Bot API не отдал файл (неизвестный file_id, сеть, слишком большой файл)."""
+
+
+class StoredImage(NamedTuple):
+    path: Path
+    digest: str
+    media_type: str
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.path.name}"'
+
+
+def _sniff_ext(data: bytes) -> str | None:
+    if data.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return ".gif"
+    return None
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _make_thumb(src: Path, dst: Path, size: int) -> bool:
+    # Pillow необязателен: без него вместо превью отдаётся оригинал
+    try:
+        from PIL import Image
+    except ImportError:
+        return False
+    try:
+        with Image.open(src) as im:
+            im.thumbnail((size, size))
+            if im.mode not in ("RGB", "L"):
+                im = im.convert("RGB")
+            buf = io.BytesIO()
+            im.save(buf, format="JPEG", quality=82, optimize=True)
+    except OSError:  # битый или неподдерживаемый формат
+        return False
+    _write_atomic(dst, buf.getvalue())
+    return True
+
+
+class ImageStore:
+    def __init__(self, cache_dir: str | Path, api_base: str, bot_token: str):
+        self.root = Path(cache_dir)
+        self.api_base = api_base.rstrip("/")
+        self.bot_token = bot_token
+        self._known: dict[str, str] = {}  # file_id -> "<sha256><ext>"
+        self._flights = SingleFlight()
+        self.fetches = 0
+
+    # ---------- пути ----------
+    def _index_path(self, file_id: str) -> Path:
+        return self.root / "ids" / hashlib.sha256(file_id.encode()).hexdigest()
+
+    def _blob_path(self, name: str) -> Path:
+        return self.root / "blobs" / name[:2] / name
+
+    def _thumb_path(self, name: str, size: int) -> Path:
+        digest = name.split(".", 1)[0]
+        return self.root / "thumbs" / digest[:2] / f"{digest}-{size}.jpg"
+
+    def _stored(self, path: Path, name: str) -> StoredImage:
+        media_type = MEDIA_TYPES.get(path.suffix, "application/octet-stream")
+        return StoredImage(path, name.split(".", 1)[0], media_type)
+
+    # ---------- Bot API ----------
+    def _download(self, file_id: str) -> bytes:
+        # блокирующий вызов — выполняется в потоке (asyncio.to_thread)
+        base = f"{self.api_base}/bot{self.bot_token}"
+        url = f"{base}/getFile?" + urllib.parse.urlencode({"file_id": file_id})
+        try:
+            with urllib.request.urlopen(url, timeout=FETCH_TIMEOUT_SECONDS) as resp:
+                meta = json.load(resp)
+            if not meta.get("ok") or not meta["result"].get("file_path"):
+                raise ImageUnavailable(meta.get("description") or "getFile failed")
+            file_path = urllib.parse.quote(meta["result"]["file_path"])
+            file_url = f"{self.api_base}/file/bot{self.bot_token}/{file_path}"
+            with urllib.request.urlopen(file_url, timeout=FETCH_TIMEOUT_SECONDS) as resp:
+                data = resp.read(MAX_FILE_BYTES + 1)
+        except ImageUnavailable:
+            raise
+        except (OSError, ValueError, KeyError) as e:  # urllib.error.URLError — подкласс OSError
+            raise ImageUnavailable(str(e)) from e
+        if len(data) > MAX_FILE_BYTES:
+            raise ImageUnavailable("file too large")
+        return data
+
+    def _lookup_disk(self, file_id: str) -> str | None:
+        try:
+            name = self._index_path(file_id).read_text().strip()
+        except FileNotFoundError:
+            return None
+        return name if self._blob_path(name).exists() else None
+
+    def _store(self, file_id: str, data: bytes) -> str:
+        ext = _sniff_ext(data)
+        if ext is None:
+            raise ImageUnavailable("not an image")
+        name = hashlib.sha256(data).hexdigest() + ext
+        blob = self._blob_path(name)
+        if not blob.exists():
+            _write_atomic(blob, data)
+        _write_atomic(self._index_path(file_id), name.encode())
+        return name
+
+    async def _resolve(self, file_id: str) -> str:
+        name = await asyncio.to_thread(self._lookup_disk, file_id)
+        if name is None:
+            self.fetches += 1
+            data = await asyncio.to_thread(self._download, file_id)
+            name = await asyncio.to_thread(self._store, file_id, data)
+        self._known[file_id] = name
+        return name
+
+    # ---------- публичное ----------
+    def knows(self, file_id: str) -> bool:
+        # уже проверен и лежит на диске в этом процессе
+        return file_id in self._known
+
+    async def original(self, file_id: str) -> StoredImage:
+        name = self._known.get(file_id)
+        if name is None:
+            # одновременные запросы одной картинки качают её один раз
+            name = await self._flights.do(file_id, lambda: self._resolve(file_id))
+        return self._stored(self._blob_path(name), name)
+
+    async def thumbnail(self, file_id: str, size: int = THUMB_SIZE) -> StoredImage:
+        orig = await self.original(file_id)
+        name = orig.path.name
+        thumb = self._thumb_path(name, size)
+        if thumb.exists():
+            return self._stored(thumb, thumb.name)
+        made = await self._flights.do(("thumb", name, size), lambda: asyncio.to_thread(_make_thumb, orig.path, thumb, size))
+        return self._stored(thumb, thumb.name) if made else orig
+
+    def snapshot(self) -> dict[str, int]:
+        return {"known": len(self._known), "fetches": self.fetches}
@@ -4,50 +4,108 @@ import asyncio
 import csv
 import hashlib
 import json
+import logging
+import os
+import random
 import secrets
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any
+from typing import Any, AsyncIterator
+from urllib.parse import quote
 
-from aiogram import Bot
-from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
-from fastapi import FastAPI, Form, HTTPException, Request, UploadFile
-from fastapi.responses import RedirectResponse
+from fastapi import APIRouter, Depends, FastAPI, Form, HTTPException, Query, Request, UploadFile
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from markupsafe import Markup
 from sqlalchemy import select
 from starlette.middleware.sessions import SessionMiddleware
 
 from config import load_config
+from db.cache import admin_cache
+from db.dto import OptionRow, QuestionRow
 from db.models import Subject, Subtopic, Topic, WebLoginCode
 from db.repo import Repo
-from db.session import init_db, make_engine, make_sessionmaker
+from db.session import SCHEMA_READY_ENV, init_db, make_engine, make_read_engine, make_sessionmaker
+from services.packs import BATCH_ID_RE, PACK_MAX_SIZE, SYNC_MAX_ATTEMPTS, build_pack, grade_sync_batch
+from services.ratelimit import make_rate_limit_store
+from services.sheets import TEST_SIZE, TEST_SUBMIT_GRACE_SECONDS, TEST_TIME_LIMIT_SECONDS, format_clock, grade_sheet, seconds_left
+from web.catalog import CACHE_CONTROL, CatalogCache, CatalogEntry, etag_matches
+from web.images import CACHE_CONTROL as IMAGE_CACHE_CONTROL, ImageStore, ImageUnavailable
+from web.sessions import ServerSessionMiddleware, make_session_store, rotate_session
 
 BASE_DIR = Path(__file__).resolve().parent
+log = logging.getLogger(__name__)
 
+# Конфиг — только чтение env. Ресурсы (движки БД, кэши, фоновые задачи) создаёт
+# lifespan в каждом воркере и кладёт в app.state, поэтому импорт модуля ничего не открывает.
 config = load_config()
-engine = make_engine(config.db_url)
-sm = make_sessionmaker(engine)
-bot_client = Bot(token=config.bot_token)
-
-app = FastAPI(title="Quiz Web")
-app.add_middleware(SessionMiddleware, secret_key=config.web_session_secret)
-app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
+router = APIRouter()
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 
-CODE_REQUEST_COOLDOWN_SECONDS = 60
-_code_req_by_ip: dict[str, datetime] = {}
-_code_req_by_tg: dict[int, datetime] = {}
-
-
-@app.on_event("startup")
-async def startup() -> None:
-    await init_db(engine)
 
+async def _prewarm(app: FastAPI) -> None:
+    # До приёма трафика: соединение в пуле, множество админов и версии кэшей,
+    # компиляция горячих запросов (lambda_stmt) и шаблонов — первые запросы
+    # после старта/рестарта воркера не платят за холодный старт.
+    sm = app.state.sm
+    await admin_cache.get(sm)
+    async with sm() as s:
+        repo = Repo(s, autocommit=False)
+        for subject in await repo.subject_rows():
+            await repo.topic_rows(subject.id)
+        await repo.question_row(0)
+        await repo.option_rows(0)
+    await app.state.catalog.get(sm)
+    for name in templates.env.list_templates():
+        templates.get_template(name)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    st = app.state
+    st.engine = make_engine(config.db_url)
+    if not os.environ.get(SCHEMA_READY_ENV):  # python -m web --workers N: схему создал родитель
+        await init_db(st.engine)
+    st.sm = make_sessionmaker(st.engine)
+    # read-only движок для статистики (DB_READ_URL), иначе None
+    st.read_engine = make_read_engine(config.db_read_url) if config.db_read_url else None
+    st.read_sm = make_sessionmaker(st.read_engine) if st.read_engine is not None else None
+    st.rate_limits = make_rate_limit_store(config.rate_limit_backend, sessionmaker=st.sm, redis_url=config.redis_url)
+    st.session_store = make_session_store(config.web_session_backend, sessionmaker=st.sm, redis_url=config.redis_url)
+    st.catalog = CatalogCache()
+    st.images = ImageStore(config.image_cache_dir, config.bot_api_base, config.bot_token)
+    await _prewarm(app)
+    purge_task = asyncio.create_task(_purge_loop(app))
+    try:
+        yield
+    finally:
+        purge_task.cancel()
+        await st.rate_limits.close()
+        if st.session_store is not None:
+            await st.session_store.close()
+        await st.engine.dispose()
+        if st.read_engine is not None:
+            await st.read_engine.dispose()
+
+
+def create_app() -> FastAPI:
+    """Фабрика приложения: uvicorn web.main:create_app --factory --workers N."""
+    app = FastAPI(title="Quiz Web", lifespan=lifespan)
+    if config.web_session_backend == "cookie":
+        app.add_middleware(SessionMiddleware, secret_key=config.web_session_secret)
+    else:
+        # в cookie только id, состояние — в app.state.session_store
+        app.add_middleware(ServerSessionMiddleware)
+    app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
+    app.include_router(router)
+    return app
 
-@app.on_event("shutdown")
-async def shutdown() -> None:
-    await bot_client.session.close()
+CODE_REQUEST_COOLDOWN_SECONDS = 60
+IDENTITY_TTL_SECONDS = 300
+LOGIN_CODE_PURGE_SECONDS = 600
 
 
 def _code_hash(code: str) -> str:
@@ -72,6 +130,7 @@ def _render_index(request: Request, user: dict[str, Any] | None, error: str | No
             "pending_login": bool(pending_tg_id),
             "pending_tg_id": pending_tg_id,
             "pending_login_name": request.session.get("pending_login_name"),
+            "pending_outbox_id": request.session.get("pending_login_outbox_id"),
         },
     )
 
@@ -85,56 +144,83 @@ def _client_ip(request: Request) -> str:
     return "unknown"
 
 
-def _cooldown_left(last_dt: datetime, cooldown_sec: int, now: datetime) -> int:
-    passed = int((now - last_dt).total_seconds())
-    return max(0, cooldown_sec - passed)
-
-
-def _check_code_request_cooldown(ip: str, tg_id: int, now: datetime) -> tuple[bool, int]:
-    ip_last = _code_req_by_ip.get(ip)
-    if ip_last:
-        left = _cooldown_left(ip_last, CODE_REQUEST_COOLDOWN_SECONDS, now)
-        if left > 0:
-            return False, left
-
-    tg_last = _code_req_by_tg.get(tg_id)
-    if tg_last:
-        left = _cooldown_left(tg_last, CODE_REQUEST_COOLDOWN_SECONDS, now)
-        if left > 0:
-            return False, left
-
-    return True, 0
-
+async def _acquire_code_request(request: Request, ip: str, tg_id: int) -> int:
+    # 0 — можно слать код (оба ключа заняты на кулдаун), иначе секунд до повтора
+    rate_limits = request.app.state.rate_limits
+    left = await rate_limits.acquire(f"code:ip:{ip}", CODE_REQUEST_COOLDOWN_SECONDS)
+    if left:
+        return left
+    left = await rate_limits.acquire(f"code:tg:{tg_id}", CODE_REQUEST_COOLDOWN_SECONDS)
+    if left:
+        await rate_limits.release(f"code:ip:{ip}")
+    return left
 
-def _mark_code_request(ip: str, tg_id: int, now: datetime) -> None:
-    _code_req_by_ip[ip] = now
-    _code_req_by_tg[tg_id] = now
 
-
-async def _current_user(request: Request) -> dict[str, Any] | None:
+async def _purge_loop(app: FastAPI) -> None:
+    # коды входа, кулдауны и истёкшие сессии копятся — периодически чистим
+    while True:
+        await asyncio.sleep(LOGIN_CODE_PURGE_SECONDS)
+        try:
+            async with app.state.sm() as s:
+                await Repo(s).purge_login_codes()
+            await app.state.rate_limits.purge()
+            if app.state.session_store is not None:
+                await app.state.session_store.purge()
+        except Exception:
+            log.exception("Login code purge failed")
+
+
+async def _resolve_role(request: Request, tg_id: int) -> str:
+    if tg_id in config.admin_ids:
+        return "superadmin"
+    if await admin_cache.is_admin(request.app.state.sm, tg_id):
+        return "admin"
+    return "user"
+
+
+def _remember_identity(request: Request, user_id: int, tg_id: int, full_name: str) -> None:
+    # роль в сессии не храним: её решает admin_cache на каждом запросе
+    request.session["uid"] = user_id
+    request.session["tg_id"] = tg_id
+    request.session["full_name"] = full_name
+    request.session["ident_at"] = int(time.time())
+
+
+async def get_repo(request: Request) -> AsyncIterator[Repo]:
+    # Одна сессия БД на запрос: все зависимости и обработчик делят один Repo.
+    # Запись фиксируется в конце запроса (обработчики с записью коммитят явно,
+    # до рендера ответа); при исключении сессия закрывается с откатом.
+    async with AsyncExitStack() as stack:
+        st = request.app.state
+        s = await stack.enter_async_context(st.sm())
+        rs = await stack.enter_async_context(st.read_sm()) if st.read_sm is not None else None
+        repo = Repo(s, autocommit=False, read_session=rs)
+        yield repo
+        await repo.commit()
+
+
+async def current_user(request: Request, repo: Repo = Depends(get_repo)) -> dict[str, Any] | None:
+    # Личность берётся из подписанной сессии; в БД ходим (только чтением)
+    # раз в IDENTITY_TTL_SECONDS, чтобы подхватить удаление/смену имени.
+    # Роль — на каждом запросе через admin_cache (в памяти, сбрасывается по
+    # версии ADMINS): снятый админ теряет доступ так же быстро, как в боте.
     tg_id = request.session.get("tg_id")
     if not tg_id:
         return None
 
-    async with sm() as s:
-        repo = Repo(s)
-        user = await repo.get_or_create_user(
-            tg_id=int(tg_id),
-            full_name=request.session.get("full_name", "-"),
-        )
-        is_db_admin = await repo.is_admin(user.tg_id)
-
-    role = "user"
-    if user.tg_id in config.admin_ids:
-        role = "superadmin"
-    elif is_db_admin:
-        role = "admin"
+    checked_at = int(request.session.get("ident_at") or 0)
+    if not request.session.get("uid") or time.time() - checked_at >= IDENTITY_TTL_SECONDS:
+        db_user = await repo.get_user_by_tg_id(int(tg_id))
+        if db_user is None:
+            request.session.clear()
+            return None
+        _remember_identity(request, db_user.id, db_user.tg_id, db_user.full_name)
 
     return {
-        "id": user.id,
-        "tg_id": user.tg_id,
-        "full_name": user.full_name,
-        "role": role,
+        "id": int(request.session["uid"]),
+        "tg_id": int(request.session["tg_id"]),
+        "full_name": request.session.get("full_name", "-"),
+        "role": await _resolve_role(request, int(tg_id)),
     }
 
 
@@ -222,15 +308,13 @@ def _build_options_for_db(options_raw: list[tuple[str, str]], correct_labels: se
     return out
 
 
-@app.get("/")
-async def index(request: Request):
-    user = await _current_user(request)
+@router.get("/")
+async def index(request: Request, user: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
     return _render_index(request, user)
 
 
-@app.post("/auth/request-code")
-async def auth_request_code(request: Request, telegram: str = Form(...)):
-    user = await _current_user(request)
+@router.post("/auth/request-code")
+async def auth_request_code(request: Request, telegram: str = Form(...), user: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
     if user:
         return RedirectResponse(url="/", status_code=303)
 
@@ -240,68 +324,67 @@ async def auth_request_code(request: Request, telegram: str = Form(...)):
 
     ip = _client_ip(request)
 
-    async with sm() as s:
-        repo = Repo(s)
-
-        target_user = None
-        if telegram_input.lstrip("+").isdigit():
-            tg_id = int(telegram_input)
-            target_user = await repo.get_user_by_tg_id(tg_id)
-        else:
-            uname = _normalize_username(telegram_input)
-            target_user = await repo.get_user_by_username(uname)
-
-        if target_user is None:
-            return _render_index(
-                request,
-                None,
-                error="Пользователь не найден. Сначала напишите боту /start с этого Telegram аккаунта.",
-            )
-
-        now = datetime.utcnow()
-        allowed, left = _check_code_request_cooldown(ip=ip, tg_id=target_user.tg_id, now=now)
-        if not allowed:
-            return _render_index(
-                request,
-                None,
-                error=f"Слишком часто. Повтори запрос кода через {left} сек.",
-            )
+    target_user = None
+    if telegram_input.lstrip("+").isdigit():
+        tg_id = int(telegram_input)
+        target_user = await repo.get_user_by_tg_id(tg_id)
+    else:
+        uname = _normalize_username(telegram_input)
+        target_user = await repo.get_user_by_username(uname)
 
-        code = f"{secrets.randbelow(1_000_000):06d}"
-        rec = WebLoginCode(
-            tg_id=target_user.tg_id,
-            code_hash=_code_hash(code),
-            expires_at=now + timedelta(minutes=10),
+    if target_user is None:
+        return _render_index(
+            request,
+            None,
+            error="Пользователь не найден. Сначала напишите боту /start с этого Telegram аккаунта.",
         )
-        s.add(rec)
-        await s.commit()
-        _mark_code_request(ip=ip, tg_id=target_user.tg_id, now=now)
 
-    try:
-        await bot_client.send_message(
-            chat_id=target_user.tg_id,
-            text=(
-                "Код входа на сайт: "
-                f"{code}\n\n"
-                "Код действует 10 минут. Никому его не передавайте."
-            ),
-        )
-    except TelegramAPIError:
+    now = datetime.utcnow()
+    left = await _acquire_code_request(request, ip=ip, tg_id=target_user.tg_id)
+    if left:
         return _render_index(
             request,
             None,
-            error="Бот не смог отправить код. Убедитесь, что вы писали боту /start и не блокировали его.",
+            error=f"Слишком часто. Повтори запрос кода через {left} сек.",
         )
 
+    code = f"{secrets.randbelow(1_000_000):06d}"
+    rec = WebLoginCode(
+        tg_id=target_user.tg_id,
+        code_hash=_code_hash(code),
+        expires_at=now + timedelta(minutes=10),
+    )
+    repo.s.add(rec)
+    # код уходит в Telegram через outbox: отправит процесс бота, запрос не ждёт Bot API
+    out = repo.enqueue_outbox(
+        chat_id=target_user.tg_id,
+        text=(
+            "Код входа на сайт: "
+            f"{code}\n\n"
+            "Код действует 10 минут. Никому его не передавайте."
+        ),
+        kind="login_code",
+    )
+    await repo.commit()
+
     request.session["pending_login_tg_id"] = target_user.tg_id
     request.session["pending_login_name"] = target_user.full_name
+    request.session["pending_login_outbox_id"] = out.id
+
+    return _render_index(request, None, info="Код отправляется в Telegram. Введите его ниже.")
 
-    return _render_index(request, None, info="Код отправлен в Telegram. Введите его ниже.")
 
+@router.get("/auth/code-status")
+async def auth_code_status(request: Request, repo: Repo = Depends(get_repo)):
+    msg_id = request.session.get("pending_login_outbox_id")
+    if not msg_id:
+        return JSONResponse({"status": None})
+    status = await repo.get_outbox_status(int(msg_id))
+    return JSONResponse({"status": status})
 
-@app.post("/auth/verify-code")
-async def auth_verify_code(request: Request, code: str = Form(...)):
-    user = await _current_user(request)
+
+@router.post("/auth/verify-code")
+async def auth_verify_code(request: Request, code: str = Form(...), user: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
     if user:
         return RedirectResponse(url="/", status_code=303)
 
@@ -314,54 +397,51 @@ async def auth_verify_code(request: Request, code: str = Form(...)):
         return _render_index(request, None, error="Код должен быть из 6 цифр.")
 
     now = datetime.utcnow()
-    async with sm() as s:
-        q = await s.execute(
-            select(WebLoginCode)
-            .where(
-                WebLoginCode.tg_id == int(pending_tg_id),
-                WebLoginCode.code_hash == _code_hash(token),
-                WebLoginCode.used_at.is_(None),
-                WebLoginCode.expires_at > now,
-            )
-            .order_by(WebLoginCode.id.desc())
+    q = await repo.s.execute(
+        select(WebLoginCode)
+        .where(
+            WebLoginCode.tg_id == int(pending_tg_id),
+            WebLoginCode.code_hash == _code_hash(token),
+            WebLoginCode.used_at.is_(None),
+            WebLoginCode.expires_at > now,
         )
-        rec = q.scalar_one_or_none()
+        .order_by(WebLoginCode.id.desc())
+    )
+    rec = q.scalar_one_or_none()
 
-        if rec is None:
-            return _render_index(request, None, error="Неверный или просроченный код.")
+    if rec is None:
+        return _render_index(request, None, error="Неверный или просроченный код.")
 
-        rec.used_at = now
+    rec.used_at = now
 
-        repo = Repo(s)
-        db_user = await repo.get_user_by_tg_id(int(pending_tg_id))
-        if db_user is None:
-            return _render_index(request, None, error="Пользователь не найден. Напишите боту /start.")
+    db_user = await repo.get_user_by_tg_id(int(pending_tg_id))
+    if db_user is None:
+        return _render_index(request, None, error="Пользователь не найден. Напишите боту /start.")
 
-        await s.commit()
+    await repo.commit()
 
-    request.session["tg_id"] = int(pending_tg_id)
-    request.session["full_name"] = db_user.full_name
+    _remember_identity(request, db_user.id, db_user.tg_id, db_user.full_name)
+    rotate_session(request.session)
     request.session.pop("pending_login_tg_id", None)
     request.session.pop("pending_login_name", None)
+    request.session.pop("pending_login_outbox_id", None)
 
     return RedirectResponse(url="/", status_code=303)
 
 
-@app.get("/logout")
+@router.get("/logout")
 async def logout(request: Request):
     request.session.clear()
     return RedirectResponse(url="/", status_code=303)
 
 
-@app.get("/solve")
-async def solve_select(request: Request):
-    user = await _current_user(request)
+@router.get("/solve")
+async def solve_select(request: Request, user: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
     if not user:
         return RedirectResponse(url="/", status_code=303)
 
-    async with sm() as s:
-        repo = Repo(s)
-        subjects = await repo.get_subjects()
+    subjects = await repo.subject_rows()
+    exams = await repo.list_blueprints(ready_only=True)
 
     return templates.TemplateResponse(
         request,
@@ -370,6 +450,7 @@ async def solve_select(request: Request):
             "request": request,
             "user": user,
             "subjects": subjects,
+            "exams": exams,
             "topics": [],
             "subtopics": [],
             "selected_subject_id": None,
@@ -378,16 +459,13 @@ async def solve_select(request: Request):
     )
 
 
-@app.get("/solve/subject/{subject_id}")
-async def solve_select_topic(request: Request, subject_id: int):
-    user = await _current_user(request)
+@router.get("/solve/subject/{subject_id}")
+async def solve_select_topic(request: Request, subject_id: int, user: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
     if not user:
         return RedirectResponse(url="/", status_code=303)
 
-    async with sm() as s:
-        repo = Repo(s)
-        subjects = await repo.get_subjects()
-        topics = await repo.get_topics(subject_id)
+    subjects = await repo.subject_rows()
+    topics = await repo.topic_rows(subject_id)
 
     return templates.TemplateResponse(
         request,
@@ -404,78 +482,91 @@ async def solve_select_topic(request: Request, subject_id: int):
     )
 
 
-@app.get("/solve/question")
-async def solve_question(request: Request):
-    user = await _current_user(request)
+async def _current_question(request: Request, repo: Repo, user: dict[str, Any]) -> tuple[QuestionRow, list[OptionRow]] | None:
+    # текущий вопрос сессии решения или следующий; None — вопросы закончились
+    current_qid = request.session.get("current_qid")
+    q = await repo.question_row(current_qid) if current_qid else None
+    if q is None:
+        qid = await repo.next_question_id(
+            user_id=user["id"],
+            subject_id=request.session["solve_subject_id"],
+            topic_id=request.session["solve_topic_id"],
+            subtopic_ids=request.session.get("solve_subtopic_ids") or None,
+        )
+        request.session["current_qid"] = qid
+        if qid is None:
+            return None
+        q = await repo.question_row(qid)
+    return q, await repo.option_rows(q.id)
+
+
+async def _grade_current(request: Request, repo: Repo, user: dict[str, Any], chosen: list[int]) -> dict[str, Any] | None:
+    # проверка ответа на текущий вопрос; None — текущего вопроса нет
+    qid = request.session.get("current_qid")
+    q = await repo.question_row(qid) if qid else None
+    if q is None:
+        request.session["current_qid"] = None
+        return None
+
+    correct_ids = {o.id for o in await repo.option_rows(qid) if o.is_correct}
+    is_correct = set(chosen) == correct_ids
+
+    await repo.add_attempt(user["id"], qid, is_correct, chosen)
+    await repo.commit()
+
+    request.session["solve_total"] = int(request.session.get("solve_total", 0)) + 1
+    if is_correct:
+        request.session["solve_correct"] = int(request.session.get("solve_correct", 0)) + 1
+    request.session["current_qid"] = None
+    return {
+        "is_correct": is_correct,
+        "explanation": q.explanation,
+        "correct_option_ids": sorted(correct_ids),
+    }
+
+
+def _score(request: Request) -> dict[str, int]:
+    return {
+        "total": int(request.session.get("solve_total", 0)),
+        "correct": int(request.session.get("solve_correct", 0)),
+    }
+
+
+def _solve_ready(request: Request) -> bool:
+    return bool(request.session.get("solve_subject_id") and request.session.get("solve_topic_id"))
+
+
+@router.get("/solve/question")
+async def solve_question(request: Request, user: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
     if not user:
         return RedirectResponse(url="/", status_code=303)
-
-    subject_id = request.session.get("solve_subject_id")
-    topic_id = request.session.get("solve_topic_id")
-    if not subject_id or not topic_id:
+    if not _solve_ready(request):
         return RedirectResponse(url="/solve", status_code=303)
 
-    subtopic_ids = request.session.get("solve_subtopic_ids") or []
-
-    async with sm() as s:
-        repo = Repo(s)
-        db_user = await repo.get_or_create_user(tg_id=user["tg_id"], full_name=user["full_name"])
-
-        current_qid = request.session.get("current_qid")
-        if current_qid:
-            q = await repo.get_question(current_qid)
-            if q is None:
-                request.session["current_qid"] = None
-                current_qid = None
-
-        if not current_qid:
-            qid = await repo.pick_next_question_id(
-                user_id=db_user.id,
-                subject_id=subject_id,
-                topic_id=topic_id,
-                subtopic_ids=subtopic_ids or None,
-            )
-            if qid is None:
-                return templates.TemplateResponse(
-                    request,
-                    "solve_done.html",
-                    {
-                        "request": request,
-                        "user": user,
-                        "total": request.session.get("solve_total", 0),
-                        "correct": request.session.get("solve_correct", 0),
-                    },
-                )
-            request.session["current_qid"] = qid
-            q = await repo.get_question(qid)
-
-        opts = await repo.get_options(q.id)
+    picked = await _current_question(request, repo, user)
+    if picked is None:
+        return templates.TemplateResponse(
+            request,
+            "solve_done.html",
+            {"request": request, "user": user, **_score(request)},
+        )
 
+    q, opts = picked
     return templates.TemplateResponse(
         request,
         "solve_question.html",
-        {
-            "request": request,
-            "user": user,
-            "question": q,
-            "options": opts,
-            "total": request.session.get("solve_total", 0),
-            "correct": request.session.get("solve_correct", 0),
-        },
+        {"request": request, "user": user, "question": q, "options": opts, **_score(request)},
     )
 
 
-@app.get("/solve/topic/{subject_id}/{topic_id}")
-async def solve_select_subtopics(request: Request, subject_id: int, topic_id: int):
-    user = await _current_user(request)
+@router.get("/solve/topic/{subject_id}/{topic_id}")
+async def solve_select_subtopics(request: Request, subject_id: int, topic_id: int, user: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
     if not user:
         return RedirectResponse(url="/", status_code=303)
 
-    async with sm() as s:
-        repo = Repo(s)
-        subjects = await repo.get_subjects()
-        topics = await repo.get_topics(subject_id)
-        subtopics = await repo.get_subtopics(topic_id)
+    subjects = await repo.subject_rows()
+    topics = await repo.topic_rows(subject_id)
+    subtopics = await repo.subtopic_rows(topic_id)
 
     return templates.TemplateResponse(
         request,
@@ -488,13 +579,13 @@ async def solve_select_subtopics(request: Request, subject_id: int, topic_id: in
             "subtopics": subtopics,
             "selected_subject_id": subject_id,
             "selected_topic_id": topic_id,
+            "test_size": TEST_SIZE,
         },
     )
 
 
-@app.post("/solve/start")
-async def solve_start(request: Request, subject_id: int = Form(...), topic_id: int = Form(...), subtopic_ids: list[int] = Form(default=[])):
-    user = await _current_user(request)
+@router.post("/solve/start")
+async def solve_start(request: Request, subject_id: int = Form(...), topic_id: int = Form(...), subtopic_ids: list[int] = Form(default=[]), mode: str = Form(default="practice"), user: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
     if not user:
         return RedirectResponse(url="/", status_code=303)
 
@@ -505,68 +596,329 @@ async def solve_start(request: Request, subject_id: int = Form(...), topic_id: i
     request.session["solve_correct"] = 0
     request.session["current_qid"] = None
 
+    if mode == "test":
+        questions = await repo.sample_question_rows(subject_id, topic_id, subtopic_ids or None, TEST_SIZE)
+        now = time.time()
+        request.session["test_qids"] = [q.id for q in questions]
+        request.session["test_started"] = now
+        request.session["test_deadline"] = now + TEST_TIME_LIMIT_SECONDS
+        return RedirectResponse(url="/solve/test", status_code=303)
+
     return RedirectResponse(url="/solve/question", status_code=303)
 
 
-@app.post("/solve/answer")
-async def solve_answer(request: Request, option_ids: list[int] = Form(default=[])):
-    user = await _current_user(request)
+# ---- режим «тест»: все вопросы листа одной формой, проверка за один проход ----
+
+@router.post("/solve/exam")
+async def solve_exam(request: Request, blueprint_id: int = Form(...), user: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
     if not user:
         return RedirectResponse(url="/", status_code=303)
 
-    qid = request.session.get("current_qid")
-    if not qid:
-        return RedirectResponse(url="/solve/question", status_code=303)
+    # старт экзамена — один поиск готового варианта (services/selection.py)
+    qids = await repo.pick_exam_variant(blueprint_id, random.randrange(2**31))
+    if not qids:
+        raise HTTPException(status_code=404, detail="No variants for this exam")
+    now = time.time()
+    request.session["test_qids"] = qids
+    request.session["test_started"] = now
+    request.session["test_deadline"] = now + TEST_TIME_LIMIT_SECONDS
+    return RedirectResponse(url="/solve/test", status_code=303)
 
-    chosen = sorted({int(x) for x in option_ids})
-    if not chosen:
-        raise HTTPException(status_code=400, detail="Choose at least one option")
 
-    async with sm() as s:
-        repo = Repo(s)
-        q = await repo.get_question(qid)
-        if not q:
-            request.session["current_qid"] = None
-            return RedirectResponse(url="/solve/question", status_code=303)
+@router.get("/solve/test")
+async def solve_test(request: Request, user: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
+    if not user:
+        return RedirectResponse(url="/", status_code=303)
+    qids: list[int] = request.session.get("test_qids") or []
+    if not qids:
+        return RedirectResponse(url="/solve", status_code=303)
 
-        correct_ids = await repo.get_correct_option_ids(qid)
-        is_correct = set(chosen) == correct_ids
+    options = await repo.option_rows_many(qids)
+    rows = await repo.question_rows(qids)
+    questions = [rows[qid] for qid in qids if qid in rows]
+    return templates.TemplateResponse(
+        request,
+        "solve_test.html",
+        {
+            "request": request,
+            "user": user,
+            "questions": questions,
+            "options": options,
+            "seconds_left": seconds_left(request.session["test_deadline"], time.time()),
+        },
+    )
 
-        db_user = await repo.get_or_create_user(tg_id=user["tg_id"], full_name=user["full_name"])
-        await repo.add_attempt(db_user.id, qid, is_correct, chosen)
 
-    request.session["solve_total"] = int(request.session.get("solve_total", 0)) + 1
-    if is_correct:
-        request.session["solve_correct"] = int(request.session.get("solve_correct", 0)) + 1
-    request.session["current_qid"] = None
+@router.post("/solve/test")
+async def solve_test_submit(request: Request, user: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
+    if not user:
+        return RedirectResponse(url="/", status_code=303)
+    qids: list[int] = request.session.get("test_qids") or []
+    if not qids:
+        return RedirectResponse(url="/solve", status_code=303)
+
+    # срок проверяет сервер: лист, присланный после дедлайна (с запасом на
+    # автосдачу), засчитывается без ответов — до дедлайна ничего не записано
+    late = time.time() > float(request.session.get("test_deadline") or 0) + TEST_SUBMIT_GRACE_SECONDS
+    form = await request.form()
+    answers: dict[int, list[int]] = {}
+    for qid in [] if late else qids:
+        try:
+            answers[qid] = [int(x) for x in form.getlist(f"q{qid}")]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Option ids must be integers")
+
+    # ключ всего листа — одним запросом, попытки — одним INSERT
+    options = await repo.option_rows_many(qids)
+    result = grade_sheet(qids, answers, options)
+    await repo.add_attempts(user["id"], result.attempts)
+    await repo.commit()
 
+    spent = int(time.time() - request.session.get("test_started", time.time()))
+    for key in ("test_qids", "test_started", "test_deadline"):
+        request.session.pop(key, None)
+
+    questions = await repo.question_rows(qids)
     return templates.TemplateResponse(
         request,
-        "solve_result.html",
+        "solve_test_result.html",
         {
             "request": request,
             "user": user,
-            "is_correct": is_correct,
-            "explanation": q.explanation,
-            "total": request.session.get("solve_total", 0),
-            "correct": request.session.get("solve_correct", 0),
+            "result": result,
+            "questions": questions,
+            "options": options,
+            "total": len(qids),
+            "late": late,
+            "spent": format_clock(min(spent, 99 * 60 + 59)),
         },
     )
 
 
-@app.get("/stats")
-async def stats_page(request: Request):
-    user = await _current_user(request)
+@router.post("/solve/answer")
+async def solve_answer(request: Request, option_ids: list[int] = Form(default=[]), user: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
     if not user:
         return RedirectResponse(url="/", status_code=303)
 
-    async with sm() as s:
-        repo = Repo(s)
-        db_user = await repo.get_or_create_user(tg_id=user["tg_id"], full_name=user["full_name"])
-        total, correct = await repo.user_totals(db_user.id)
-        by_topic = await repo.solved_by_topic(db_user.id, limit=8)
-        by_day_raw = await repo.accuracy_by_day(db_user.id, days=14)
-        recent = await repo.recent_attempts(db_user.id, limit=10)
+    chosen = sorted({int(x) for x in option_ids})
+    if request.session.get("current_qid") and not chosen:
+        raise HTTPException(status_code=400, detail="Choose at least one option")
+
+    result = await _grade_current(request, repo, user, chosen)
+    if result is None:
+        return RedirectResponse(url="/solve/question", status_code=303)
+
+    return templates.TemplateResponse(
+        request,
+        "solve_result.html",
+        {"request": request, "user": user, **result, **_score(request)},
+    )
+
+
+# ---- JSON API решения: те же шаги без перезагрузки страницы ----
+# ?fragment=1 — вместо JSON отдаётся HTML-фрагмент карточки (web/static/solve.js).
+
+def _image_url(q: QuestionRow) -> str | None:
+    return f"/img/{quote(q.image_file_id, safe='')}" if q.image_file_id else None
+
+
+async def _json_object(request: Request) -> dict[str, Any]:
+    # тело JSON-запроса: битый JSON или не объект — 400, а не 500
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Malformed JSON body")
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="JSON body must be an object")
+    return payload
+
+
+def _wants_fragment(request: Request) -> bool:
+    return request.query_params.get("fragment") == "1"
+
+
+@router.get("/api/solve/next")
+async def api_solve_next(request: Request, user: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
+    _require_auth(user)
+    if not _solve_ready(request):
+        raise HTTPException(status_code=409, detail="Solve session not started")
+
+    picked = await _current_question(request, repo, user)
+    score = _score(request)
+    if picked is None:
+        if _wants_fragment(request):
+            return templates.TemplateResponse(request, "_done_card.html", score)
+        return JSONResponse({"done": True, **score})
+
+    q, opts = picked
+    if _wants_fragment(request):
+        return templates.TemplateResponse(request, "_question_card.html", {"question": q, "options": opts, **score})
+    return JSONResponse(
+        {
+            "done": False,
+            "question": {"id": q.id, "text": q.text, "qtype": q.qtype, "image_url": _image_url(q)},
+            "options": [{"id": o.id, "text": o.text} for o in opts],
+            **score,
+        }
+    )
+
+
+@router.post("/api/solve/answer")
+async def api_solve_answer(request: Request, user: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
+    _require_auth(user)
+
+    # JSON {"option_ids": [...]} или обычная форма (FormData из solve.js)
+    if request.headers.get("content-type", "").startswith("application/json"):
+        raw_ids = (await _json_object(request)).get("option_ids") or []
+    else:
+        raw_ids = (await request.form()).getlist("option_ids")
+    try:
+        chosen = sorted({int(x) for x in raw_ids})
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="option_ids must be integers")
+    if not chosen:
+        raise HTTPException(status_code=400, detail="Choose at least one option")
+
+    result = await _grade_current(request, repo, user, chosen)
+    if result is None:
+        raise HTTPException(status_code=409, detail="No current question")
+
+    if _wants_fragment(request):
+        return templates.TemplateResponse(request, "_result_card.html", {**result, **_score(request)})
+    return JSONResponse({**result, **_score(request)})
+
+
+# ---- JSON API каталога: ETag по версии каталога, 304 без обращения к БД ----
+
+def _catalog_response(request: Request, entry: CatalogEntry | None) -> Response:
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    headers = {"ETag": entry.etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+@router.get("/api/catalog")
+async def api_catalog(request: Request):
+    snap = await request.app.state.catalog.get(request.app.state.sm)
+    return _catalog_response(request, snap.full)
+
+
+@router.get("/api/catalog/subjects/{subject_id}")
+async def api_catalog_subject(request: Request, subject_id: int):
+    snap = await request.app.state.catalog.get(request.app.state.sm)
+    return _catalog_response(request, snap.subjects.get(subject_id))
+
+
+@router.get("/api/catalog/topics/{topic_id}")
+async def api_catalog_topic(request: Request, topic_id: int):
+    snap = await request.app.state.catalog.get(request.app.state.sm)
+    return _catalog_response(request, snap.topics.get(topic_id))
+
+
+# ---- офлайн-пакеты: вопросы с солёными хэшами ключа и пакетная синхронизация ----
+
+@router.get("/api/packs")
+async def api_pack(
+    request: Request,
+    subject_id: int,
+    topic_id: int | None = None,
+    subtopic_id: list[int] = Query(default=[]),
+    size: int = 20,
+    user: dict[str, Any] | None = Depends(current_user),
+    repo: Repo = Depends(get_repo),
+):
+    _require_auth(user)
+    size = max(1, min(size, PACK_MAX_SIZE))
+    questions = await repo.sample_question_rows(subject_id, topic_id, subtopic_id or None, size)
+    pack = build_pack(questions, await repo.option_rows_many([q.id for q in questions]))
+    pack["scope"] = {"subject_id": subject_id, "topic_id": topic_id, "subtopic_ids": subtopic_id}
+    return JSONResponse(pack, headers={"Cache-Control": "private, no-store"})
+
+
+@router.get("/img/{file_id}")
+async def question_image(
+    request: Request,
+    file_id: str,
+    size: str = "full",
+    user: dict[str, Any] | None = Depends(current_user),
+    repo: Repo = Depends(get_repo),
+):
+    _require_auth(user)
+    images: ImageStore = request.app.state.images
+    if not images.knows(file_id) and not await repo.question_image_known(file_id):
+        raise HTTPException(status_code=404, detail="Image not found")
+    try:
+        img = await (images.thumbnail(file_id) if size == "thumb" else images.original(file_id))
+    except ImageUnavailable as e:
+        log.warning("question image %s unavailable: %s", file_id, e)
+        raise HTTPException(status_code=502, detail="Image unavailable")
+
+    headers = {"Cache-Control": IMAGE_CACHE_CONTROL, "ETag": img.etag}
+    if etag_matches(request.headers.get("if-none-match"), img.etag):
+        return Response(status_code=304, headers=headers)
+    # FileResponse отдаёт файл с диска кусками, без чтения целиком в память
+    # (sendfile, если сервер поддерживает расширение zerocopy)
+    return FileResponse(img.path, media_type=img.media_type, headers=headers)
+
+
+@router.post("/api/attempts/sync")
+async def api_attempts_sync(request: Request, user: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
+    usr = _require_auth(user)
+    payload = await _json_object(request)
+    try:
+        batch_id = str(payload["batch_id"])
+        if not isinstance(payload["attempts"], list):
+            raise TypeError("attempts must be a list")
+        items = payload["attempts"]
+    except (KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Expected {batch_id, attempts: [...]}")
+    if not BATCH_ID_RE.match(batch_id):
+        raise HTTPException(status_code=400, detail="batch_id must be 8-64 chars [A-Za-z0-9_-]")
+    if not items or len(items) > SYNC_MAX_ATTEMPTS:
+        raise HTTPException(status_code=400, detail=f"attempts must contain 1..{SYNC_MAX_ATTEMPTS} items")
+
+    qids: set[int] = set()
+    for item in items:
+        try:
+            qids.add(int(item["question_id"]))
+        except (KeyError, TypeError, ValueError):
+            pass
+    options = await repo.option_rows_many(sorted(qids))
+    accepted, rejected = grade_sync_batch(items, options, datetime.utcnow())
+
+    # отметка пакета и все попытки — одна транзакция
+    claimed = await repo.claim_attempt_sync(batch_id, usr["id"], len(accepted))
+    if claimed is not None:
+        owner, previous = claimed
+        if owner != usr["id"]:
+            # чужой пакет: "duplicate" молча потерял бы эти попытки — клиент берёт новый batch_id
+            raise HTTPException(status_code=409, detail="batch_id belongs to another user; retry with a new batch_id")
+        await repo.commit()
+        return JSONResponse({"batch_id": batch_id, "duplicate": True, "accepted": previous})
+    await repo.add_attempts(usr["id"], accepted)
+    await repo.commit()
+    return JSONResponse(
+        {
+            "batch_id": batch_id,
+            "duplicate": False,
+            "accepted": len(accepted),
+            "correct": sum(1 for a in accepted if a[1]),
+            "rejected": rejected,
+        }
+    )
+
+
+@router.get("/stats")
+async def stats_page(request: Request, user: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
+    if not user:
+        return RedirectResponse(url="/", status_code=303)
+
+    total, correct = await repo.user_totals(user["id"])
+    by_topic = await repo.solved_by_topic(user["id"], limit=8)
+    by_day_raw = await repo.accuracy_by_day(user["id"], days=14)
+    recent = await repo.recent_attempts(user["id"], limit=10)
 
     by_day_map = {d: (solved, corr) for d, solved, corr in by_day_raw}
     days: list[dict[str, Any]] = []
@@ -582,6 +934,8 @@ async def stats_page(request: Request):
             }
         )
 
+    from services.stats_graphs import bar_topics_svg
+
     topic_total = sum(cnt for _, cnt in by_topic) or 1
     topic_items = [
         {"name": name, "count": cnt, "pct": round((cnt / topic_total) * 100.0, 1)}
@@ -609,14 +963,14 @@ async def stats_page(request: Request):
             "streak": streak,
             "days": days,
             "topic_items": topic_items,
+            "topics_svg": Markup(bar_topics_svg(by_topic)) if by_topic else None,
             "recent": recent,
         },
     )
 
 
-@app.get("/admin/import")
-async def admin_import_page(request: Request):
-    current = await _current_user(request)
+@router.get("/admin/import")
+async def admin_import_page(request: Request, current: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
     if not current:
         return RedirectResponse(url="/", status_code=303)
     user = _require_admin(current)
@@ -631,16 +985,13 @@ async def admin_import_page(request: Request):
     )
 
 
-@app.get("/admin/broadcast")
-async def admin_broadcast_page(request: Request):
-    current = await _current_user(request)
+@router.get("/admin/broadcast")
+async def admin_broadcast_page(request: Request, current: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
     if not current:
         return RedirectResponse(url="/", status_code=303)
     user = _require_superadmin(current)
 
-    async with sm() as s:
-        repo = Repo(s)
-        total_users = len(await repo.list_user_tg_ids())
+    total_users = len(await repo.list_user_tg_ids())
 
     return templates.TemplateResponse(
         request,
@@ -656,20 +1007,19 @@ async def admin_broadcast_page(request: Request):
     )
 
 
-@app.post("/admin/broadcast")
+@router.post("/admin/broadcast")
 async def admin_broadcast_send(
     request: Request,
     text: str = Form(...),
     send_confirm: str | None = Form(default=None),
+    current: dict[str, Any] | None = Depends(current_user),
+    repo: Repo = Depends(get_repo),
 ):
-    current = await _current_user(request)
     if not current:
         return RedirectResponse(url="/", status_code=303)
     user = _require_superadmin(current)
 
-    async with sm() as s:
-        repo = Repo(s)
-        total_users = len(await repo.list_user_tg_ids())
+    total_users = len(await repo.list_user_tg_ids())
 
     msg = (text or "").strip()
     if len(msg) < 3:
@@ -712,46 +1062,16 @@ async def admin_broadcast_send(
             },
         )
 
-    async with sm() as s:
-        repo = Repo(s)
-        tg_ids = await repo.list_user_tg_ids()
-
-    sent = 0
-    failed = 0
-    skipped_self = 0
-    failed_ids: list[int] = []
-
-    for tg_id in tg_ids:
-        if tg_id == user["tg_id"]:
-            skipped_self += 1
-            continue
-        try:
-            await bot_client.send_message(chat_id=tg_id, text=msg)
-            sent += 1
-            await asyncio.sleep(0.03)
-        except TelegramRetryAfter as e:
-            await asyncio.sleep(float(e.retry_after) + 0.2)
-            try:
-                await bot_client.send_message(chat_id=tg_id, text=msg)
-                sent += 1
-            except Exception:
-                failed += 1
-                if len(failed_ids) < 20:
-                    failed_ids.append(tg_id)
-        except (TelegramForbiddenError, TelegramBadRequest, TelegramAPIError):
-            failed += 1
-            if len(failed_ids) < 20:
-                failed_ids.append(tg_id)
-        except Exception:
-            failed += 1
-            if len(failed_ids) < 20:
-                failed_ids.append(tg_id)
+    tg_ids = await repo.list_user_tg_ids()
+    recipients = [x for x in tg_ids if x != user["tg_id"]]
+    group_key = secrets.token_hex(8)
+    queued = await repo.enqueue_outbox_many(recipients, msg, kind="broadcast", group_key=group_key)
+    await repo.commit()
 
     report = {
-        "sent": sent,
-        "failed": failed,
-        "skipped_self": skipped_self,
-        "failed_ids": failed_ids,
+        "queued": queued,
+        "skipped_self": len(tg_ids) - len(recipients),
+        "group_key": group_key,
     }
 
     return templates.TemplateResponse(
@@ -768,9 +1088,25 @@ async def admin_broadcast_send(
     )
 
 
-@app.post("/admin/import")
-async def admin_import_upload(request: Request, file: UploadFile):
-    current = await _current_user(request)
+@router.get("/admin/broadcast/status/{group_key}")
+async def admin_broadcast_status(request: Request, group_key: str, current: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
+    _require_superadmin(current)
+
+    counts = await repo.outbox_group_status(group_key)
+    failed_ids = await repo.outbox_group_failed_ids(group_key)
+
+    return JSONResponse(
+        {
+            "sent": counts.get("sent", 0),
+            "failed": counts.get("failed", 0),
+            "pending": counts.get("pending", 0) + counts.get("sending", 0),
+            "failed_ids": failed_ids,
+        }
+    )
+
+
+@router.post("/admin/import")
+async def admin_import_upload(request: Request, file: UploadFile, current: dict[str, Any] | None = Depends(current_user), repo: Repo = Depends(get_repo)):
     if not current:
         return RedirectResponse(url="/", status_code=303)
     user = _require_admin(current)
@@ -780,91 +1116,93 @@ async def admin_import_upload(request: Request, file: UploadFile):
     created = 0
     errors: list[str] = []
 
-    async with sm() as s:
-        repo = Repo(s)
-
-        if name.endswith(".json"):
-            try:
-                payload = json.loads(raw.decode("utf-8-sig"))
-                if not isinstance(payload, list):
-                    raise ValueError("JSON root must be a list")
-            except Exception as e:
-                raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
-
-            rows = payload
-        elif name.endswith(".csv"):
-            text = raw.decode("utf-8-sig")
-            rows = list(csv.DictReader(text.splitlines()))
-        else:
-            raise HTTPException(status_code=400, detail="Only .csv or .json supported")
-
-        for i, row in enumerate(rows, start=1):
-            try:
-                subject_code = str(row.get("subject_code", "")).strip().lower()
-                subject_name = str(row.get("subject_name", "")).strip() or subject_code
-                topic_name = str(row.get("topic_name", "")).strip()
-                subtopic_name = str(row.get("subtopic_name", "")).strip()
-                qtype = str(row.get("qtype", "single")).strip().lower()
-                text_q = str(row.get("question_text", "")).strip()
-                explanation = str(row.get("explanation", "")).strip() or "-"
-
-                if qtype not in {"single", "multi"}:
-                    raise ValueError("qtype must be single or multi")
-                if not subject_code or not topic_name or not text_q:
-                    raise ValueError("subject_code/topic_name/question_text are required")
-
-                subj = await repo.get_subject_by_code(subject_code)
-                if subj is None:
-                    sid = await repo.create_subject(subject_code, subject_name)
-                else:
-                    sid = subj.id
-
-                tid = await _get_or_create_topic_by_name(repo, sid, topic_name)
-                stid = None
-                if subtopic_name:
-                    stid = await _get_or_create_subtopic_by_name(repo, tid, subtopic_name)
-
-                raw_options = row.get("options")
-                if isinstance(raw_options, list):
-                    options_raw = [(chr(65 + idx), str(v)) for idx, v in enumerate(raw_options)]
-                elif isinstance(raw_options, dict):
-                    options_raw = [(str(k).upper(), str(v)) for k, v in raw_options.items()]
-                else:
-                    options_raw = _parse_option_lines(str(raw_options or ""))
-
-                if len(options_raw) < 2:
-                    raise ValueError("need at least 2 options")
-
-                raw_correct = row.get("correct")
-                if isinstance(raw_correct, list):
-                    correct_labels = {str(x).strip().upper() for x in raw_correct}
-                else:
-                    correct_labels = _norm_labels(str(raw_correct or ""))
-
-                if not correct_labels:
-                    raise ValueError("correct is required")
-
-                options_for_db = _build_options_for_db(options_raw, correct_labels)
-
-                if qtype == "single" and sum(1 for _, c in options_for_db if c) != 1:
-                    raise ValueError("single question must have exactly one correct option")
-
-                if sum(1 for _, c in options_for_db if c) == 0:
-                    raise ValueError("no correct option resolved")
-
-                await repo.create_question(
-                    subject_id=sid,
-                    topic_id=tid,
-                    subtopic_id=stid,
-                    text=text_q,
-                    qtype=qtype,
-                    explanation=explanation,
-                    image_file_id=None,
-                    options=options_for_db,
-                )
-                created += 1
-            except Exception as e:
-                errors.append(f"line {i}: {e}")
+    if name.endswith(".json"):
+        try:
+            payload = json.loads(raw.decode("utf-8-sig"))
+            if not isinstance(payload, list):
+                raise ValueError("JSON root must be a list")
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+
+        rows = payload
+    elif name.endswith(".csv"):
+        text = raw.decode("utf-8-sig")
+        rows = list(csv.DictReader(text.splitlines()))
+    else:
+        raise HTTPException(status_code=400, detail="Only .csv or .json supported")
+
+    for i, row in enumerate(rows, start=1):
+        # каждая строка — в своей точке сохранения: ошибка откатывает только её
+        savepoint = await repo.s.begin_nested()
+        try:
+            subject_code = str(row.get("subject_code", "")).strip().lower()
+            subject_name = str(row.get("subject_name", "")).strip() or subject_code
+            topic_name = str(row.get("topic_name", "")).strip()
+            subtopic_name = str(row.get("subtopic_name", "")).strip()
+            qtype = str(row.get("qtype", "single")).strip().lower()
+            text_q = str(row.get("question_text", "")).strip()
+            explanation = str(row.get("explanation", "")).strip() or "-"
+
+            if qtype not in {"single", "multi"}:
+                raise ValueError("qtype must be single or multi")
+            if not subject_code or not topic_name or not text_q:
+                raise ValueError("subject_code/topic_name/question_text are required")
+
+            subj = await repo.get_subject_by_code(subject_code)
+            if subj is None:
+                sid = await repo.create_subject(subject_code, subject_name)
+            else:
+                sid = subj.id
+
+            tid = await _get_or_create_topic_by_name(repo, sid, topic_name)
+            stid = None
+            if subtopic_name:
+                stid = await _get_or_create_subtopic_by_name(repo, tid, subtopic_name)
+
+            raw_options = row.get("options")
+            if isinstance(raw_options, list):
+                options_raw = [(chr(65 + idx), str(v)) for idx, v in enumerate(raw_options)]
+            elif isinstance(raw_options, dict):
+                options_raw = [(str(k).upper(), str(v)) for k, v in raw_options.items()]
+            else:
+                options_raw = _parse_option_lines(str(raw_options or ""))
+
+            if len(options_raw) < 2:
+                raise ValueError("need at least 2 options")
+
+            raw_correct = row.get("correct")
+            if isinstance(raw_correct, list):
+                correct_labels = {str(x).strip().upper() for x in raw_correct}
+            else:
+                correct_labels = _norm_labels(str(raw_correct or ""))
+
+            if not correct_labels:
+                raise ValueError("correct is required")
+
+            options_for_db = _build_options_for_db(options_raw, correct_labels)
+
+            if qtype == "single" and sum(1 for _, c in options_for_db if c) != 1:
+                raise ValueError("single question must have exactly one correct option")
+
+            if sum(1 for _, c in options_for_db if c) == 0:
+                raise ValueError("no correct option resolved")
+
+            await repo.create_question(
+                subject_id=sid,
+                topic_id=tid,
+                subtopic_id=stid,
+                text=text_q,
+                qtype=qtype,
+                explanation=explanation,
+                image_file_id=None,
+                options=options_for_db,
+            )
+            await savepoint.commit()
+            created += 1
+        except Exception as e:
+            await savepoint.rollback()
+            errors.append(f"line {i}: {e}")
+    await repo.commit()
 
     report = {
         "created": created,
@@ -881,3 +1219,6 @@ async def admin_import_upload(request: Request, file: UploadFile):
             "report": report,
         },
     )
+
+
+app = create_app()
@@ -0,0 +1,289 @@
+"""Серверное хранилище веб-сессий.
+
+В cookie лежит только непрозрачный случайный id, состояние (вход, текущая
+сессия решения, счётчики) — в хранилище:
+
+- sql    — таблица web_sessions в общей БД (по умолчанию, несколько воркеров);
+- redis  — ключи с EX в локальном Redis (нужен пакет redis);
+- memory — словарь в процессе (один воркер, тесты).
+
+Запись в хранилище — только если сессию меняли; срок жизни скользящий:
+когда до истечения остаётся меньше половины TTL, срок продлевается и cookie
+отправляется заново. В остальных ответах Set-Cookie нет вовсе.
+"""
+from __future__ import annotations
+
+import json
+import secrets
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from db.models import WebSession
+
+BACKENDS = ("sql", "redis", "memory", "cookie")
+SESSION_TTL_SECONDS = 14 * 24 * 60 * 60
+
+_MISSING = object()
+
+
+class SessionDict(dict):
+    """dict сессии, который помнит, что его меняли (request.session)."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.dirty = False
+        self.regenerate = False
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if self.get(key, _MISSING) != value:
+            self.dirty = True
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key: str) -> None:
+        self.dirty = True
+        super().__delitem__(key)
+
+    def pop(self, key: str, *default: Any) -> Any:
+        if key in self:
+            self.dirty = True
+        return super().pop(key, *default)
+
+    def clear(self) -> None:
+        if self:
+            self.dirty = True
+        super().clear()
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+
+def rotate_session(session: dict) -> None:
+    # после входа — новый id сессии (защита от фиксации id)
+    if isinstance(session, SessionDict):
+        session.regenerate = True
+
+
+class MemorySessionStore:
+    def __init__(self, max_sessions: int = 100_000):
+        self.max_sessions = max_sessions
+        self._items: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    async def load(self, sid: str) -> tuple[dict, float] | None:
+        item = self._items.get(sid)
+        if item is None or item[1] <= time.time():
+            return None
+        return json.loads(item[0]), item[1]
+
+    async def save(self, sid: str, data: dict, expires_at: float) -> None:
+        self._items[sid] = (json.dumps(data), expires_at)
+        self._items.move_to_end(sid)
+        while len(self._items) > self.max_sessions:
+            self._items.popitem(last=False)
+
+    async def delete(self, sid: str) -> None:
+        self._items.pop(sid, None)
+
+    async def purge(self) -> int:
+        now = time.time()
+        expired = [sid for sid, (_data, exp) in self._items.items() if exp <= now]
+        for sid in expired:
+            del self._items[sid]
+        return len(expired)
+
+    async def close(self) -> None:
+        pass
+
+
+class SqlSessionStore:
+    def __init__(self, sessionmaker: async_sessionmaker):
+        self.sessionmaker = sessionmaker
+
+    async def load(self, sid: str) -> tuple[dict, float] | None:
+        async with self.sessionmaker() as s:
+            res = await s.execute(
+                select(WebSession.data, WebSession.expires_at).where(
+                    WebSession.id == sid, WebSession.expires_at > datetime.utcnow()
+                )
+            )
+            row = res.first()
+        if row is None:
+            return None
+        return json.loads(row[0]), _to_ts(row[1])
+
+    async def save(self, sid: str, data: dict, expires_at: float) -> None:
+        async with self.sessionmaker() as s:
+            if s.get_bind().dialect.name == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+            stmt = dialect_insert(WebSession).values(
+                id=sid, data=json.dumps(data), expires_at=datetime.utcfromtimestamp(expires_at)
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[WebSession.id],
+                set_={"data": stmt.excluded.data, "expires_at": stmt.excluded.expires_at},
+            )
+            await s.execute(stmt)
+            await s.commit()
+
+    async def delete(self, sid: str) -> None:
+        async with self.sessionmaker() as s:
+            await s.execute(delete(WebSession).where(WebSession.id == sid))
+            await s.commit()
+
+    async def purge(self) -> int:
+        async with self.sessionmaker() as s:
+            res = await s.execute(delete(WebSession).where(WebSession.expires_at <= datetime.utcnow()))
+            await s.commit()
+        return res.rowcount or 0
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisSessionStore:
+    def __init__(self, url: str, prefix: str = "websession:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:  # pragma: no cover - зависит от окружения
+            raise RuntimeError("WEB_SESSION_BACKEND=redis requires the 'redis' package") from e
+        self.prefix = prefix
+        self._redis = redis.from_url(url)
+
+    async def load(self, sid: str) -> tuple[dict, float] | None:
+        pipe = self._redis.pipeline()
+        pipe.get(self.prefix + sid)
+        pipe.ttl(self.prefix + sid)
+        raw, ttl = await pipe.execute()
+        if raw is None or ttl is None or ttl < 0:
+            return None
+        return json.loads(raw), time.time() + ttl
+
+    async def save(self, sid: str, data: dict, expires_at: float) -> None:
+        ttl = max(1, int(expires_at - time.time()))
+        await self._redis.set(self.prefix + sid, json.dumps(data), ex=ttl)
+
+    async def delete(self, sid: str) -> None:
+        await self._redis.delete(self.prefix + sid)
+
+    async def purge(self) -> int:
+        return 0  # ключи истекают сами (EX)
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+SessionStore = MemorySessionStore | SqlSessionStore | RedisSessionStore
+
+
+def make_session_store(
+    backend: str,
+    sessionmaker: async_sessionmaker | None = None,
+    redis_url: str | None = None,
+) -> SessionStore | None:
+    if backend == "cookie":
+        return None  # старый режим: подписанная cookie (SessionMiddleware)
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "sql":
+        if sessionmaker is None:
+            raise ValueError("sql session backend needs a sessionmaker")
+        return SqlSessionStore(sessionmaker)
+    if backend == "redis":
+        return RedisSessionStore(redis_url or "redis://localhost:6379/0")
+    raise ValueError(f"Unknown session backend: {backend!r}")
+
+
+def _to_ts(dt: datetime) -> float:
+    return (dt - datetime(1970, 1, 1)).total_seconds()
+
+
+class ServerSessionMiddleware:
+    """Подставляет request.session из хранилища app.state.session_store.
+
+    Хранилище создаётся в lifespan, поэтому берётся из scope["app"] на каждом
+    запросе, а не передаётся при добавлении middleware.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        cookie_name: str = "sid",
+        ttl: int = SESSION_TTL_SECONDS,
+        https_only: bool = False,
+    ):
+        self.app = app
+        self.cookie_name = cookie_name
+        self.ttl = ttl
+        self.security_flags = "httponly; samesite=lax" + ("; secure" if https_only else "")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        store: SessionStore = scope["app"].state.session_store
+        sid = HTTPConnection(scope).cookies.get(self.cookie_name)
+        loaded = await store.load(sid) if sid else None
+        session = SessionDict(loaded[0] if loaded else {})
+        expires_at = loaded[1] if loaded else None
+        scope["session"] = session
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                cookie = await self._persist(store, sid if loaded else None, bool(sid), session, expires_at)
+                if cookie is not None:
+                    MutableHeaders(scope=message).append("Set-Cookie", cookie)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _persist(
+        self,
+        store: SessionStore,
+        sid: str | None,
+        had_cookie: bool,
+        session: SessionDict,
+        expires_at: float | None,
+    ) -> str | None:
+        if sid is not None and session.regenerate:
+            await store.delete(sid)
+            sid = None
+
+        if not session:
+            if sid is not None and session.dirty:
+                await store.delete(sid)
+            # сессию очистили (logout) или cookie указывает на неизвестный id
+            if had_cookie and (sid is None or session.dirty):
+                return f"{self.cookie_name}=null; path=/; expires=Thu, 01 Jan 1970 00:00:00 GMT; {self.security_flags}"
+            return None
+
+        now = time.time()
+        if sid is None:
+            sid = secrets.token_urlsafe(32)
+            await store.save(sid, session, now + self.ttl)
+            return self._cookie(sid)
+        if expires_at is None or expires_at - now < self.ttl / 2:
+            await store.save(sid, session, now + self.ttl)
+            return self._cookie(sid)
+        if session.dirty:
+            await store.save(sid, session, expires_at)
+        return None
+
+    def _cookie(self, sid: str) -> str:
+        return f"{self.cookie_name}={sid}; path=/; Max-Age={self.ttl}; {self.security_flags}"
@@ -0,0 +1,35 @@
+// Решение без перезагрузки страницы: ответ и следующий вопрос приходят
+// HTML-фрагментом из /api/solve/*, меняется только карточка #solve-card.
+// Без JS работают обычные формы и ссылки (/solve/answer, /solve/question).
+(function () {
+  var card = document.getElementById("solve-card");
+  if (!card || !window.fetch) return;
+
+  function swap(resp) {
+    if (!resp.ok) throw new Error("HTTP " + resp.status);
+    return resp.text().then(function (html) {
+      card.innerHTML = html;
+      window.scrollTo(0, 0);
+    });
+  }
+
+  card.addEventListener("submit", function (e) {
+    var form = e.target;
+    if (!form.hasAttribute("data-solve-answer")) return;
+    e.preventDefault();
+    fetch("/api/solve/answer?fragment=1", {
+      method: "POST",
+      body: new FormData(form),
+      credentials: "same-origin",
+    }).then(swap).catch(function () { form.submit(); });
+  });
+
+  card.addEventListener("click", function (e) {
+    var link = e.target.closest("a[data-solve-next]");
+    if (!link) return;
+    e.preventDefault();
+    fetch("/api/solve/next?fragment=1", { credentials: "same-origin" })
+      .then(swap)
+      .catch(function () { window.location.href = link.href; });
+  });
+})();